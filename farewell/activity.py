@@ -0,0 +1,212 @@
+"""
+The "what's new" activity feed.
+
+New slam messages, album photos, awards, milestones, secret intel and
+staff are announced by signals (farewell/signals.py), which append an
+Activity row describing them. Reading the feed is then one indexed query
+on a single table instead of a UNION over all of them.
+
+The feed is paged with id cursors, never offsets:
+
+* ``?before=<id>`` gives the next older page,
+* ``?since=<id>`` gives only what was added after ``id``, which is how
+  the open page polls for news.
+
+Rendered fragments are cached under a generation number that every new
+or removed entry bumps, so a hit costs two cache reads and no query.
+Secret intel only ever shows up as "new intel about ...", never its text.
+
+Settings::
+
+    FAREWELL_ACTIVITY_PAGE_SIZE = 30
+    FAREWELL_ACTIVITY_CACHE_TIMEOUT = 600    # seconds; 0 disables caching
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import router, transaction
+from django.db.models import prefetch_related_objects
+from django.urls import reverse
+
+GENERATION_KEY = 'farewell:activity:generation'
+DETAIL_CHARS = 140
+
+# kind: (model_name, one entry, several entries of the same group)
+KINDS = {
+    'slam_message': ('slammessage', 'New slam message for {target}', '{count} new slam messages for {target}'),
+    'event_photo': ('eventphoto', 'New photo in {target}', '{count} new photos in {target}'),
+    'fun_award': ('funaward', '{target} won an award', '{target} won {count} awards'),
+    'timeline_event': ('timelineevent', 'New milestone on the timeline', '{count} new milestones on the timeline'),
+    'secret_intel': ('secretintel', 'New secret intel about {target}', '{count} new pieces of secret intel about {target}'),
+    'staff': ('staff', '{target} joined the staff wall', '{count} staff joined the staff wall'),
+}
+KIND_BY_MODEL = {model_name: kind for kind, (model_name, _one, _many) in KINDS.items()}
+
+# Related objects describe() reads, fetched in one query for bulk inserts
+_RELATED = {'slammessage': 'friend', 'eventphoto': 'event', 'funaward': 'winner', 'secretintel': 'friend'}
+
+
+def page_size():
+    return getattr(settings, 'FAREWELL_ACTIVITY_PAGE_SIZE', 30)
+
+
+def cache_timeout():
+    return getattr(settings, 'FAREWELL_ACTIVITY_CACHE_TIMEOUT', 600)
+
+
+def _excerpt(text):
+    text = ' '.join((text or '').split())
+    return text if len(text) <= DETAIL_CHARS else text[:DETAIL_CHARS - 1].rstrip() + '…'
+
+
+def describe(instance):
+    """Field values of the Activity row announcing ``instance``."""
+    name = instance._meta.model_name
+    if name == 'slammessage':
+        return {
+            'group': f'friend:{instance.friend_id}',
+            'target': instance.friend.name,
+            'detail': f'{instance.sender_name}: {_excerpt(instance.message)}',
+            'link': reverse('farewell:friend_detail', args=[instance.friend_id]),
+        }
+    if name == 'eventphoto':
+        return {
+            'group': f'event:{instance.event_id}',
+            'target': instance.event.title,
+            'detail': _excerpt(instance.caption),
+            'link': reverse('farewell:event_detail', args=[instance.event_id]),
+        }
+    if name == 'funaward':
+        return {
+            'group': f'friend:{instance.winner_id}',
+            'target': instance.winner.name,
+            'detail': instance.title,
+            'link': reverse('farewell:awards'),
+        }
+    if name == 'timelineevent':
+        return {
+            'group': 'timeline',
+            'target': instance.title,
+            'detail': instance.title,
+            'link': reverse('farewell:timeline'),
+        }
+    if name == 'secretintel':
+        return {
+            'group': f'friend:{instance.friend_id}',
+            'target': instance.friend.name,
+            'detail': '',
+            'link': reverse('farewell:friend_detail', args=[instance.friend_id]),
+        }
+    if name == 'staff':
+        return {
+            'group': 'staff',
+            'target': instance.name,
+            'detail': instance.award_title,
+            'link': reverse('farewell:staff_list'),
+        }
+    raise ValueError(f'{instance._meta.label} is not part of the activity feed')
+
+
+def record(instances):
+    """Append feed entries for newly created rows (all of one model)."""
+    from .models import Activity
+
+    instances = [instance for instance in instances if instance.pk is not None]
+    if not instances:
+        return
+    name = instances[0]._meta.model_name
+    if name in _RELATED and len(instances) > 1:
+        prefetch_related_objects(instances, _RELATED[name])
+    kind = KIND_BY_MODEL[name]
+    Activity.objects.bulk_create([
+        Activity(kind=kind, object_id=instance.pk, **describe(instance)) for instance in instances
+    ])
+    feed_changed()
+
+
+def retract(instance):
+    """Drop the feed entries of a deleted row."""
+    from .models import Activity
+
+    kind = KIND_BY_MODEL[instance._meta.model_name]
+    if Activity.objects.filter(kind=kind, object_id=instance.pk).delete()[0]:
+        feed_changed()
+
+
+def feed_changed():
+    from .models import ChangeStamp
+
+    # The baked /activity/ page, and the cached fragments
+    ChangeStamp.bump('activity')
+    transaction.on_commit(bump_generation, using=router.db_for_write(ChangeStamp))
+
+
+def generation():
+    # A lost counter must not fall back to a number old fragments were cached under
+    cache.add(GENERATION_KEY, int(time.time() * 1000), None)
+    return cache.get(GENERATION_KEY) or 0
+
+
+def bump_generation():
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        generation()
+
+
+class FeedGroup:
+    """Consecutive entries of the same kind and group, shown as one line."""
+
+    def __init__(self, entry):
+        self.entries = [entry]
+
+    @property
+    def first(self):
+        return self.entries[0]
+
+    @property
+    def count(self):
+        return len(self.entries)
+
+    @property
+    def summary(self):
+        _model, one, many = KINDS[self.first.kind]
+        return (one if self.count == 1 else many).format(target=self.first.target, count=self.count)
+
+    @property
+    def details(self):
+        return [entry.detail for entry in self.entries if entry.detail][:3]
+
+
+def group_entries(entries):
+    groups = []
+    for entry in entries:
+        last = groups[-1].first if groups else None
+        if last and last.kind == entry.kind and last.group == entry.group:
+            groups[-1].entries.append(entry)
+        else:
+            groups.append(FeedGroup(entry))
+    return groups
+
+
+def fetch(before=None, since=None, limit=None):
+    """
+    Newest-first entries: older than ``before``, or newer than ``since``.
+    Returns ``(entries, has_more)``.
+
+    ``since`` takes the oldest entries after it, so a poller that falls
+    behind catches up page by page (``has_more``) instead of skipping
+    what arrived in between.
+    """
+    from .models import Activity
+
+    limit = limit or page_size()
+    if since is not None:
+        entries = list(Activity.objects.filter(id__gt=since).order_by('id')[:limit + 1])
+        return entries[:limit][::-1], len(entries) > limit
+    qs = Activity.objects.order_by('-id')
+    if before is not None:
+        qs = qs.filter(id__lt=before)
+    entries = list(qs[:limit + 1])
+    return entries[:limit], len(entries) > limit
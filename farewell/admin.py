@@ -1,5 +1,13 @@
 from django.contrib import admin
-from .models import Friend, Event, EventPhoto, TimelineEvent, FunAward, SlamMessage, Staff
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html
+
+from . import activity
+from .models import (
+    Friend, Event, EventPhoto, TimelineEvent, FunAward, SlamMessage, Staff, RequestProfile, UploadSession, Activity,
+)
 
 
 @admin.register(Friend)
@@ -51,8 +59,9 @@ class EventAdmin(admin.ModelAdmin):
 
 @admin.register(EventPhoto)
 class EventPhotoAdmin(admin.ModelAdmin):
-    list_display = ('event', 'caption', 'uploaded_at')
-    list_filter = ('event',)
+    list_display = ('event', 'caption', 'uploaded_at', 'duplicate_of')
+    list_filter = ('event', ('duplicate_of', admin.EmptyFieldListFilter))
+    raw_id_fields = ('duplicate_of',)
     search_fields = ('caption',)
 
 
@@ -101,3 +110,80 @@ class StaffAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
     )
+
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    """
+    Recent on-demand profiles. Add ?_profile=1 to any page while logged in
+    as staff to capture one.
+    """
+    list_display = ('created_at', 'method', 'path', 'view_name', 'status_code',
+                    'duration_ms', 'sql_count', 'sql_time_ms', 'download_link')
+    list_filter = ('view_name', 'method')
+    search_fields = ('path', 'view_name', 'username')
+    exclude = ('data',)
+    readonly_fields = ('method', 'path', 'view_name', 'username', 'status_code',
+                       'duration_ms', 'sql_count', 'sql_time_ms', 'created_at', 'download_link')
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer('data')
+
+    def has_add_permission(self, request):
+        return False
+
+    def get_urls(self):
+        return [
+            path('<int:pk>/download/', self.admin_site.admin_view(self.download_view),
+                 name='farewell_requestprofile_download'),
+        ] + super().get_urls()
+
+    def download_view(self, request, pk):
+        profile = get_object_or_404(RequestProfile, pk=pk)
+        response = HttpResponse(profile.data, content_type='application/json')
+        response['Content-Disposition'] = f'attachment; filename="profile-{pk}.speedscope.json"'
+        return response
+
+    def download_link(self, obj):
+        url = reverse('admin:farewell_requestprofile_download', args=[obj.pk])
+        return format_html('<a href="{}">speedscope ⬇</a>', url)
+    download_link.short_description = 'Flamegraph'
+
+
+@admin.register(UploadSession)
+class UploadSessionAdmin(admin.ModelAdmin):
+    """
+    Resumable album uploads. Abandoned ones are removed by
+    ``manage.py cleanup_uploads``.
+    """
+    list_display = ('filename', 'event', 'size', 'outcome', 'created_at', 'updated_at')
+    list_filter = ('outcome', 'event')
+    search_fields = ('filename',)
+    readonly_fields = ('event', 'filename', 'size', 'chunk_size', 'caption', 'outcome',
+                       'photo', 'created_at', 'updated_at')
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(Activity)
+class ActivityAdmin(admin.ModelAdmin):
+    """
+    The "what's new" feed. Entries are written by signals; deleting one
+    here only hides it from the feed.
+    """
+    list_display = ('__str__', 'detail', 'created_at')
+    list_filter = ('kind',)
+    search_fields = ('target', 'detail')
+    readonly_fields = ('kind', 'object_id', 'group', 'target', 'detail', 'link', 'created_at')
+
+    def has_add_permission(self, request):
+        return False
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        activity.feed_changed()
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        activity.feed_changed()
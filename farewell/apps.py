@@ -5,3 +5,6 @@ class FarewellConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'farewell'
     verbose_name = 'Farewell Website'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,263 @@
+"""
+Online backups: the SQLite database plus incremental media snapshots.
+
+``manage.py backup`` copies db.sqlite3 with SQLite's online backup API a
+few hundred pages at a time, sleeping between steps, so the site keeps
+reading and writing while it runs. Next to the copy it writes a media
+manifest: one ``{size, mtime_ns, sha256}`` entry per file under
+MEDIA_ROOT. File contents live in a shared, content-addressed object
+store, so a run only reads files whose size or mtime changed since the
+previous snapshot and only copies content the store doesn't have yet::
+
+    backups/
+        objects/3f/3fa9...e1            one copy of each distinct file
+        snapshots/20261019-031500/
+            db.sqlite3
+            media.json                  path -> size, mtime_ns, sha256
+
+``verify()`` checks a snapshot the way a restore would need it: the
+database passes ``PRAGMA integrity_check`` and every file path stored in
+it (ImageFields and FileFields) has its content in the store.
+``restore()`` puts a snapshot back.
+
+``FAREWELL_BACKUP_DIR`` sets where backups go (default BASE_DIR/backups).
+Other batches (see farewell.batches) are backed up with
+``FAREWELL_BATCH=<slug>``: their own database and media directory, into
+``<backup dir>/<slug>/``.
+"""
+import datetime
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections, models
+
+from . import batches
+
+DEFAULT_PAGES = 256
+DEFAULT_SLEEP = 0.05
+DB_NAME = 'db.sqlite3'
+MANIFEST_NAME = 'media.json'
+READ_SIZE = 1024 * 1024
+
+
+class BackupError(Exception):
+    pass
+
+
+def backup_root():
+    root = getattr(settings, 'FAREWELL_BACKUP_DIR', os.path.join(settings.BASE_DIR, 'backups'))
+    return batches.current().directory(root)
+
+
+def database_path(using=None):
+    connection = connections[using or batches.current().database]
+    if connection.vendor != 'sqlite':
+        raise BackupError(f'Only SQLite databases can be backed up this way, not {connection.vendor}.')
+    return str(connection.settings_dict['NAME'])
+
+
+def snapshots(root=None):
+    """Completed snapshot directories, oldest first."""
+    directory = os.path.join(root or backup_root(), 'snapshots')
+    if not os.path.isdir(directory):
+        return []
+    return sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if not name.startswith('.') and os.path.exists(os.path.join(directory, name, MANIFEST_NAME))
+    )
+
+
+def load_manifest(snapshot):
+    with open(os.path.join(snapshot, MANIFEST_NAME)) as fh:
+        return json.load(fh)
+
+
+def object_path(root, sha256):
+    return os.path.join(root, 'objects', sha256[:2], sha256)
+
+
+# ----- database -----
+
+def backup_database(source_path, target_path, pages=DEFAULT_PAGES, sleep=DEFAULT_SLEEP, progress=None):
+    """
+    Copy a live SQLite database ``pages`` pages per step. Writers only
+    wait for the step in progress, never for the whole copy.
+    """
+    source = sqlite3.connect(source_path)
+    target = sqlite3.connect(target_path)
+    try:
+        with target:
+            source.backup(
+                target, pages=pages, sleep=sleep,
+                progress=(lambda status, remaining, total: progress(total - remaining, total)) if progress else None,
+            )
+    finally:
+        target.close()
+        source.close()
+
+
+# ----- media -----
+
+def _copy_into_store(root, path):
+    """
+    Copy ``path`` into the object store while hashing it. Returns
+    ``(sha256, copied)``; ``copied`` is False if the content was already there.
+    """
+    tmp_dir = os.path.join(root, 'objects', 'tmp')
+    os.makedirs(tmp_dir, exist_ok=True)
+    digest = hashlib.sha256()
+    with open(path, 'rb') as src, tempfile.NamedTemporaryFile(dir=tmp_dir, delete=False) as dst:
+        for chunk in iter(lambda: src.read(READ_SIZE), b''):
+            digest.update(chunk)
+            dst.write(chunk)
+    sha256 = digest.hexdigest()
+    final = object_path(root, sha256)
+    if os.path.exists(final):
+        os.unlink(dst.name)
+        return sha256, False
+    os.makedirs(os.path.dirname(final), exist_ok=True)
+    os.replace(dst.name, final)
+    return sha256, True
+
+
+def snapshot_media(root, media_root, previous=None, log=None, skip=()):
+    """
+    Manifest of ``media_root``, less its top-level directories in ``skip``.
+    Files whose size and mtime match ``previous`` (an older manifest)
+    reuse its hash without being read. Returns ``(manifest, counts)``.
+    """
+    previous = previous or {}
+    manifest = {}
+    counts = {'files': 0, 'unchanged': 0, 'hashed': 0, 'copied_bytes': 0}
+    if not os.path.isdir(media_root):
+        return manifest, counts
+    for directory, dirs, files in os.walk(media_root):
+        if directory == media_root:
+            dirs[:] = [name for name in dirs if name not in skip]
+        for filename in files:
+            path = os.path.join(directory, filename)
+            relative = os.path.relpath(path, media_root).replace(os.sep, '/')
+            stat = os.stat(path)
+            counts['files'] += 1
+            old = previous.get(relative)
+            if (old and old['size'] == stat.st_size and old['mtime_ns'] == stat.st_mtime_ns
+                    and os.path.exists(object_path(root, old['sha256']))):
+                manifest[relative] = old
+                counts['unchanged'] += 1
+                continue
+            sha256, copied = _copy_into_store(root, path)
+            counts['hashed'] += 1
+            if copied:
+                counts['copied_bytes'] += stat.st_size
+            manifest[relative] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': sha256}
+            if log:
+                log(f'  {relative}')
+    return manifest, counts
+
+
+# ----- snapshots -----
+
+def create_snapshot(root=None, using=None, pages=DEFAULT_PAGES, sleep=DEFAULT_SLEEP, log=None):
+    """Back up the database and media into a new snapshot; returns ``(path, counts)``."""
+    root = root or backup_root()
+    name = datetime.datetime.now(datetime.timezone.utc).strftime('%Y%m%d-%H%M%S')
+    final = os.path.join(root, 'snapshots', name)
+    if os.path.exists(final):
+        raise BackupError(f'{final} already exists')
+    staging = os.path.join(root, 'snapshots', f'.{name}.partial')
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    try:
+        backup_database(
+            database_path(using), os.path.join(staging, DB_NAME), pages=pages, sleep=sleep,
+            progress=(lambda done, total: log(f'  database: {done}/{total} pages')) if log else None,
+        )
+        existing = snapshots(root)
+        previous = load_manifest(existing[-1]) if existing else {}
+        # The main batch's media directory holds the other batches' ones
+        skip = {batch.media_prefix for batch in batches.registry().values()} - {batches.current().media_prefix}
+        manifest, counts = snapshot_media(root, batches.media_root(), previous, log=log, skip=skip)
+        with open(os.path.join(staging, MANIFEST_NAME), 'w') as fh:
+            json.dump(manifest, fh, indent=0, sort_keys=True)
+        os.replace(staging, final)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return final, counts
+
+
+def verify(snapshot, root=None):
+    """
+    Problems found in a snapshot, as strings; an empty list means it can be
+    restored: the database is intact and every stored file path resolves.
+    """
+    root = root or os.path.dirname(os.path.dirname(snapshot))
+    manifest = load_manifest(snapshot)
+    problems = []
+    db = sqlite3.connect(f'file:{os.path.join(snapshot, DB_NAME)}?mode=ro', uri=True)
+    try:
+        result = db.execute('PRAGMA integrity_check').fetchone()[0]
+        if result != 'ok':
+            problems.append(f'database: {result}')
+        tables = {row[0] for row in db.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        for model in apps.get_models():
+            if model._meta.db_table not in tables:
+                continue
+            for field in model._meta.concrete_fields:
+                if not isinstance(field, models.FileField):
+                    continue
+                rows = db.execute(
+                    f'SELECT "{model._meta.pk.column}", "{field.column}" FROM "{model._meta.db_table}" '
+                    f'WHERE "{field.column}" IS NOT NULL AND "{field.column}" != \'\''
+                )
+                for pk, name in rows:
+                    entry = manifest.get(name)
+                    if entry is None:
+                        problems.append(f'{model._meta.label}.{field.name} #{pk}: {name} is not in the backup')
+                    elif not os.path.exists(object_path(root, entry['sha256'])):
+                        problems.append(f'{model._meta.label}.{field.name} #{pk}: content of {name} is missing')
+    finally:
+        db.close()
+    return problems
+
+
+def prune(keep, root=None):
+    """Delete all but the newest ``keep`` snapshots and objects nothing uses any more."""
+    root = root or backup_root()
+    existing = snapshots(root)
+    removed = existing[:-keep] if keep else existing
+    for snapshot in removed:
+        shutil.rmtree(snapshot)
+    referenced = set()
+    for snapshot in existing[len(removed):]:
+        referenced.update(entry['sha256'] for entry in load_manifest(snapshot).values())
+    freed = 0
+    objects = os.path.join(root, 'objects')
+    for directory, _dirs, files in os.walk(objects):
+        for filename in files:
+            if filename not in referenced:
+                path = os.path.join(directory, filename)
+                freed += os.path.getsize(path)
+                os.unlink(path)
+    return len(removed), freed
+
+
+def restore(snapshot, database_target, media_target, root=None):
+    """Write a snapshot's database to ``database_target`` and its files under ``media_target``."""
+    root = root or os.path.dirname(os.path.dirname(snapshot))
+    backup_database(os.path.join(snapshot, DB_NAME), str(database_target))
+    restored = 0
+    for relative, entry in load_manifest(snapshot).items():
+        target = os.path.join(str(media_target), *relative.split('/'))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(object_path(root, entry['sha256']), target)
+        os.utime(target, ns=(entry['mtime_ns'], entry['mtime_ns']))
+        restored += 1
+    return restored
@@ -0,0 +1,404 @@
+"""
+Static "bake" of the public site.
+
+The public pages (see ``PUBLIC_URL_NAMES`` in farewell/urls.py) are read
+far more often than they change. ``manage.py bake`` renders each of them,
+every page of their pagination included, into a plain HTML tree::
+
+    baked/index.html
+    baked/gallery/index.html
+    baked/gallery/page/2/index.html
+    baked/friend/7/index.html
+    baked/static/...   baked/media/...
+
+``?page=N`` links become ``page/N/`` paths, STATIC_URL and MEDIA_URL can
+be pointed elsewhere (a CDN), and CSRF tokens are left empty; base.html
+fetches a real one from ``/csrf/`` before a baked form is submitted.
+
+Bakes are incremental. Every page lists the ChangeStamp keys it depends
+on (``friend``, ``event:12``...); signals bump those on every save and
+delete. A page is only re-rendered when one of its stamps, or the
+templates and asset version, changed since the last bake. Changes made
+with ``QuerySet.update()`` (e.g. ``shard_media``) send no signals, so
+follow them with ``bake --force``.
+
+Serving it, with Django left to handle the write forms, e.g. in nginx::
+
+    location / {
+        if ($request_method !~ ^(GET|HEAD)$) { return 418; }
+        error_page 418 = @django;
+        try_files /baked$uri /baked$uri/index.html @django;
+    }
+
+Other batches (see farewell.batches) are baked with ``FAREWELL_BATCH=<slug>``
+into ``baked/<slug>/``, their URL prefix left out of the paths, for the
+batch's host by default.
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import shutil
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.template import engines
+from django.urls import reverse
+
+from . import batches
+from .hints import asset_version
+
+STATE_FILE = '.bake-state.json'
+
+# model_name -> (attribute holding the owner's pk, owner model_name), for
+# rows that are shown on their owner's own page
+STAMP_OWNERS = {
+    'friend': ('pk', 'friend'),
+    'slammessage': ('friend_id', 'friend'),
+    'event': ('pk', 'event'),
+    'eventphoto': ('event_id', 'event'),
+}
+
+_PAGE_LINK = re.compile(r'href="\?page=(\d+)"')
+_CSRF_VALUE = re.compile(r'(name="csrfmiddlewaretoken" value=")[^"]*(")')
+
+
+def default_output_dir():
+    root = getattr(settings, 'FAREWELL_BAKE_DIR', os.path.join(settings.BASE_DIR, 'baked'))
+    return batches.current().directory(root)
+
+
+def strip_csrf_tokens(html):
+    """Blank the CSRF tokens of a page that is going to be served to everyone."""
+    return _CSRF_VALUE.sub(r'\1\2', html)
+
+
+def stamp_keys(instance):
+    """ChangeStamp keys a saved or deleted row invalidates."""
+    name = instance._meta.model_name
+    keys = [name]
+    owner = STAMP_OWNERS.get(name)
+    if owner:
+        owner_pk = getattr(instance, owner[0], None)
+        if owner_pk is not None:
+            keys.append(f'{owner[1]}:{owner_pk}')
+    return keys
+
+
+def public_pages():
+    """
+    Yield ``(url_name, kwargs, stamp keys)`` for every public page.
+    """
+    from .models import Event, Friend
+    from .urls import PUBLIC_URL_NAMES
+
+    dependencies = {
+        'index': ['friend'],
+        'squad_cards': ['friend'],
+        'spin_bottle': ['friend'],
+        'gallery': ['event', 'eventphoto'],
+        'timeline': ['timelineevent'],
+        'awards': ['funaward', 'friend'],
+        'staff_list': ['staff'],
+        'newspaper': [],
+        'activity': ['activity'],
+        'stats': ['slammessage', 'funaward', 'eventphoto', 'friend', 'event'],
+        'offline': [],
+        'service_worker': [],
+        'web_manifest': [],
+    }
+    for name in PUBLIC_URL_NAMES:
+        if name == 'friend_detail':
+            for pk in Friend.objects.values_list('pk', flat=True):
+                yield f'farewell:{name}', {'pk': pk}, [f'friend:{pk}']
+        elif name == 'event_detail':
+            for pk in Event.objects.values_list('pk', flat=True):
+                yield f'farewell:{name}', {'pk': pk}, [f'event:{pk}']
+        else:
+            yield f'farewell:{name}', {}, dependencies.get(name, [])
+
+
+def build_fingerprint(*extra):
+    """Changes whenever a template, the asset version or an option in ``extra`` does."""
+    from .pwa import cache_version
+
+    digest = hashlib.sha1(json.dumps([asset_version(), cache_version(), extra]).encode())
+    for engine in engines.all():
+        for directory in sorted(getattr(engine, 'template_dirs', ())):
+            for root, _dirs, files in os.walk(directory):
+                for filename in sorted(files):
+                    stat = os.stat(os.path.join(root, filename))
+                    digest.update(f'{root}/{filename}:{stat.st_mtime_ns}:{stat.st_size}'.encode())
+    return digest.hexdigest()
+
+
+def output_path(out_dir, url_path):
+    """File a URL path is written to: directories get an index.html."""
+    relative = url_path.lstrip('/')
+    if not relative or relative.endswith('/'):
+        relative += 'index.html'
+    return os.path.join(out_dir, *relative.split('/'))
+
+
+def rewrite(html, url_path, static_url=None, media_url=None):
+    html = _PAGE_LINK.sub(
+        lambda m: f'href="{url_path}"' if m.group(1) == '1' else f'href="{url_path}page/{m.group(1)}/"',
+        html,
+    )
+    html = strip_csrf_tokens(html)
+    for old, new in ((settings.STATIC_URL, static_url), (settings.MEDIA_URL, media_url)):
+        if new and new != old:
+            html = re.sub(r'(?<=["\'(])' + re.escape(old), new, html)
+    return html
+
+
+# ----- worker processes -----
+
+_worker = {}
+
+
+def _init_worker(options):
+    import django
+    django.setup()
+    from django.db import connections
+    from django.test import Client
+
+    connections.close_all()
+    _worker['options'] = options
+    _worker['client'] = Client(HTTP_HOST=options['host'])
+
+
+def _write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as fh:
+        fh.write(content)
+    os.replace(temp_path, path)
+
+
+def _fetch(client, url):
+    response = client.get(url)
+    if response.streaming:
+        return response.status_code, b''.join(response.streaming_content), response
+    return response.status_code, response.content, response
+
+
+def render_page(url_path):
+    """
+    Render one page and all its pagination pages. Returns
+    ``(url_path, [written files], error)``, paths relative to the output dir.
+    """
+    options = _worker['options']
+    client = _worker['client']
+    written = []
+    pending, seen = [1], {1}
+    while pending:
+        number = pending.pop(0)
+        url = url_path if number == 1 else f'{url_path}?page={number}'
+        status, body, response = _fetch(client, url)
+        if status != 200:
+            return url_path, written, f'HTTP {status} for {url}'
+        target_path = url_path if number == 1 else f'{url_path}page/{number}/'
+        if response.get('Content-Type', '').startswith('text/html'):
+            html = body.decode(response.charset or 'utf-8')
+            for match in _PAGE_LINK.finditer(html):
+                linked = int(match.group(1))
+                if linked not in seen:
+                    seen.add(linked)
+                    pending.append(linked)
+            body = rewrite(html, url_path, options['static_url'], options['media_url']).encode('utf-8')
+        path = output_path(options['out_dir'], batches.get(options['batch']).site_path(target_path))
+        _write(path, body)
+        written.append(os.path.relpath(path, options['out_dir']))
+    return url_path, written, None
+
+
+# ----- assets -----
+
+def sync_tree(source, destination):
+    """
+    Mirror ``source`` into ``destination`` with hard links where possible.
+    Unchanged files are skipped and files gone from the source removed.
+    Returns the number of files linked or copied.
+    """
+    changed = 0
+    wanted = set()
+    for root, _dirs, files in os.walk(source):
+        for filename in files:
+            src = os.path.join(root, filename)
+            relative = os.path.relpath(src, source)
+            wanted.add(relative)
+            dst = os.path.join(destination, relative)
+            if _same_file(src, dst):
+                continue
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            if os.path.lexists(dst):
+                os.unlink(dst)
+            try:
+                os.link(src, dst)
+            except OSError:
+                shutil.copy2(src, dst)
+            changed += 1
+    if os.path.isdir(destination):
+        for root, _dirs, files in os.walk(destination):
+            for filename in files:
+                path = os.path.join(root, filename)
+                if os.path.relpath(path, destination) not in wanted:
+                    os.unlink(path)
+    return changed
+
+
+def _same_file(src, dst):
+    try:
+        a, b = os.stat(src), os.stat(dst)
+    except FileNotFoundError:
+        return False
+    return (a.st_ino == b.st_ino and a.st_dev == b.st_dev) or (
+        a.st_size == b.st_size and a.st_mtime_ns == b.st_mtime_ns
+    )
+
+
+def sync_static(out_dir):
+    """Copy static files: the collected STATIC_ROOT if there is one, else the finders."""
+    destination = os.path.join(out_dir, *settings.STATIC_URL.strip('/').split('/'))
+    static_root = getattr(settings, 'STATIC_ROOT', None)
+    if static_root and os.path.isdir(static_root):
+        return sync_tree(str(static_root), destination)
+    changed = 0
+    for finder in finders.get_finders():
+        for path, storage in finder.list(['CVS', '.*', '*~']):
+            src = storage.path(path)
+            dst = os.path.join(destination, path)
+            if not _same_file(src, dst):
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                shutil.copy2(src, dst)
+                changed += 1
+    return changed
+
+
+def sync_media(out_dir):
+    batch = batches.current()
+    destination = os.path.join(out_dir, *settings.MEDIA_URL.strip('/').split('/'))
+    if batch.media_prefix:
+        destination = os.path.join(destination, batch.media_prefix)
+    source = batches.media_root()
+    if not os.path.isdir(source):
+        return 0
+    return sync_tree(source, destination)
+
+
+# ----- driver -----
+
+def _prune_empty_dirs(directory, stop):
+    while os.path.abspath(directory) != os.path.abspath(stop):
+        try:
+            os.rmdir(directory)
+        except OSError:
+            return
+        directory = os.path.dirname(directory)
+
+
+def load_state(out_dir):
+    try:
+        with open(os.path.join(out_dir, STATE_FILE)) as fh:
+            return json.load(fh)
+    except (FileNotFoundError, ValueError):
+        return {'build': None, 'pages': {}}
+
+
+def bake(out_dir=None, processes=None, force=False, static_url=None, media_url=None,
+         host=None, assets=True, log=None):
+    """
+    Bake the current batch's public site into ``out_dir``. Returns a dict
+    of counts. ``host`` defaults to the batch's first host, or localhost.
+    """
+    from django.db import connections
+
+    from .models import ChangeStamp
+
+    batch = batches.current()
+    host = host or (batch.hosts[0] if batch.hosts else 'localhost')
+    out_dir = os.path.abspath(out_dir or default_output_dir())
+    os.makedirs(out_dir, exist_ok=True)
+    log = log or (lambda message: None)
+    state = load_state(out_dir)
+    build = build_fingerprint(static_url, media_url, host)
+    if state.get('build') != build:
+        force = True
+
+    pages = []
+    # Under the batch's URL prefix, if it has one
+    with batches.activate(batch):
+        for url_name, kwargs, keys in public_pages():
+            pages.append((reverse(url_name, kwargs=kwargs), keys))
+    versions = ChangeStamp.versions({key for _path, keys in pages for key in keys})
+
+    todo, fingerprints = [], {}
+    for url_path, keys in pages:
+        fingerprints[url_path] = {key: versions[key] for key in keys}
+        previous = state['pages'].get(url_path)
+        if force or not previous or previous['stamps'] != fingerprints[url_path]:
+            todo.append(url_path)
+
+    new_pages = {}
+    errors = []
+    if todo:
+        options = {
+            'out_dir': out_dir, 'static_url': static_url, 'media_url': media_url, 'host': host,
+            'batch': batch.slug,
+        }
+        processes = processes or min(len(todo), os.cpu_count() or 1)
+        # Children open their own connections
+        connections.close_all()
+        if processes > 1:
+            with multiprocessing.Pool(processes, initializer=_init_worker, initargs=(options,)) as pool:
+                results = list(pool.imap_unordered(render_page, todo, chunksize=4))
+        else:
+            _init_worker(options)
+            results = [render_page(url_path) for url_path in todo]
+        for url_path, written, error in results:
+            if error:
+                errors.append(error)
+                log(f'  ! {error}')
+                # Serve the last good copy until a later run gets through;
+                # no stamps, so that run retries the page
+                previous = state['pages'].get(url_path, {})
+                files = set(previous.get('files', ())) | set(written)
+                new_pages[url_path] = {'stamps': None, 'files': sorted(files)}
+                continue
+            log(f'  baked {url_path} ({len(written)} file{"s" if len(written) != 1 else ""})')
+            new_pages[url_path] = {'stamps': fingerprints[url_path], 'files': written}
+
+    # Keep unchanged pages, drop files of pages that are gone or now shorter
+    removed = 0
+    for url_path, entry in state['pages'].items():
+        if url_path in fingerprints and url_path not in todo:
+            new_pages[url_path] = entry
+            continue
+        keep = set(new_pages.get(url_path, {}).get('files', ()))
+        for relative in entry.get('files', ()):
+            if relative not in keep:
+                path = os.path.join(out_dir, relative)
+                try:
+                    os.unlink(path)
+                    removed += 1
+                except FileNotFoundError:
+                    continue
+                _prune_empty_dirs(os.path.dirname(path), out_dir)
+
+    copied = 0
+    if assets:
+        copied += sync_static(out_dir)
+        if not media_url:
+            copied += sync_media(out_dir)
+
+    with open(os.path.join(out_dir, STATE_FILE), 'w') as fh:
+        json.dump({'build': build, 'pages': new_pages}, fh, indent=1, sort_keys=True)
+    return {
+        'pages': len(pages),
+        'rendered': len(todo) - len(errors),
+        'removed': removed,
+        'assets': copied,
+        'errors': errors,
+    }
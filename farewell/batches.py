@@ -0,0 +1,254 @@
+"""
+Several batches' farewell sites from one deployment.
+
+Each batch is picked by the request's host or by a path prefix and gets
+
+* its own database for everything in the farewell app (Friend, Event,
+  SlamMessage, ...), chosen by BatchRouter, so one busy batch's writes
+  never lock another's SQLite file,
+* its own directory under MEDIA_ROOT and URL under MEDIA_URL, through
+  BatchFileSystemStorage,
+* its own cache keys, through ``make_cache_key`` (CACHES KEY_FUNCTION).
+
+Logins, sessions and the admin's own tables stay in the ``default``
+database and are shared; ``default`` is also the database of the main
+batch, the one served when no other matches. Configure batches in
+settings::
+
+    FAREWELL_BATCHES = {
+        'cse-2026': {
+            'NAME': 'CSE 2026',
+            'HOSTS': ['cse2026.farewell.example.com'],
+        },
+        'mech-2026': {
+            'NAME': 'Mechanical 2026',
+            'PREFIX': 'mech-2026',          # served under /mech-2026/
+            # 'DATABASE': BASE_DIR / 'batches' / 'mech-2026.sqlite3',
+            # or a full DATABASES entry, e.g. a PostgreSQL schema:
+            # 'DATABASE': {'ENGINE': ..., 'OPTIONS': {'options': '-c search_path=mech_2026'}},
+        },
+    }
+    DATABASES.update(batch_databases(FAREWELL_BATCHES, DATABASES['default'], BASE_DIR))
+
+Create a new batch's tables with ``manage.py migrate_batches``. Management
+commands work on the main batch, or on another one when the
+``FAREWELL_BATCH`` environment variable names it::
+
+    FAREWELL_BATCH=cse-2026 python manage.py bake
+"""
+import contextvars
+import os
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.http import HttpResponsePermanentRedirect
+from django.urls import get_script_prefix, set_script_prefix
+
+ENVIRONMENT_VARIABLE = 'FAREWELL_BATCH'
+
+_current = contextvars.ContextVar('farewell_batch', default=None)
+_registry = None
+
+
+def database_alias(slug):
+    return 'batch_' + slug.replace('-', '_')
+
+
+def batch_databases(batches, default, base_dir):
+    """DATABASES entries for ``FAREWELL_BATCHES``; SQLite files default to BASE_DIR/batches/<slug>.sqlite3."""
+    databases = {}
+    for slug, options in batches.items():
+        database = options.get('DATABASE') or os.path.join(base_dir, 'batches', f'{slug}.sqlite3')
+        if not isinstance(database, dict):
+            database = {**default, 'NAME': database}
+        databases[database_alias(slug)] = database
+    return databases
+
+
+class Batch:
+    def __init__(self, slug, name='', hosts=(), prefix='', database='default', media_prefix=''):
+        self.slug = slug
+        self.name = name
+        self.hosts = [host.lower() for host in hosts]
+        self.prefix = prefix.strip('/')
+        self.database = database
+        self.media_prefix = media_prefix.strip('/')
+
+    def __repr__(self):
+        return f'<Batch {self.slug or "(main)"}>'
+
+    def site_path(self, path):
+        """``path`` without this batch's URL prefix: ``/mech-2026/gallery/`` -> ``/gallery/``."""
+        prefix = f'/{self.prefix}/'
+        if self.prefix and path.startswith(prefix):
+            return path[len(prefix) - 1:]
+        return path
+
+    def directory(self, root):
+        """``root`` for the main batch, ``root/<slug>`` for the others."""
+        return os.path.join(str(root), self.slug) if self.slug else str(root)
+
+
+MAIN = Batch('')
+
+
+def registry():
+    """``{slug: Batch}`` of the configured batches, main batch included."""
+    global _registry
+    if _registry is None:
+        batches = {'': MAIN}
+        for slug, options in getattr(settings, 'FAREWELL_BATCHES', {}).items():
+            batches[slug] = Batch(
+                slug,
+                name=options.get('NAME', slug),
+                hosts=options.get('HOSTS', ()),
+                prefix=options.get('PREFIX', ''),
+                database=database_alias(slug),
+                media_prefix=options.get('MEDIA_PREFIX', slug),
+            )
+        _registry = batches
+    return _registry
+
+
+@receiver(setting_changed)
+def _reset_registry(setting, **kwargs):
+    global _registry
+    if setting == 'FAREWELL_BATCHES':
+        _registry = None
+
+
+def get(slug):
+    try:
+        return registry()[slug or '']
+    except KeyError:
+        raise LookupError(f'No batch {slug!r} in FAREWELL_BATCHES') from None
+
+
+def current():
+    """The batch being served, else the one named by FAREWELL_BATCH, else the main batch."""
+    batch = _current.get()
+    if batch is None:
+        batch = get(os.environ.get(ENVIRONMENT_VARIABLE, ''))
+    return batch
+
+
+@contextmanager
+def activate(batch, script_prefix=None):
+    """Serve ``batch`` inside the block; path-prefixed batches reverse URLs under their prefix."""
+    token = _current.set(batch)
+    old_prefix = get_script_prefix()
+    if batch.prefix:
+        set_script_prefix((script_prefix or old_prefix) + batch.prefix + '/')
+    try:
+        yield batch
+    finally:
+        set_script_prefix(old_prefix)
+        _current.reset(token)
+
+
+def for_request(request):
+    """The batch a request is for and the path left after its prefix."""
+    batches = registry()
+    if len(batches) > 1:
+        host = request.get_host().rsplit(':', 1)[0].lower()
+        for batch in batches.values():
+            if host in batch.hosts:
+                return batch, request.path_info
+        for batch in batches.values():
+            if batch.prefix:
+                prefix = f'/{batch.prefix}/'
+                if request.path_info.startswith(prefix):
+                    return batch, request.path_info[len(prefix) - 1:]
+                if request.path_info == prefix[:-1]:
+                    return batch, ''
+    return MAIN, request.path_info
+
+
+def _streamed(batch, script_prefix, chunks):
+    # Streamed bodies render after the middleware has returned
+    with activate(batch, script_prefix):
+        yield from chunks
+
+
+class BatchMiddleware:
+    """
+    Picks the batch a request is for. Must be the first middleware so
+    everything after it, sessions and caching included, sees the batch.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        batch, path_info = for_request(request)
+        if not path_info:
+            return HttpResponsePermanentRedirect(request.path + '/')
+        request.batch = batch
+        script_prefix = get_script_prefix()
+        if batch.prefix:
+            request.path_info = path_info
+            request.META['SCRIPT_NAME'] = script_prefix + batch.prefix
+        with activate(batch, script_prefix):
+            response = self.get_response(request)
+        if response.streaming and not getattr(response, 'is_async', False):
+            response.streaming_content = _streamed(batch, script_prefix, response.streaming_content)
+        return response
+
+
+class BatchRouter:
+    """Farewell app models go to the current batch's database; everything else to ``default``."""
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == 'farewell':
+            return current().database
+        return None
+
+    db_for_write = db_for_read
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == 'default':
+            return None
+        if any(batch.database == db for batch in registry().values()):
+            return app_label == 'farewell'
+        return None
+
+
+class BatchFileSystemStorage(FileSystemStorage):
+    """FileSystemStorage under the current batch's media prefix."""
+
+    @property
+    def base_location(self):
+        return _media_directory(self._value_or_setting(self._location, settings.MEDIA_ROOT))
+
+    @property
+    def location(self):
+        return os.path.abspath(self.base_location)
+
+    @property
+    def base_url(self):
+        base = self._value_or_setting(self._base_url, settings.MEDIA_URL)
+        if base is not None and not base.endswith('/'):
+            base += '/'
+        prefix = current().media_prefix
+        return f'{base}{prefix}/' if base is not None and prefix else base
+
+
+def _media_directory(root):
+    prefix = current().media_prefix
+    return os.path.join(str(root), prefix) if prefix else str(root)
+
+
+def media_root():
+    """The current batch's directory under MEDIA_ROOT."""
+    return _media_directory(settings.MEDIA_ROOT)
+
+
+def make_cache_key(key, key_prefix, version):
+    """Django's default key, with the batch's slug in front for batches other than the main one."""
+    slug = current().slug
+    if slug:
+        return f'{slug}:{key_prefix}:{version}:{key}'
+    return f'{key_prefix}:{version}:{key}'
@@ -0,0 +1,323 @@
+"""
+SQLite-backed cache shared by every worker process on one host.
+
+LocMemCache gives each gunicorn worker its own private (and mostly cold)
+cache. This backend keeps entries in a single SQLite file in WAL mode, so
+all workers read and write the same cache without a Redis server::
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'farewell.cache_backends.SQLiteCache',
+            'LOCATION': BASE_DIR / 'cache.sqlite3',
+            'TIMEOUT': 300,
+            'OPTIONS': {
+                'MAX_ENTRIES': 5000,         # LRU-evicted beyond this
+                'MAX_BYTES': 64 * 1024**2,   # ...or beyond this many value bytes
+                'CULL_FREQUENCY': 4,         # evict 1/4 of the entries per cull
+            },
+        },
+    }
+
+Integers are stored as native SQLite integers so ``incr``/``decr`` are a
+single atomic UPDATE, safe across processes. Everything else is pickled.
+Entry count and total size are kept up to date by triggers, so checking
+the limits after a write costs one primary-key lookup.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from . import metrics
+
+# Recency is only written back when it is older than this, so hot keys
+# don't turn every read into a write.
+LRU_RESOLUTION = 5.0
+
+# Stay well below SQLite's bound-parameter limit for IN (...) queries
+BATCH_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache_entries (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires REAL,
+    accessed REAL NOT NULL,
+    size INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS cache_entries_accessed ON cache_entries (accessed);
+CREATE INDEX IF NOT EXISTS cache_entries_expires ON cache_entries (expires);
+CREATE TABLE IF NOT EXISTS cache_totals (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    entries INTEGER NOT NULL,
+    bytes INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO cache_totals (id, entries, bytes) VALUES (1, 0, 0);
+CREATE TRIGGER IF NOT EXISTS cache_entries_ins AFTER INSERT ON cache_entries BEGIN
+    UPDATE cache_totals SET entries = entries + 1, bytes = bytes + NEW.size WHERE id = 1;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_entries_del AFTER DELETE ON cache_entries BEGIN
+    UPDATE cache_totals SET entries = entries - 1, bytes = bytes - OLD.size WHERE id = 1;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_entries_upd AFTER UPDATE OF size ON cache_entries BEGIN
+    UPDATE cache_totals SET bytes = bytes + NEW.size - OLD.size WHERE id = 1;
+END;
+"""
+
+UPSERT = """
+INSERT INTO cache_entries (key, value, expires, accessed, size) VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (key) DO UPDATE SET
+    value = excluded.value, expires = excluded.expires,
+    accessed = excluded.accessed, size = excluded.size
+"""
+
+
+class SQLiteCache(BaseCache):
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = str(location)
+        options = params.get('OPTIONS', {})
+        self._max_bytes = int(options.get('MAX_BYTES', 0) or 0)
+        self._local = threading.local()
+
+    # ----- connection handling -----
+
+    def _connection(self):
+        # One connection per thread, re-opened after a fork
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self._path, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript(SCHEMA)
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def close(self, **kwargs):
+        # Connections are cheap to keep and expensive to re-open per request
+        pass
+
+    # ----- encoding -----
+
+    def _encode(self, value):
+        if type(value) is int and -(2 ** 63) <= value < 2 ** 63:
+            return value, 8
+        pickled = pickle.dumps(value, self.pickle_protocol)
+        return pickled, len(pickled)
+
+    def _decode(self, stored):
+        if isinstance(stored, (int, float)):
+            return stored
+        return pickle.loads(stored)
+
+    # ----- reads -----
+
+    def get(self, key, default=None, version=None):
+        area = metrics.cache_area(key)
+        key = self.make_and_validate_key(key, version=version)
+        conn = self._connection()
+        row = conn.execute(
+            'SELECT value, expires, accessed FROM cache_entries WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            metrics.inc('farewell_cache_requests_total', area=area, result='miss')
+            return default
+        now = time.time()
+        if row[1] is not None and row[1] <= now:
+            conn.execute('DELETE FROM cache_entries WHERE key = ? AND expires <= ?', (key, now))
+            metrics.inc('farewell_cache_requests_total', area=area, result='miss')
+            return default
+        metrics.inc('farewell_cache_requests_total', area=area, result='hit')
+        if now - row[2] > LRU_RESOLUTION:
+            conn.execute('UPDATE cache_entries SET accessed = ? WHERE key = ?', (now, key))
+        return self._decode(row[0])
+
+    def get_many(self, keys, version=None):
+        key_map = {self.make_and_validate_key(k, version=version): k for k in keys}
+        conn = self._connection()
+        now = time.time()
+        found = {}
+        stored_keys = list(key_map)
+        for start in range(0, len(stored_keys), BATCH_SIZE):
+            batch = stored_keys[start:start + BATCH_SIZE]
+            placeholders = ','.join('?' * len(batch))
+            rows = conn.execute(
+                f'SELECT key, value FROM cache_entries WHERE key IN ({placeholders}) '
+                f'AND (expires IS NULL OR expires > ?)',
+                (*batch, now),
+            )
+            for stored_key, value in rows:
+                found[key_map[stored_key]] = self._decode(value)
+        if key_map:
+            area = metrics.cache_area(next(iter(key_map.values())))
+            metrics.inc('farewell_cache_requests_total', len(found), area=area, result='hit')
+            metrics.inc('farewell_cache_requests_total', len(key_map) - len(found), area=area, result='miss')
+        return found
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        row = self._connection().execute(
+            'SELECT 1 FROM cache_entries WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (key, time.time()),
+        ).fetchone()
+        return row is not None
+
+    # ----- writes -----
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        stored, size = self._encode(value)
+        conn = self._connection()
+        conn.execute(UPSERT, (key, stored, self.get_backend_timeout(timeout), time.time(), size))
+        self._maybe_cull(conn)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self.get_backend_timeout(timeout)
+        now = time.time()
+        rows = []
+        for key, value in data.items():
+            stored, size = self._encode(value)
+            rows.append((self.make_and_validate_key(key, version=version), stored, expires, now, size))
+        conn = self._connection()
+        with self._transaction(conn):
+            conn.executemany(UPSERT, rows)
+        self._maybe_cull(conn)
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        stored, size = self._encode(value)
+        now = time.time()
+        conn = self._connection()
+        # Only an expired entry may be overwritten
+        cursor = conn.execute(
+            UPSERT + ' WHERE cache_entries.expires IS NOT NULL AND cache_entries.expires <= ?',
+            (key, stored, self.get_backend_timeout(timeout), now, size, now),
+        )
+        if cursor.rowcount:
+            self._maybe_cull(conn)
+        return cursor.rowcount > 0
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        cursor = self._connection().execute(
+            'UPDATE cache_entries SET expires = ?, accessed = ? '
+            'WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (self.get_backend_timeout(timeout), now, key, now),
+        )
+        return cursor.rowcount > 0
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        conn = self._connection()
+        row = conn.execute(
+            "UPDATE cache_entries SET value = value + ?, accessed = ? "
+            "WHERE key = ? AND typeof(value) = 'integer' AND (expires IS NULL OR expires > ?) "
+            "RETURNING value",
+            (delta, now, key, now),
+        ).fetchone()
+        if row is not None:
+            return row[0]
+
+        # Not a native integer (e.g. a float): read-modify-write under a
+        # write lock so concurrent workers still serialize.
+        with self._transaction(conn, immediate=True):
+            row = conn.execute(
+                'SELECT value FROM cache_entries WHERE key = ? AND (expires IS NULL OR expires > ?)',
+                (key, now),
+            ).fetchone()
+            if row is None:
+                raise ValueError("Key '%s' not found" % key)
+            new_value = self._decode(row[0]) + delta
+            stored, size = self._encode(new_value)
+            conn.execute(
+                'UPDATE cache_entries SET value = ?, size = ?, accessed = ? WHERE key = ?',
+                (stored, size, now, key),
+            )
+        return new_value
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        cursor = self._connection().execute('DELETE FROM cache_entries WHERE key = ?', (key,))
+        return cursor.rowcount > 0
+
+    def delete_many(self, keys, version=None):
+        stored_keys = [self.make_and_validate_key(k, version=version) for k in keys]
+        conn = self._connection()
+        with self._transaction(conn):
+            for start in range(0, len(stored_keys), BATCH_SIZE):
+                batch = stored_keys[start:start + BATCH_SIZE]
+                conn.execute(
+                    f"DELETE FROM cache_entries WHERE key IN ({','.join('?' * len(batch))})", batch
+                )
+
+    def clear(self):
+        self._connection().execute('DELETE FROM cache_entries')
+
+    # ----- eviction -----
+
+    def _maybe_cull(self, conn):
+        entries, total_bytes = conn.execute(
+            'SELECT entries, bytes FROM cache_totals WHERE id = 1'
+        ).fetchone()
+        over_entries = entries > self._max_entries
+        over_bytes = self._max_bytes and total_bytes > self._max_bytes
+        if over_entries or over_bytes:
+            self._cull(conn, entries)
+
+    def _cull(self, conn, entries):
+        with self._transaction(conn, immediate=True):
+            conn.execute('DELETE FROM cache_entries WHERE expires <= ?', (time.time(),))
+            if self._cull_frequency == 0:
+                conn.execute('DELETE FROM cache_entries')
+                return
+            entries, total_bytes = conn.execute(
+                'SELECT entries, bytes FROM cache_totals WHERE id = 1'
+            ).fetchone()
+            if entries > self._max_entries:
+                count = max(entries - self._max_entries, entries // self._cull_frequency)
+                conn.execute(
+                    'DELETE FROM cache_entries WHERE key IN '
+                    '(SELECT key FROM cache_entries ORDER BY accessed LIMIT ?)',
+                    (count,),
+                )
+            # Evict least recently used entries until back under the byte budget
+            while self._max_bytes and total_bytes > self._max_bytes:
+                conn.execute(
+                    'DELETE FROM cache_entries WHERE key IN '
+                    '(SELECT key FROM cache_entries ORDER BY accessed LIMIT ?)',
+                    (max(1, entries // self._cull_frequency),),
+                )
+                entries, total_bytes = conn.execute(
+                    'SELECT entries, bytes FROM cache_totals WHERE id = 1'
+                ).fetchone()
+                if not entries:
+                    break
+
+    def _transaction(self, conn, immediate=False):
+        return _Transaction(conn, immediate)
+
+
+class _Transaction:
+    """Explicit BEGIN/COMMIT for an autocommit (isolation_level=None) connection."""
+
+    def __init__(self, conn, immediate):
+        self.conn = conn
+        self.immediate = immediate
+
+    def __enter__(self):
+        self.conn.execute('BEGIN IMMEDIATE' if self.immediate else 'BEGIN')
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute('ROLLBACK' if exc_type else 'COMMIT')
+        return False
@@ -0,0 +1,152 @@
+"""
+Response compression with br / zstd / gzip negotiation.
+
+gzip is always available. Brotli and Zstandard are used when the optional
+``brotli`` and ``zstandard`` packages are installed, and are silently left
+out of negotiation otherwise.
+
+Shared responses (``Cache-Control: public`` and no cookies, e.g. the
+public pages) are only compressed once: the compressed variant is stored
+in the default cache, keyed by the encoding and a hash of the
+uncompressed body, so repeat hits skip the compressor. Everything else
+is likely unique to its request and is compressed without being stored.
+
+Settings (all optional) live in ``settings.FAREWELL_COMPRESSION``::
+
+    FAREWELL_COMPRESSION = {
+        'ENCODINGS': ['br', 'zstd', 'gzip'],  # server preference order
+        'MIN_SIZE': 512,                      # bytes
+        'CONTENT_TYPES': [...],               # prefixes
+        'STREAMING': True,                    # compress streaming responses
+        'CACHE_TIMEOUT': 600,                 # seconds, 0 disables
+    }
+"""
+import gzip
+import hashlib
+import zlib
+
+from django.conf import settings
+from django.core.cache import cache
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+DEFAULTS = {
+    'ENCODINGS': ['br', 'zstd', 'gzip'],
+    'MIN_SIZE': 512,
+    'CONTENT_TYPES': [
+        'text/html', 'text/css', 'text/plain', 'text/javascript',
+        'application/javascript', 'application/json', 'application/manifest+json',
+        'image/svg+xml',
+    ],
+    'STREAMING': True,
+    'CACHE_TIMEOUT': 600,
+}
+
+
+def get_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'FAREWELL_COMPRESSION', {}))
+    return config
+
+
+def available_encodings(config):
+    supported = {'gzip'}
+    if brotli is not None:
+        supported.add('br')
+    if zstandard is not None:
+        supported.add('zstd')
+    return [e for e in config['ENCODINGS'] if e in supported]
+
+
+def negotiate(accept_encoding, encodings):
+    """
+    Pick the best encoding from an Accept-Encoding header.
+
+    Client q-values win; ties go to the server's preference order.
+    Returns None when nothing acceptable is offered.
+    """
+    offered = {}
+    for part in accept_encoding.split(','):
+        token, _, params = part.strip().partition(';')
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        offered[token] = q
+    best, best_q = None, 0.0
+    for encoding in encodings:
+        q = offered.get(encoding, offered.get('*', 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=5)
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    return gzip.compress(data, compresslevel=6, mtime=0)
+
+
+def is_shared(response):
+    """True when everybody gets this same body, so storing its compressed variant pays off."""
+    if response.cookies:
+        return False
+    directives = {part.split('=', 1)[0].strip().lower() for part in response.get('Cache-Control', '').split(',')}
+    return 'public' in directives and not directives & {'private', 'no-store'}
+
+
+def compress_cached(data, encoding, timeout):
+    """Compress ``data``, reusing a previously stored variant when possible."""
+    if not timeout:
+        return compress(data, encoding)
+    key = f'farewell:compressed:{encoding}:{hashlib.sha1(data).hexdigest()}'
+    compressed = cache.get(key)
+    if compressed is None:
+        compressed = compress(data, encoding)
+        cache.set(key, compressed, timeout)
+    return compressed
+
+
+def compress_stream(chunks, encoding):
+    """
+    Compress an iterable of byte chunks, flushing after each one so the
+    client can render every chunk as soon as it arrives.
+    """
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=4)
+        for chunk in chunks:
+            out = compressor.process(chunk) + compressor.flush()
+            if out:
+                yield out
+        yield compressor.finish()
+    elif encoding == 'zstd':
+        compressor = zstandard.ZstdCompressor(level=3).compressobj()
+        for chunk in chunks:
+            out = compressor.compress(chunk) + compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+            if out:
+                yield out
+        yield compressor.flush()
+    else:
+        # wbits=31 produces a gzip container
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        for chunk in chunks:
+            out = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            if out:
+                yield out
+        yield compressor.flush()
@@ -0,0 +1,36 @@
+from django.middleware.csrf import get_token
+
+from .hints import asset_version
+
+
+class DeferredCsrfToken:
+    """
+    Stands in for the CSRF token on public pages: ``{% csrf_token %}``
+    still renders its hidden input, with an empty value, and no CSRF
+    cookie is set. base.html fills it in from ``/csrf/`` on submit.
+    """
+
+    def __str__(self):
+        return ''
+
+
+DEFERRED_CSRF_TOKEN = DeferredCsrfToken()
+
+
+def assets(request):
+    """Expose the static asset version used for cache busting in base.html."""
+    return {'asset_version': asset_version()}
+
+
+def deferred_csrf(request):
+    """Replace the CSRF token on public pages (see PublicPageMiddleware)."""
+    if getattr(request, '_farewell_public', False):
+        return {'csrf_token': DEFERRED_CSRF_TOKEN}
+    return {}
+
+
+def csrf_token_for(request):
+    """The token to render into forms outside a RequestContext."""
+    if getattr(request, '_farewell_public', False):
+        return DEFERRED_CSRF_TOKEN
+    return get_token(request)
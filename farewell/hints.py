@@ -0,0 +1,105 @@
+"""
+Preload hints for critical assets.
+
+Every page is rendered through base.html, which blocks on the stylesheet,
+the web fonts and the htmx/confetti scripts. Views can additionally name
+the first above-the-fold image (a friend's photo, the first album
+photos). PreloadHintsMiddleware turns both into ``Link: rel=preload``
+headers so the browser starts fetching them before it parses the HTML.
+A CDN or proxy that supports Early Hints can replay those headers as a
+``103 Early Hints`` response on later requests.
+
+Configuration lives in ``settings.FAREWELL_PRELOAD_HINTS``, keyed by URL
+name (``'farewell:event_detail'``) with ``'*'`` as the default for every
+page. Per-name entries are merged over the default::
+
+    FAREWELL_PRELOAD_HINTS = {
+        '*': {'assets': [...], 'max_images': 1},
+        'farewell:event_detail': {'max_images': 3},
+        'admin:*': None,  # no hints at all for the admin
+    }
+"""
+from django.conf import settings
+from django.templatetags.static import static
+
+DEFAULT_HINTS = {
+    '*': {
+        'assets': [
+            {'href': 'css/main.css', 'as': 'style', 'static': True, 'versioned': True},
+            {'href': 'https://fonts.gstatic.com', 'rel': 'preconnect', 'crossorigin': True},
+            {'href': 'https://unpkg.com/htmx.org@1.9.10', 'as': 'script'},
+        ],
+        'max_images': 1,
+    },
+    'farewell:event_detail': {'max_images': 3},
+    'farewell:gallery': {'max_images': 2},
+    'admin:*': None,
+}
+
+
+def asset_version():
+    """Cache-busting suffix shared by base.html and the preload headers."""
+    return getattr(settings, 'FAREWELL_ASSET_VERSION', '13.0')
+
+
+def hints_for(url_name, namespace=''):
+    """
+    Return the merged hint config for a URL name, or None if disabled.
+    """
+    config = getattr(settings, 'FAREWELL_PRELOAD_HINTS', DEFAULT_HINTS)
+    for key in (url_name, f'{namespace}:*' if namespace else None):
+        if key and key in config:
+            override = config[key]
+            break
+    else:
+        override = {}
+    if override is None:
+        return None
+    merged = dict(config.get('*') or {})
+    merged.update(override)
+    return merged
+
+
+def preload(request, *urls):
+    """
+    Declare critical images for the current response, e.g. from a view::
+
+        preload(request, friend.photo.url)
+
+    Only the first ``max_images`` declared for the URL name are sent.
+    """
+    images = getattr(request, '_preload_images', None)
+    if images is None:
+        images = request._preload_images = []
+    images.extend(url for url in urls if url)
+
+
+def _link(href, rel='preload', as_=None, crossorigin=False, fetchpriority=None):
+    parts = [f'<{href}>', f'rel={rel}']
+    if as_:
+        parts.append(f'as={as_}')
+    if crossorigin:
+        parts.append('crossorigin')
+    if fetchpriority:
+        parts.append(f'fetchpriority={fetchpriority}')
+    return '; '.join(parts)
+
+
+def build_link_header(request, config):
+    links = []
+    for asset in config.get('assets', ()):
+        href = asset['href']
+        if asset.get('static'):
+            href = static(href)
+        if asset.get('versioned'):
+            href = f'{href}?v={asset_version()}'
+        links.append(_link(
+            href,
+            rel=asset.get('rel', 'preload'),
+            as_=asset.get('as'),
+            crossorigin=asset.get('crossorigin', False),
+        ))
+    images = getattr(request, '_preload_images', ())[:config.get('max_images', 0)]
+    for index, url in enumerate(images):
+        links.append(_link(url, as_='image', fetchpriority='high' if index == 0 else None))
+    return ', '.join(links)
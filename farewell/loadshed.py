@@ -0,0 +1,231 @@
+"""
+Load shedding: a degraded mode for when the site is overloaded.
+
+Each worker process keeps two numbers about itself:
+
+* how many requests it is running right now (threaded workers), and
+* a moving average of how long requests waited in the queue before it
+  picked them up, read from the ``X-Request-Start`` header the proxy
+  stamps on them (``proxy_set_header X-Request-Start "t=${msec}";`` in
+  nginx).
+
+While either is past its threshold, and for ``RECOVERY_SECONDS`` after,
+LoadSheddingMiddleware stops doing expensive work:
+
+* public GETs (``PUBLIC_URL_NAMES``) are answered from the last good
+  snapshot of the page, which is kept in the cache whenever it renders
+  normally, else from the static bake, else with the offline page;
+* expensive endpoints (photo uploads) get ``503`` with ``Retry-After``,
+  except for staff;
+* the admin and everything else runs as usual, so staff can still work.
+
+Settings (all optional) live in ``settings.FAREWELL_LOAD_SHEDDING``::
+
+    FAREWELL_LOAD_SHEDDING = {
+        'ENABLED': True,
+        'MAX_IN_FLIGHT': 16,        # concurrent requests in one worker
+        'MAX_QUEUE_MS': 1000,       # average queue wait, milliseconds
+        'RECOVERY_SECONDS': 15,     # stay degraded this long once tripped
+        'RETRY_AFTER': 30,          # seconds, sent with 503s
+        'SNAPSHOT_TIMEOUT': 3600,   # how long a page snapshot is kept
+        'SNAPSHOT_INTERVAL': 30,    # refresh a page's snapshot at most this often
+        'EXPENSIVE_VIEWS': [...],   # view names shed under load
+    }
+"""
+import hashlib
+import mimetypes
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import FileResponse, HttpResponse
+
+DEFAULTS = {
+    'ENABLED': True,
+    'MAX_IN_FLIGHT': 16,
+    'MAX_QUEUE_MS': 1000,
+    'RECOVERY_SECONDS': 15,
+    'RETRY_AFTER': 30,
+    'SNAPSHOT_TIMEOUT': 3600,
+    'SNAPSHOT_INTERVAL': 30,
+    'EXPENSIVE_VIEWS': [
+        'farewell:add_photos', 'farewell:upload_session_create',
+        'farewell:upload_chunk', 'farewell:upload_session_complete',
+    ],
+}
+
+SNAPSHOT_PREFIX = 'farewell:loadshed:snapshot:'
+# Weight of the newest queue wait in the moving average
+QUEUE_SMOOTHING = 0.2
+# Query parameters a snapshot may be looked up with; ``msg`` is a flash
+# message that is simply dropped in degraded mode
+_SNAPSHOT_PARAMS = {'page', 'msg'}
+
+
+def get_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'FAREWELL_LOAD_SHEDDING', {}))
+    return config
+
+
+class WorkerLoad:
+    """In-flight requests and average queue wait of this process."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.queue_ms = 0.0
+        self.degraded_until = 0.0
+
+    def started(self, queue_ms=None):
+        with self.lock:
+            self.in_flight += 1
+            if queue_ms is not None:
+                self.queue_ms += QUEUE_SMOOTHING * (queue_ms - self.queue_ms)
+
+    def finished(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def overloaded(self, config):
+        now = time.monotonic()
+        with self.lock:
+            if self.in_flight > config['MAX_IN_FLIGHT'] or self.queue_ms > config['MAX_QUEUE_MS']:
+                self.degraded_until = now + config['RECOVERY_SECONDS']
+            return now < self.degraded_until
+
+    def status(self):
+        with self.lock:
+            return {
+                'in_flight': self.in_flight,
+                'queue_ms': round(self.queue_ms, 1),
+                'degraded': time.monotonic() < self.degraded_until,
+            }
+
+
+load = WorkerLoad()
+
+
+def queue_wait_ms(request):
+    """
+    Milliseconds between the proxy receiving ``request`` and now, from
+    ``X-Request-Start`` (``t=<seconds>``, or milli/microseconds since the epoch).
+    """
+    value = request.META.get('HTTP_X_REQUEST_START', '')
+    if value.startswith('t='):
+        value = value[2:]
+    try:
+        started = float(value)
+    except ValueError:
+        return None
+    if started > 1e14:
+        started /= 1e6
+    elif started > 1e11:
+        started /= 1e3
+    return max(0.0, (time.time() - started) * 1000)
+
+
+# ----- snapshots -----
+
+def snapshot_key(request):
+    """Cache key of the snapshot answering ``request``, or None if it can't be served from one."""
+    if not set(request.GET) <= _SNAPSHOT_PARAMS:
+        return None
+    page = request.GET.get('page', '')
+    parts = [
+        request.path, '' if page == '1' else page,
+        request.headers.get('HX-Request', ''), request.headers.get('HX-Target', ''),
+    ]
+    return SNAPSHOT_PREFIX + hashlib.sha1('\x1f'.join(parts).encode()).hexdigest()
+
+
+_last_snapshot = {}
+
+
+def snapshot_due(key, config):
+    """True at most once per SNAPSHOT_INTERVAL for a key in this process."""
+    now = time.monotonic()
+    if now - _last_snapshot.get(key, float('-inf')) < config['SNAPSHOT_INTERVAL']:
+        return False
+    if len(_last_snapshot) > 10000:
+        _last_snapshot.clear()
+    _last_snapshot[key] = now
+    return True
+
+
+def save_snapshot(key, response, content, config):
+    from .bake import strip_csrf_tokens
+
+    charset = response.charset or 'utf-8'
+    body = strip_csrf_tokens(content.decode(charset)).encode(charset)
+    cache.set(key, (response['Content-Type'], body), config['SNAPSHOT_TIMEOUT'])
+
+
+def _tee(chunks, done):
+    """Pass a streamed body through, handing the whole of it to ``done`` at the end."""
+    parts = []
+    for chunk in chunks:
+        parts.append(chunk)
+        yield chunk
+    done(b''.join(parts))
+
+
+def remember(request, response, config):
+    """Keep a snapshot of a successful public page for degraded mode."""
+    if (request.method != 'GET' or response.status_code != 200
+            or 'text/html' not in response.get('Content-Type', '') or response.cookies):
+        return
+    key = snapshot_key(request)
+    if key is None or not snapshot_due(key, config):
+        return
+    if response.streaming:
+        response.streaming_content = _tee(
+            response.streaming_content, lambda content: save_snapshot(key, response, content, config)
+        )
+    else:
+        save_snapshot(key, response, response.content, config)
+
+
+def _degraded(response, mode, config):
+    response['X-Farewell-Degraded'] = mode
+    response['Cache-Control'] = f'public, max-age={config["RETRY_AFTER"]}'
+    return response
+
+
+def degraded_page(request, config):
+    """A cached snapshot or baked copy of a public page, or the offline page as a 503."""
+    key = snapshot_key(request)
+    cached = cache.get(key) if key else None
+    if cached is not None:
+        content_type, body = cached
+        return _degraded(HttpResponse(body, content_type=content_type), 'snapshot', config)
+
+    if not request.headers.get('HX-Request'):
+        from .bake import default_output_dir, output_path
+
+        path = request.path_info
+        page = request.GET.get('page', '')
+        if page.isdigit() and page != '1':
+            path = f'{path}page/{page}/'
+        baked = output_path(default_output_dir(), path)
+        if os.path.isfile(baked):
+            content_type = mimetypes.guess_type(baked)[0] or 'application/octet-stream'
+            return _degraded(FileResponse(open(baked, 'rb'), content_type=content_type), 'static', config)
+    return unavailable(request, config)
+
+
+def unavailable(request, config):
+    from django.shortcuts import render
+
+    if request.method == 'GET' and not request.headers.get('HX-Request'):
+        response = render(request, 'farewell/offline.html', {'page_title': '📶 Busy'}, status=503)
+    else:
+        response = HttpResponse(
+            'The site is very busy right now, please try again in a moment.',
+            status=503, content_type='text/plain; charset=utf-8',
+        )
+    response['Retry-After'] = str(config['RETRY_AFTER'])
+    response['X-Farewell-Degraded'] = 'shed'
+    return response
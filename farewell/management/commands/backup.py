@@ -0,0 +1,54 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from farewell.backup import (
+    DEFAULT_PAGES, DEFAULT_SLEEP, BackupError, backup_root, create_snapshot, prune, verify,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Back up db.sqlite3 with the online backup API, without stopping the site, '
+        'together with an incremental snapshot of MEDIA_ROOT. Run it from cron.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dest', default=None,
+                            help='Backup directory (default: FAREWELL_BACKUP_DIR or BASE_DIR/backups).')
+        parser.add_argument('--pages', type=int, default=DEFAULT_PAGES,
+                            help='Database pages copied per step.')
+        parser.add_argument('--sleep', type=float, default=DEFAULT_SLEEP,
+                            help='Seconds to pause between steps so writers get in.')
+        parser.add_argument('--keep', type=int, default=None,
+                            help='Then delete all but the newest N snapshots and unused media objects.')
+        parser.add_argument('--no-verify', action='store_true',
+                            help='Skip checking the new snapshot.')
+        parser.add_argument('--database', default=None,
+                            help="Database alias (default: the batch's database).")
+
+    def handle(self, *args, **options):
+        root = options['dest'] or backup_root()
+        log = self.stdout.write if options['verbosity'] > 1 else None
+        try:
+            snapshot, counts = create_snapshot(
+                root, using=options['database'], pages=options['pages'], sleep=options['sleep'], log=log,
+            )
+        except BackupError as exc:
+            raise CommandError(exc)
+        self.stdout.write(
+            f"Snapshot {snapshot}: {counts['files']} media files, {counts['unchanged']} unchanged, "
+            f"{counts['hashed']} hashed, {counts['copied_bytes'] / 1024 / 1024:.1f} MB copied."
+        )
+
+        if not options['no_verify']:
+            problems = verify(snapshot, root)
+            for problem in problems:
+                self.stderr.write(problem)
+            if problems:
+                raise CommandError(f'{os.path.basename(snapshot)} failed verification ({len(problems)} problems).')
+
+        if options['keep'] is not None:
+            removed, freed = prune(options['keep'], root)
+            self.stdout.write(f'Pruned {removed} snapshots, freed {freed / 1024 / 1024:.1f} MB.')
+        self.stdout.write(self.style.SUCCESS('Backup complete.'))
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from farewell.bake import bake, default_output_dir
+
+
+class Command(BaseCommand):
+    help = (
+        'Render the public pages into a static HTML tree that nginx can serve '
+        'on its own. Only pages whose data changed since the last bake are re-rendered.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=None,
+                            help='Directory to bake into (default: FAREWELL_BAKE_DIR or BASE_DIR/baked).')
+        parser.add_argument('--processes', type=int, default=None,
+                            help='Rendering processes (default: one per CPU).')
+        parser.add_argument('--force', action='store_true',
+                            help='Re-render every page, changed or not.')
+        parser.add_argument('--static-url', default=None,
+                            help='Rewrite STATIC_URL in the pages to this prefix, e.g. a CDN.')
+        parser.add_argument('--media-url', default=None,
+                            help='Rewrite MEDIA_URL to this prefix; media files are then not copied.')
+        parser.add_argument('--host', default=None,
+                            help='Host header the pages are rendered for (must be in ALLOWED_HOSTS; '
+                                 "default: the batch's first host, or localhost).")
+        parser.add_argument('--no-assets', action='store_true',
+                            help='Skip copying static and media files.')
+
+    def handle(self, *args, **options):
+        out_dir = options['output'] or default_output_dir()
+        log = self.stdout.write if options['verbosity'] > 1 else None
+        result = bake(
+            out_dir,
+            processes=options['processes'],
+            force=options['force'],
+            static_url=options['static_url'],
+            media_url=options['media_url'],
+            host=options['host'],
+            assets=not options['no_assets'],
+            log=log,
+        )
+        self.stdout.write(
+            f"{result['rendered']} of {result['pages']} pages rendered, "
+            f"{result['removed']} stale files removed, {result['assets']} assets copied into {out_dir}."
+        )
+        if result['errors']:
+            raise CommandError(f"{len(result['errors'])} pages failed: " + '; '.join(result['errors']))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from farewell.sprites import build_friend_sprite
+
+
+class Command(BaseCommand):
+    help = 'Build the friend photo sprite atlas used by the roster pages.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Regenerate every tile instead of only the changed ones.',
+        )
+
+    def handle(self, *args, **options):
+        manifest = build_friend_sprite(force=options['force'])
+        if not manifest:
+            self.stdout.write('No friend photos found, nothing to build.')
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"Built {manifest['image']} with {len(manifest['entries'])} faces "
+            f"({manifest['cols']}x{manifest['rows']} tiles of {manifest['tile']}px)."
+        ))
@@ -0,0 +1,82 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+from farewell.cache_backends import SQLiteCache
+
+
+def _make_backends(tmpdir, max_entries):
+    params = {'TIMEOUT': 300, 'OPTIONS': {'MAX_ENTRIES': max_entries}}
+    return {
+        'LocMemCache': lambda: LocMemCache('cache-benchmark', params),
+        'FileBasedCache': lambda: FileBasedCache(os.path.join(tmpdir, 'filecache'), params),
+        'SQLiteCache': lambda: SQLiteCache(os.path.join(tmpdir, 'cache.sqlite3'), params),
+    }
+
+
+def _incr_worker(args):
+    tmpdir, name, max_entries, count = args
+    cache = _make_backends(tmpdir, max_entries)[name]()
+    for _ in range(count):
+        cache.incr('shared-counter')
+
+
+class Command(BaseCommand):
+    help = 'Compare the shared SQLite cache against LocMemCache and FileBasedCache.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ops', type=int, default=2000, help='Operations per benchmark.')
+        parser.add_argument('--value-size', type=int, default=2048, help='Bytes per cached value.')
+        parser.add_argument('--processes', type=int, default=4,
+                            help='Worker processes for the cross-process incr check.')
+
+    def handle(self, *args, **options):
+        ops = options['ops']
+        value = 'x' * options['value_size']
+        keys = [f'bench-{i}' for i in range(ops)]
+        tmpdir = tempfile.mkdtemp(prefix='farewell-cache-bench-')
+        try:
+            backends = _make_backends(tmpdir, max_entries=ops * 2)
+            self.stdout.write(f"{'backend':<16}{'set':>10}{'get hit':>10}{'get miss':>10}"
+                              f"{'set_many':>10}{'get_many':>10}{'incr':>10}   (ops/sec)")
+            for name, factory in backends.items():
+                cache = factory()
+                cache.clear()
+                results = [
+                    self._rate(ops, lambda: [cache.set(k, value) for k in keys]),
+                    self._rate(ops, lambda: [cache.get(k) for k in keys]),
+                    self._rate(ops, lambda: [cache.get(k + '-missing') for k in keys]),
+                    self._rate(ops, lambda: [cache.set_many({k: value for k in keys[i:i + 50]})
+                                             for i in range(0, ops, 50)]),
+                    self._rate(ops, lambda: [cache.get_many(keys[i:i + 50]) for i in range(0, ops, 50)]),
+                ]
+                cache.set('counter', 0)
+                results.append(self._rate(ops, lambda: [cache.incr('counter') for _ in keys]))
+                self.stdout.write(f'{name:<16}' + ''.join(f'{r:>10,.0f}' for r in results))
+
+            self.stdout.write('')
+            self.stdout.write(f"Cross-process incr ({options['processes']} processes):")
+            per_process = max(1, ops // options['processes'])
+            expected = per_process * options['processes']
+            for name, factory in backends.items():
+                cache = factory()
+                cache.set('shared-counter', 0)
+                ctx = multiprocessing.get_context('fork')
+                with ctx.Pool(options['processes']) as pool:
+                    pool.map(_incr_worker, [(tmpdir, name, ops * 2, per_process)] * options['processes'])
+                seen = cache.get('shared-counter')
+                verdict = self.style.SUCCESS('shared') if seen == expected else self.style.WARNING('not shared')
+                self.stdout.write(f'  {name:<16}{seen:>8} / {expected}  {verdict}')
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+    def _rate(self, ops, fn):
+        start = time.perf_counter()
+        fn()
+        return ops / max(time.perf_counter() - start, 1e-9)
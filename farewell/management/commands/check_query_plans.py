@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from farewell.queryplans import run_audit
+
+
+class Command(BaseCommand):
+    help = (
+        'Render every page against a seeded throwaway database and fail if any '
+        'query needs a full table scan or a temporary B-tree.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=int, default=1,
+                            help='Multiply the amount of seed data.')
+
+    def handle(self, *args, **options):
+        results = run_audit(options['scale'])
+        failures = 0
+        for view_name, queries in sorted(results.items()):
+            bad = [(sql, plan, problems) for sql, plan, problems in queries if problems]
+            failures += len(bad)
+            if not bad and options['verbosity'] < 2:
+                continue
+            status = self.style.ERROR('FAIL') if bad else self.style.SUCCESS('ok  ')
+            self.stdout.write(f'{status} {view_name} ({len(queries)} queries)')
+            for sql, plan, problems in (queries if options['verbosity'] > 1 else bad):
+                self.stdout.write(f'     {" ".join(sql.split())[:160]}')
+                for detail in plan:
+                    self.stdout.write(f'       | {detail}')
+                for problem in problems:
+                    self.stdout.write(self.style.WARNING(f'       ! {problem}'))
+
+        if failures:
+            raise CommandError(f'{failures} queries with bad plans across {len(results)} pages.')
+        self.stdout.write(self.style.SUCCESS(f'All query plans OK across {len(results)} pages.'))
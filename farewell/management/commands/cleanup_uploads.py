@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from farewell.resumable import cleanup_stale
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete resumable upload sessions with no activity for a while, '
+        'and any staging directories left without a session. Run it from cron.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ttl', type=int, default=None,
+                            help='Seconds of inactivity before a session is abandoned '
+                                 '(default: FAREWELL_UPLOAD_SESSION_TTL or 24h).')
+
+    def handle(self, *args, **options):
+        sessions, directories = cleanup_stale(options['ttl'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Removed {sessions} stale upload sessions and {directories} staging directories.'
+        ))
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+
+from farewell import batches
+from farewell.ndjson import DEFAULT_BATCH_SIZE, DEFAULT_EXCLUDE, export
+
+
+class Command(BaseCommand):
+    help = (
+        'Stream every farewell row to an NDJSON file (jsonl fixture format, .gz to compress), '
+        'optionally with a tar of the media files, in constant memory.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help="File to write; '-' for stdout.")
+        parser.add_argument('--media', default=None,
+                            help='Also write the referenced media files to this tar (.tar.gz to compress).')
+        parser.add_argument('--exclude', action='append', default=None,
+                            help='Model to leave out, e.g. farewell.RequestProfile (repeatable; '
+                                 f"default: {', '.join(DEFAULT_EXCLUDE)}).")
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help='Rows fetched per database round trip.')
+        parser.add_argument('--database', default=None,
+                            help="Database alias (default: the batch's database).")
+
+    def handle(self, *args, **options):
+        # Keep stdout clean when the data itself goes there
+        out = self.stderr if options['output'] == '-' else self.stdout
+        log = out.write if options['verbosity'] > 1 else None
+        stats, media = export(
+            options['output'],
+            exclude=options['exclude'] if options['exclude'] is not None else DEFAULT_EXCLUDE,
+            media_path=options['media'],
+            batch_size=options['batch_size'],
+            using=options['database'] or batches.current().database,
+            log=log,
+        )
+        if options['verbosity']:
+            for line in stats.lines():
+                out.write(line)
+            if media:
+                out.write(f'{media.files} media files archived, {media.missing} missing.')
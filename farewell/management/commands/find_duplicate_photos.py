@@ -0,0 +1,115 @@
+from django.core.management.base import BaseCommand
+from django.db import router, transaction
+from PIL import Image
+
+from farewell import phash
+from farewell.models import EventPhoto
+
+
+class Command(BaseCommand):
+    help = (
+        'Cluster near-duplicate album photos across all events by perceptual '
+        'hash, hashing any photos that have none yet.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threshold', type=int, default=phash.threshold_setting(),
+                            help='Maximum Hamming distance between near-duplicates.')
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--delete', action='store_true',
+                            help='Delete the photos within --threshold of the oldest in each cluster.')
+
+    def handle(self, *args, **options):
+        hashed = self.backfill(options['batch_size'])
+        if hashed:
+            self.stdout.write(f'Hashed {hashed} photos that had no perceptual hash.')
+
+        rows = list(
+            EventPhoto.objects.exclude(phash='').order_by('pk')
+            .values_list('pk', 'phash', 'event_id', 'image')
+        )
+        clusters = self.cluster(rows, options['threshold'])
+        if not clusters:
+            self.stdout.write(self.style.SUCCESS('No near-duplicates found.'))
+            return
+
+        by_pk = {pk: (phash.from_hex(hex_hash), event_id, image) for pk, hex_hash, event_id, image in rows
+                 if hex_hash != '-'}
+        storage = EventPhoto._meta.get_field('image').storage
+        reclaimable = 0
+        doomed = []
+        for members in clusters:
+            keep, *others = sorted(members)
+            self.stdout.write(f'Cluster of {len(members)} (keeping #{keep} {by_pk[keep][2]}):')
+            for pk in others:
+                value, event_id, image = by_pk[pk]
+                # Clusters are chained, so a member can be far from the one kept
+                distance = phash.hamming(value, by_pk[keep][0])
+                if distance > options['threshold']:
+                    self.stdout.write(f'  #{pk} event {event_id} {image} ({distance} bits from #{keep}, kept)')
+                    continue
+                try:
+                    size = storage.size(image)
+                except OSError:
+                    size = 0
+                reclaimable += size
+                doomed.append(pk)
+                self.stdout.write(f'  #{pk} event {event_id} {image} ({size // 1024} KB)')
+
+        self.stdout.write(
+            f'{len(clusters)} clusters, {len(doomed)} duplicates, '
+            f'{reclaimable / 1024 / 1024:.1f} MB reclaimable.'
+        )
+        if options['delete']:
+            for photo in EventPhoto.objects.filter(pk__in=doomed):
+                photo.image.delete(save=False)
+                photo.delete()
+            self.stdout.write(self.style.SUCCESS(f'Deleted {len(doomed)} duplicate photos.'))
+
+    def backfill(self, batch_size):
+        hashed = 0
+        while True:
+            batch = list(EventPhoto.objects.filter(phash='').exclude(image='').order_by('pk')[:batch_size])
+            if not batch:
+                return hashed
+            with transaction.atomic(using=router.db_for_write(EventPhoto)):
+                for photo in batch:
+                    try:
+                        with photo.image.open('rb') as fh:
+                            photo.set_phash(phash.dhash(fh))
+                    except (OSError, ValueError, Image.DecompressionBombError):
+                        # Unreadable or missing file: mark it so it isn't retried forever
+                        photo.phash = '-'
+                    EventPhoto.objects.filter(pk=photo.pk).update(
+                        phash=photo.phash,
+                        phash_band0=photo.phash_band0, phash_band1=photo.phash_band1,
+                        phash_band2=photo.phash_band2, phash_band3=photo.phash_band3,
+                    )
+                    hashed += 1
+
+    def cluster(self, rows, threshold):
+        """Union-find over BK-tree neighbours. Returns lists of pks, 2+ each."""
+        parent = {}
+
+        def find(pk):
+            while parent[pk] != pk:
+                parent[pk] = parent[parent[pk]]
+                pk = parent[pk]
+            return pk
+
+        tree = phash.BKTree()
+        for pk, hex_hash, _event_id, _image in rows:
+            if hex_hash == '-':
+                continue
+            value = phash.from_hex(hex_hash)
+            parent[pk] = pk
+            for other, _distance in tree.search(value, threshold):
+                root_a, root_b = find(pk), find(other)
+                if root_a != root_b:
+                    parent[max(root_a, root_b)] = min(root_a, root_b)
+            tree.add(value, pk)
+
+        groups = {}
+        for pk in parent:
+            groups.setdefault(find(pk), []).append(pk)
+        return [members for members in groups.values() if len(members) > 1]
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from farewell import batches
+from farewell.ndjson import DEFAULT_BATCH_SIZE, import_
+
+
+class Command(BaseCommand):
+    help = (
+        'Load a file written by export_data in bulk_create batches, one transaction '
+        'per batch, and optionally unpack its media tar into MEDIA_ROOT.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help="File to read; '-' for stdin.")
+        parser.add_argument('--media', default=None, help='Media tar written by export_data --media.')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help='Rows per INSERT and per transaction.')
+        parser.add_argument('--ignore-existing', action='store_true',
+                            help='Skip rows whose primary key already exists instead of failing.')
+        parser.add_argument('--database', default=None,
+                            help="Database alias (default: the batch's database).")
+
+    def handle(self, *args, **options):
+        log = self.stdout.write if options['verbosity'] > 1 else None
+        try:
+            stats = import_(
+                options['input'],
+                media_path=options['media'],
+                batch_size=options['batch_size'],
+                ignore_conflicts=options['ignore_existing'],
+                using=options['database'] or batches.current().database,
+                log=log,
+            )
+        except IntegrityError as exc:
+            raise CommandError(
+                f'{exc}. Batches before this one are already committed; '
+                'rerun with --ignore-existing to skip rows that are there.'
+            )
+        if options['verbosity']:
+            for line in stats.lines():
+                self.stdout.write(line)
@@ -0,0 +1,36 @@
+import os
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from farewell import batches
+
+
+class Command(BaseCommand):
+    help = (
+        "Create or update the farewell tables in every batch's own database "
+        '(FAREWELL_BATCHES). The main batch uses the default database; migrate that as usual.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('slugs', nargs='*', metavar='batch',
+                            help='Only these batches (default: all of them).')
+
+    def handle(self, *args, **options):
+        try:
+            selected = [batches.get(slug) for slug in options['slugs']]
+        except LookupError as exc:
+            raise CommandError(exc)
+        selected = selected or [batch for batch in batches.registry().values() if batch.slug]
+        if not selected:
+            self.stdout.write('No batches configured in FAREWELL_BATCHES.')
+            return
+        for batch in selected:
+            connection = connections[batch.database]
+            if connection.vendor == 'sqlite':
+                os.makedirs(os.path.dirname(os.path.abspath(connection.settings_dict['NAME'])), exist_ok=True)
+            self.stdout.write(f'Migrating {batch.slug} ({batch.database})...')
+            call_command('migrate', database=batch.database, interactive=False,
+                         verbosity=options['verbosity'], stdout=self.stdout, stderr=self.stderr)
+        self.stdout.write(self.style.SUCCESS(f'Migrated {len(selected)} batches.'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from farewell.stats import rebuild
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the stats page counters from scratch, e.g. after loading data '
+        'without signals or changing TIME_ZONE. Normally they are kept current as rows change.'
+    )
+
+    def handle(self, *args, **options):
+        counters = rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {counters} stat counters.'))
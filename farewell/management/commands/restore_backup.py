@@ -0,0 +1,35 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from farewell import batches
+from farewell.backup import database_path, restore, verify
+
+
+class Command(BaseCommand):
+    help = (
+        'Restore a backup snapshot: its database over db.sqlite3 and its files under MEDIA_ROOT. '
+        'Stop the site first.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('snapshot', help='Snapshot directory.')
+        parser.add_argument('--database-path', default=None,
+                            help='Write the database here instead of over the configured one.')
+        parser.add_argument('--media-root', default=None,
+                            help="Write the media files here instead of the batch's MEDIA_ROOT directory.")
+        parser.add_argument('--force', action='store_true',
+                            help='Overwrite an existing database.')
+
+    def handle(self, *args, **options):
+        snapshot = options['snapshot']
+        problems = verify(snapshot)
+        if problems:
+            for problem in problems:
+                self.stderr.write(problem)
+            raise CommandError('The snapshot is incomplete; run verify_backup for details.')
+        target = options['database_path'] or database_path()
+        if os.path.exists(target) and not options['force']:
+            raise CommandError(f'{target} exists; pass --force to overwrite it.')
+        files = restore(snapshot, target, options['media_root'] or batches.media_root())
+        self.stdout.write(self.style.SUCCESS(f'Restored the database to {target} and {files} media files.'))
@@ -0,0 +1,115 @@
+import os
+import time
+
+from django.apps import apps
+from django.core.files.storage import FileSystemStorage
+from django.core.management.base import BaseCommand
+from django.db import models, router, transaction
+
+from farewell.uploads import ShardedUploadTo
+
+
+def sharded_fields():
+    """(model, field) for every file field using a ShardedUploadTo."""
+    for model in apps.get_app_config('farewell').get_models():
+        for field in model._meta.concrete_fields:
+            if isinstance(field, models.FileField) and isinstance(field.upload_to, ShardedUploadTo):
+                yield model, field
+
+
+class Command(BaseCommand):
+    help = (
+        'Move media files uploaded before sharding into their sharded '
+        'subdirectories, rewriting the stored paths in batches while the site stays up.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--pause', type=float, default=0.0,
+                            help='Seconds to sleep between batches to leave room for live traffic.')
+        parser.add_argument('--keep-old', action='store_true',
+                            help='Leave the old files in place (delete them later by hand).')
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        total_moved = 0
+        friends_moved = False
+        for model, field in sharded_fields():
+            moved = self.shard_field(model, field, options)
+            total_moved += moved
+            if moved and model._meta.model_name == 'friend':
+                friends_moved = True
+            if moved or options['verbosity'] > 1:
+                self.stdout.write(f'{model._meta.label}.{field.name}: {moved} files moved')
+
+        if friends_moved and not options['dry_run']:
+            # Sprite tiles are keyed by photo path, so refresh the atlas
+            from farewell.sprites import build_friend_sprite
+            build_friend_sprite()
+
+        verb = 'Would move' if options['dry_run'] else 'Moved'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {total_moved} files.'))
+
+    def shard_field(self, model, field, options):
+        storage = field.storage
+        upload_to = field.upload_to
+        moved = 0
+        last_pk = 0
+        base_qs = model.objects.exclude(**{field.name: ''}).exclude(**{f'{field.name}__isnull': True})
+        while True:
+            rows = list(
+                base_qs.filter(pk__gt=last_pk).order_by('pk')
+                .values_list('pk', field.attname)[:options['batch_size']]
+            )
+            if not rows:
+                return moved
+            last_pk = rows[-1][0]
+
+            batch = []
+            for pk, old_name in rows:
+                if upload_to.is_sharded(old_name) or not storage.exists(old_name):
+                    continue
+                new_name = storage.get_available_name(upload_to(None, old_name))
+                batch.append((pk, old_name, new_name))
+            if options['dry_run']:
+                moved += len(batch)
+                continue
+
+            # Copy first: pages rendered before the update keep working
+            for _pk, old_name, new_name in batch:
+                self.copy(storage, old_name, new_name)
+
+            done = []
+            with transaction.atomic(using=router.db_for_write(model)):
+                for pk, old_name, new_name in batch:
+                    # Only rewrite rows nobody changed since we read them
+                    updated = model.objects.filter(pk=pk, **{field.attname: old_name}).update(
+                        **{field.attname: new_name}
+                    )
+                    done.append((old_name, new_name, updated))
+
+            for old_name, new_name, updated in done:
+                if updated:
+                    moved += 1
+                    if not options['keep_old']:
+                        storage.delete(old_name)
+                else:
+                    storage.delete(new_name)
+
+            if options['pause']:
+                time.sleep(options['pause'])
+
+    def copy(self, storage, old_name, new_name):
+        if isinstance(storage, FileSystemStorage):
+            new_path = storage.path(new_name)
+            os.makedirs(os.path.dirname(new_path), exist_ok=True)
+            try:
+                # Same filesystem: a hard link is instant and uses no space
+                os.link(storage.path(old_name), new_path)
+                return
+            except OSError:
+                pass
+        with storage.open(old_name) as fh:
+            saved = storage.save(new_name, fh)
+        if saved != new_name:
+            raise RuntimeError(f'Storage renamed {new_name} to {saved} unexpectedly')
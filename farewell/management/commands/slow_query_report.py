@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from farewell import slowqueries
+
+UNITS = {'m': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_age(value):
+    """'30m', '6h', '2d' -> seconds."""
+    try:
+        return float(value[:-1]) * UNITS[value[-1]]
+    except (KeyError, ValueError, IndexError):
+        raise CommandError(f'Use a number followed by m, h or d, not {value!r}.')
+
+
+class Command(BaseCommand):
+    help = (
+        'Summarize the slow-query log: the statements that cost the most database time in total, '
+        'with the views and code lines that ran them.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=20, help='How many statements to list (default 20).')
+        parser.add_argument('--since', help='Only entries newer than this, e.g. 30m, 6h or 2d.')
+        parser.add_argument('--view', help='Only queries run by this view, e.g. farewell:event_detail.')
+        parser.add_argument('--log', help='Log file to read (default: FAREWELL_SLOW_QUERIES LOG_FILE).')
+        parser.add_argument('--sql-width', type=int, default=160, help='Characters of SQL to show.')
+
+    def handle(self, *args, **options):
+        path = options['log'] or slowqueries.get_config()['LOG_FILE']
+        if not slowqueries.log_files(path):
+            raise CommandError(f'No slow-query log at {path}.')
+        since = time.time() - parse_age(options['since']) if options['since'] else None
+        found = slowqueries.aggregate(slowqueries.read(path), since=since, view=options['view'])
+        if not found:
+            self.stdout.write('No matching entries.')
+            return
+
+        entries = sum(item.entries for item in found.values())
+        self.stdout.write(f'{entries} entries, {len(found)} distinct statements. '
+                          'Sampled queries count with their sampling weight.\n')
+        self.stdout.write(f"{'#':>3} {'total ms':>12} {'est. calls':>11} {'slow':>6} {'mean ms':>9} "
+                          f"{'max ms':>9}  fingerprint")
+        width = options['sql_width']
+        for rank, item in enumerate(slowqueries.top(found, options['top']), 1):
+            self.stdout.write(
+                f'{rank:>3} {item.total_ms:>12.1f} {item.calls:>11.0f} {item.slow:>6} {item.mean_ms:>9.2f} '
+                f'{item.max_ms:>9.2f}  {item.key}'
+            )
+            sql = item.sql if len(item.sql) <= width else item.sql[:width - 1] + '…'
+            self.stdout.write(f'    {sql}')
+            others = len(item.views) - 1
+            self.stdout.write(f'    view: {item.top_view()}' + (f' (+{others} more)' if others else ''))
+            if item.top_origin():
+                self.stdout.write(f'    from: {item.top_origin()}')
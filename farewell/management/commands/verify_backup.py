@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from farewell.backup import backup_root, snapshots, verify
+
+
+class Command(BaseCommand):
+    help = (
+        'Check that a backup snapshot can be restored: the database is intact and '
+        'every stored image or file path has its content in the backup.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('snapshot', nargs='?', default=None,
+                            help='Snapshot directory (default: the newest one).')
+        parser.add_argument('--dest', default=None,
+                            help='Backup directory (default: FAREWELL_BACKUP_DIR or BASE_DIR/backups).')
+
+    def handle(self, *args, **options):
+        snapshot = options['snapshot']
+        if snapshot is None:
+            existing = snapshots(options['dest'] or backup_root())
+            if not existing:
+                raise CommandError('No snapshots found.')
+            snapshot = existing[-1]
+        problems = verify(snapshot)
+        for problem in problems:
+            self.stderr.write(problem)
+        if problems:
+            raise CommandError(f'{len(problems)} problems in {snapshot}.')
+        self.stdout.write(self.style.SUCCESS(f'{snapshot} is complete.'))
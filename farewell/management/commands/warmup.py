@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from farewell.warmup import warm_up
+
+
+class Command(BaseCommand):
+    help = 'Precompile templates and render every named route once.'
+
+    def handle(self, *args, **options):
+        templates, routes, elapsed = warm_up()
+        if options['verbosity'] > 1:
+            for view_name, (status, ms) in sorted(routes.items()):
+                self.stdout.write(f'  {status}  {ms:7.1f} ms  {view_name}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Compiled {templates} templates and rendered {len(routes)} routes in {elapsed:.0f} ms.'
+        ))
@@ -0,0 +1,337 @@
+"""
+Prometheus metrics, correct across gunicorn workers.
+
+Each worker counts in memory (a dict update under a lock) and writes its
+numbers to ``<DIR>/<pid>.json`` at most every ``FLUSH_INTERVAL`` seconds,
+at the end of a request. ``/metrics`` adds up the files of all workers.
+Counters and histograms of workers that have exited are folded into
+``archive.json`` so totals never go backwards when gunicorn recycles a
+worker; gauges are only reported for live workers, labelled by pid.
+
+What is measured:
+
+* request latency per URL name, and responses per status code,
+* database queries and database time per request,
+* cache hits and misses of the SQLite cache, by key area,
+* upload bytes received and album photos processed, by outcome,
+* image processing time (perceptual hashes, sprite tiles and atlases),
+* requests in flight, queue wait and degraded mode per worker
+  (see farewell.loadshed).
+
+Settings (all optional) live in ``settings.FAREWELL_METRICS``::
+
+    FAREWELL_METRICS = {
+        'ENABLED': True,
+        'DIR': BASE_DIR / 'metrics',    # one file per worker
+        'FLUSH_INTERVAL': 5,            # seconds
+        'ALLOWED_IPS': [],              # client IPs, see throttling.client_ip
+        'TOKEN': None,                  # or a bearer token Prometheus sends
+    }
+
+Staff users may always read ``/metrics``. Behind the nginx proxy every
+request comes from 127.0.0.1, so don't list loopback in ALLOWED_IPS.
+"""
+import bisect
+import hmac
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from .throttling import client_ip
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows runs a single process
+    fcntl = None
+
+ARCHIVE_NAME = 'archive.json'
+LOCK_NAME = '.lock'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+IMAGE_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# name: (type, help, histogram buckets)
+METRICS = {
+    'farewell_http_request_duration_seconds': (
+        'histogram', 'Time to produce a response, by URL name.', LATENCY_BUCKETS),
+    'farewell_http_responses_total': ('counter', 'Responses sent, by URL name and status code.', None),
+    'farewell_db_queries_per_request': (
+        'histogram', 'Database queries run by one request, by URL name.', QUERY_COUNT_BUCKETS),
+    'farewell_db_seconds_per_request': (
+        'histogram', 'Time one request spent in the database, by URL name.', LATENCY_BUCKETS),
+    'farewell_cache_requests_total': ('counter', 'Cache lookups, by key area and result (hit or miss).', None),
+    'farewell_upload_bytes_total': ('counter', 'Photo bytes received, by upload path.', None),
+    'farewell_upload_files_total': ('counter', 'Album photos processed, by outcome.', None),
+    'farewell_image_processing_seconds': (
+        'histogram', 'Time spent decoding and processing images, by step.', IMAGE_BUCKETS),
+    'farewell_worker_in_flight': ('gauge', 'Requests a worker is running.', None),
+    'farewell_worker_queue_wait_ms': ('gauge', 'Average time requests waited for a worker.', None),
+    'farewell_worker_degraded': ('gauge', '1 while a worker is shedding load.', None),
+}
+
+DEFAULTS = {
+    'ENABLED': True,
+    'DIR': None,
+    'FLUSH_INTERVAL': 5,
+    'ALLOWED_IPS': [],
+    'TOKEN': None,
+}
+
+
+def get_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'FAREWELL_METRICS', {}))
+    if not config['DIR']:
+        config['DIR'] = os.path.join(settings.BASE_DIR, 'metrics')
+    config['DIR'] = str(config['DIR'])
+    return config
+
+
+class Registry:
+    """The numbers of one process."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {}        # (name, labels) -> number
+        self.histograms = {}    # (name, labels) -> [bucket counts..., +Inf count, sum]
+        self.pid = None
+        self.flushed = 0.0
+
+    def _reset_after_fork(self):
+        # A forked child must not report its parent's numbers as its own
+        if self.pid != os.getpid():
+            self.values.clear()
+            self.histograms.clear()
+            self.pid = os.getpid()
+            self.flushed = 0.0
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self._reset_after_fork()
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self._reset_after_fork()
+            self.values[key] = value
+
+    def observe(self, name, value, **labels):
+        buckets = METRICS[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self._reset_after_fork()
+            counts = self.histograms.get(key)
+            if counts is None:
+                counts = self.histograms[key] = [0] * (len(buckets) + 1) + [0.0]
+            counts[bisect.bisect_left(buckets, value)] += 1
+            counts[-1] += value
+
+    def dump(self):
+        with self.lock:
+            self._reset_after_fork()
+            return {
+                'values': [[name, list(labels), value] for (name, labels), value in self.values.items()],
+                'histograms': [[name, list(labels), counts] for (name, labels), counts in self.histograms.items()],
+            }
+
+
+registry = Registry()
+inc = registry.inc
+observe = registry.observe
+
+
+@contextmanager
+def timer(name, **labels):
+    """Observe how long the ``with`` block took."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def cache_area(key):
+    """``farewell:activity:...`` -> ``activity``; keeps the label set small."""
+    parts = str(key).split(':', 2)
+    return parts[1] if len(parts) > 2 and parts[0] == 'farewell' else 'other'
+
+
+# ----- per-process files -----
+
+def _write_json(path, data):
+    directory = os.path.dirname(path)
+    with tempfile.NamedTemporaryFile('w', dir=directory, suffix='.tmp', delete=False) as fh:
+        json.dump(data, fh, separators=(',', ':'))
+    os.replace(fh.name, path)
+
+
+def _read_json(path):
+    try:
+        with open(path) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def _worker_gauges():
+    from .loadshed import load
+
+    status = load.status()
+    pid = str(os.getpid())
+    registry.set('farewell_worker_in_flight', status['in_flight'], pid=pid)
+    registry.set('farewell_worker_queue_wait_ms', status['queue_ms'], pid=pid)
+    registry.set('farewell_worker_degraded', int(status['degraded']), pid=pid)
+
+
+def flush(config=None, force=False):
+    """Write this process's numbers, unless that was done less than FLUSH_INTERVAL ago."""
+    config = config or get_config()
+    now = time.monotonic()
+    if not force and registry.pid == os.getpid() and now - registry.flushed < config['FLUSH_INTERVAL']:
+        return
+    _worker_gauges()
+    os.makedirs(config['DIR'], exist_ok=True)
+    with _locked(config['DIR']):
+        path = os.path.join(config['DIR'], f'{os.getpid()}.json')
+        if not registry.flushed:
+            # A file left by an earlier process with the same pid
+            _archive(config['DIR'], [path])
+        _write_json(path, registry.dump())
+    registry.flushed = now
+
+
+@contextmanager
+def _locked(directory):
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(directory, LOCK_NAME), 'a') as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def _alive(pid):
+    if pid == os.getpid():
+        return True
+    if os.name != 'posix':
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _merge(total, data, gauges=True):
+    for name, labels, value in data.get('values', []):
+        kind = METRICS.get(name, ('gauge',))[0]
+        if kind == 'gauge' and not gauges:
+            continue
+        key = (name, tuple(tuple(pair) for pair in labels))
+        total['values'][key] = total['values'].get(key, 0) + value
+    for name, labels, counts in data.get('histograms', []):
+        key = (name, tuple(tuple(pair) for pair in labels))
+        existing = total['histograms'].get(key)
+        total['histograms'][key] = counts if existing is None else [a + b for a, b in zip(existing, counts)]
+
+
+def _archive(directory, paths):
+    """Fold the counters and histograms of dead workers' files into the archive."""
+    archive_path = os.path.join(directory, ARCHIVE_NAME)
+    total = {'values': {}, 'histograms': {}}
+    _merge(total, _read_json(archive_path) or {})
+    merged = False
+    for path in paths:
+        data = _read_json(path)
+        if data is None:
+            continue
+        _merge(total, data, gauges=False)
+        merged = True
+        os.unlink(path)
+    if merged:
+        _write_json(archive_path, {
+            'values': [[name, list(labels), value] for (name, labels), value in total['values'].items()],
+            'histograms': [[name, list(labels), counts] for (name, labels), counts in total['histograms'].items()],
+        })
+
+
+def collect(config=None):
+    """``{'values': {...}, 'histograms': {...}}`` summed over every worker, past and present."""
+    config = config or get_config()
+    flush(config, force=True)
+    directory = config['DIR']
+    total = {'values': {}, 'histograms': {}}
+    with _locked(directory):
+        live, dead = [], []
+        for filename in os.listdir(directory):
+            stem, ext = os.path.splitext(filename)
+            if ext == '.json' and stem.isdigit():
+                (live if _alive(int(stem)) else dead).append(os.path.join(directory, filename))
+        _archive(directory, dead)
+        for path in [os.path.join(directory, ARCHIVE_NAME)] + live:
+            _merge(total, _read_json(path) or {})
+    return total
+
+
+# ----- exposition -----
+
+def may_read(request, config):
+    """Staff, the configured bearer token, or a request from ALLOWED_IPS."""
+    token = config['TOKEN']
+    if token and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return True
+    if config['ALLOWED_IPS'] and client_ip(request) in config['ALLOWED_IPS']:
+        return True
+    return request.user.is_staff
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+
+def _number(value):
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def render(total):
+    """Prometheus text format (version 0.0.4)."""
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'histogram':
+            for (metric, labels), counts in sorted(total['histograms'].items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(list(buckets) + ['+Inf'], counts[:-1]):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_labels(labels + (("le", bound),))} {cumulative}')
+                lines.append(f'{name}_sum{_labels(labels)} {_number(counts[-1])}')
+                lines.append(f'{name}_count{_labels(labels)} {cumulative}')
+        else:
+            for (metric, labels), value in sorted(total['values'].items()):
+                if metric == name:
+                    lines.append(f'{name}{_labels(labels)} {_number(value)}')
+    return '\n'.join(lines) + '\n'
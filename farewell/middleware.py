@@ -0,0 +1,265 @@
+import contextlib
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.db import connections
+from django.utils.cache import patch_cache_control, patch_vary_headers
+
+from . import compression, loadshed, metrics, profiling, slowqueries
+from .hints import build_link_header, hints_for
+
+
+def _is_public(request):
+    """A GET of one of the read-only pages that look the same for everybody."""
+    from .urls import PUBLIC_URL_NAMES
+
+    match = request.resolver_match
+    return (
+        match.namespace == 'farewell' and match.url_name in PUBLIC_URL_NAMES
+        and request.method in ('GET', 'HEAD')
+    )
+
+
+class PreloadHintsMiddleware:
+    """
+    Adds ``Link: rel=preload`` headers for the CSS/JS bundle and for the
+    critical images a view declared through ``farewell.hints.preload``.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        match = getattr(request, 'resolver_match', None)
+        if (
+            match is None
+            or request.method != 'GET'
+            or response.status_code != 200
+            or 'text/html' not in response.get('Content-Type', '')
+        ):
+            return response
+        config = hints_for(match.view_name, match.namespace)
+        if config:
+            header = build_link_header(request, config)
+            if header:
+                existing = response.get('Link')
+                response['Link'] = f'{existing}, {header}' if existing else header
+        return response
+
+
+class CompressionMiddleware:
+    """
+    Compresses responses with the best of br / zstd / gzip the client
+    accepts. Should sit near the top of MIDDLEWARE, like Django's own
+    GZipMiddleware, so it sees the final body.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.config = compression.get_config()
+        self.encodings = compression.available_encodings(self.config)
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        config = self.config
+
+        if response.has_header('Content-Encoding') or request.method == 'HEAD':
+            return response
+        if 'no-transform' in response.get('Cache-Control', ''):
+            return response
+        content_type = response.get('Content-Type', '').split(';')[0].strip()
+        if not any(content_type.startswith(t) for t in config['CONTENT_TYPES']):
+            return response
+        if response.streaming:
+            if not config['STREAMING'] or getattr(response, 'is_async', False):
+                return response
+        elif len(response.content) < config['MIN_SIZE']:
+            return response
+
+        # The body depends on Accept-Encoding from here on, even if the
+        # client gets it uncompressed.
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = compression.negotiate(request.META.get('HTTP_ACCEPT_ENCODING', ''), self.encodings)
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            response.streaming_content = compression.compress_stream(response.streaming_content, encoding)
+            # The compressed length isn't known up front
+            del response.headers['Content-Length']
+        else:
+            timeout = config['CACHE_TIMEOUT'] if compression.is_shared(response) else 0
+            compressed = compression.compress_cached(response.content, encoding, timeout)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        # A strong ETag would claim byte-equality with the identity body
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+
+class PublicPageMiddleware:
+    """
+    Keeps the public pages (PUBLIC_URL_NAMES) free of sessions and CSRF
+    cookies, so they carry no ``Vary: Cookie`` and shared caches can keep
+    one copy per URL. Their forms get an empty CSRF token (see
+    farewell.context_processors.deferred_csrf) that base.html fetches from
+    ``/csrf/`` when the form is submitted. Must come after
+    AuthenticationMiddleware.
+
+    ``FAREWELL_PUBLIC_MAX_AGE`` (seconds, default 0) lets browsers and
+    proxies reuse the pages without asking again.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.max_age = getattr(settings, 'FAREWELL_PUBLIC_MAX_AGE', 0)
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if not getattr(request, '_farewell_public', False):
+            return response
+        # ``?msg=`` carries a flash message for whoever was just redirected
+        # here; anything that set a cookie or read the session is personal
+        if 'msg' in request.GET or response.cookies or request.session.accessed:
+            return response
+        if response.status_code == 200 and not response.has_header('Cache-Control'):
+            freshness = {'max_age': self.max_age} if self.max_age else {}
+            patch_cache_control(response, public=True, **freshness)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._farewell_public = _is_public(request)
+        if request._farewell_public:
+            # Public pages render the same for everybody; don't load the session to find out who
+            request.user = AnonymousUser()
+        return None
+
+
+class RequestProfilerMiddleware:
+    """
+    Profiles a request when a staff user asks for it with ``?_profile=1``
+    or ``X-Farewell-Profile: 1``. Must come after AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if profiling.is_requested(request) and request.user.is_staff:
+            return profiling.profile_request(self.get_response, request)
+        return self.get_response(request)
+
+
+class LoadSheddingMiddleware:
+    """
+    Degraded mode under overload, see farewell.loadshed. Must come after
+    AuthenticationMiddleware so staff can be let through.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.config = loadshed.get_config()
+
+    def __call__(self, request):
+        if not self.config['ENABLED']:
+            return self.get_response(request)
+        loadshed.load.started(loadshed.queue_wait_ms(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            # Streamed bodies are sent after this, so they don't count
+            loadshed.load.finished()
+        if getattr(request, '_farewell_public', False) and not response.has_header('X-Farewell-Degraded'):
+            loadshed.remember(request, response, self.config)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not self.config['ENABLED']:
+            return None
+        match = request.resolver_match
+        request._farewell_public = _is_public(request)
+        if match.namespace == 'admin' or not loadshed.load.overloaded(self.config):
+            return None
+        if request._farewell_public:
+            return loadshed.degraded_page(request, self.config)
+        if match.view_name in self.config['EXPENSIVE_VIEWS'] and not request.user.is_staff:
+            return loadshed.unavailable(request, self.config)
+        return None
+
+
+class _QueryTimer:
+    """execute_wrapper counting the queries of one request and their time."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - start
+
+
+class MetricsMiddleware:
+    """
+    Records request latency, status codes and database use per URL name
+    for ``/metrics`` (see farewell.metrics). Should come first, right
+    after BatchMiddleware, so it times everything else. The body of a streamed
+    response is sent after it returns and isn't part of the latency.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.config = metrics.get_config()
+
+    def __call__(self, request):
+        if not self.config['ENABLED']:
+            return self.get_response(request)
+        timer = _QueryTimer()
+        start = time.perf_counter()
+        with contextlib.ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(timer))
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - start
+
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unresolved'
+        metrics.observe('farewell_http_request_duration_seconds', elapsed, view=view)
+        metrics.inc('farewell_http_responses_total', view=view, status=str(response.status_code))
+        metrics.observe('farewell_db_queries_per_request', timer.count, view=view)
+        metrics.observe('farewell_db_seconds_per_request', timer.seconds, view=view)
+        metrics.flush(self.config)
+        return response
+
+
+class SlowQueryMiddleware:
+    """
+    Logs slow and sampled queries with the view that ran them, see
+    farewell.slowqueries. Goes right after MetricsMiddleware so queries
+    made by other middleware are covered too.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.config = slowqueries.get_config()
+
+    def __call__(self, request):
+        if not self.config['ENABLED']:
+            return self.get_response(request)
+        logger = slowqueries.QueryLogger(request, self.config)
+        with contextlib.ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(logger))
+            return self.get_response(request)
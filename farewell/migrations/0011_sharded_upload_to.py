@@ -0,0 +1,44 @@
+# Generated by Django 4.2.30 on 2026-10-19 19:42
+
+from django.db import migrations, models
+import farewell.uploads
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('farewell', '0010_requestprofile'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='event',
+            name='cover_image',
+            field=models.ImageField(help_text='Cover image for the event album', upload_to=farewell.uploads.ShardedUploadTo('event_covers', scheme='date')),
+        ),
+        migrations.AlterField(
+            model_name='eventphoto',
+            name='image',
+            field=models.ImageField(help_text='The photo', upload_to=farewell.uploads.ShardedUploadTo('event_photos')),
+        ),
+        migrations.AlterField(
+            model_name='friend',
+            name='photo',
+            field=models.ImageField(help_text='Profile photo of the friend', upload_to=farewell.uploads.ShardedUploadTo('friend_photos')),
+        ),
+        migrations.AlterField(
+            model_name='funaward',
+            name='icon_or_image',
+            field=models.ImageField(blank=True, help_text='Optional icon/image for the award', null=True, upload_to=farewell.uploads.ShardedUploadTo('awards', scheme='date')),
+        ),
+        migrations.AlterField(
+            model_name='staff',
+            name='photo',
+            field=models.ImageField(blank=True, help_text='Optional photo of the staff member', null=True, upload_to=farewell.uploads.ShardedUploadTo('staff_photos')),
+        ),
+        migrations.AlterField(
+            model_name='timelineevent',
+            name='image',
+            field=models.ImageField(blank=True, help_text='Optional image for this milestone', null=True, upload_to=farewell.uploads.ShardedUploadTo('timeline', scheme='date')),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.30 on 2026-10-19 19:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('farewell', '0011_sharded_upload_to'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='eventphoto',
+            name='duplicate_of',
+            field=models.ForeignKey(blank=True, help_text='An earlier photo this one looks almost identical to', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='near_duplicates', to='farewell.eventphoto'),
+        ),
+        migrations.AddField(
+            model_name='eventphoto',
+            name='phash',
+            field=models.CharField(blank=True, editable=False, help_text='64-bit perceptual hash (dHash) as hex', max_length=16),
+        ),
+        migrations.AddField(
+            model_name='eventphoto',
+            name='phash_band0',
+            field=models.PositiveIntegerField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='eventphoto',
+            name='phash_band1',
+            field=models.PositiveIntegerField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='eventphoto',
+            name='phash_band2',
+            field=models.PositiveIntegerField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='eventphoto',
+            name='phash_band3',
+            field=models.PositiveIntegerField(blank=True, db_index=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.30 on 2026-10-19 19:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('farewell', '0012_eventphoto_phash'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['date'], name='event_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='eventphoto',
+            index=models.Index(fields=['event', '-uploaded_at'], name='eventphoto_event_uploaded_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='friend',
+            index=models.Index(fields=['name'], name='friend_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='requestprofile',
+            index=models.Index(fields=['created_at'], name='requestprofile_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='secretintel',
+            index=models.Index(fields=['friend', '-created_at'], name='secretintel_friend_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='slammessage',
+            index=models.Index(fields=['friend', '-created_at'], name='slammessage_friend_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='staff',
+            index=models.Index(fields=['name'], name='staff_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='staffsecretmessage',
+            index=models.Index(fields=['staff', '-created_at'], name='staffsecret_staff_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='timelineevent',
+            index=models.Index(fields=['date'], name='timelineevent_date_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 19:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('farewell', '0013_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='eventphoto',
+            name='sha256',
+            field=models.CharField(blank=True, db_index=True, editable=False, help_text='SHA-256 of the uploaded file, computed while it streamed in', max_length=64),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.30 on 2026-10-19 19:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('farewell', '0014_eventphoto_sha256'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('filename', models.CharField(max_length=255)),
+                ('size', models.PositiveBigIntegerField(help_text='Declared file size in bytes')),
+                ('chunk_size', models.PositiveIntegerField()),
+                ('caption', models.CharField(blank=True, max_length=300)),
+                ('outcome', models.CharField(blank=True, choices=[('', 'In progress'), ('assembling', 'Assembling'), ('saved', 'Saved'), ('duplicate', 'Skipped as duplicate'), ('rejected', 'Rejected')], max_length=12)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='upload_sessions', to='farewell.event')),
+                ('photo', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='farewell.eventphoto')),
+            ],
+            options={
+                'verbose_name': 'Upload Session',
+                'verbose_name_plural': 'Upload Sessions',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['updated_at'], name='uploadsession_updated_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-19 20:03
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('farewell', '0016_changestamp'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Activity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('slam_message', 'Slam message'), ('event_photo', 'Event photo'), ('fun_award', 'Fun award'), ('timeline_event', 'Timeline event'), ('secret_intel', 'Secret intel'), ('staff', 'Staff')], max_length=20)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('group', models.CharField(max_length=50)),
+                ('target', models.CharField(help_text='Who or what it is about', max_length=200)),
+                ('detail', models.CharField(blank=True, max_length=300)),
+                ('link', models.CharField(blank=True, max_length=200)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Activity',
+                'verbose_name_plural': 'Activity',
+                'ordering': ['-id'],
+                'indexes': [models.Index(fields=['kind', 'object_id'], name='activity_kind_object_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.30 on 2026-10-19 20:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('farewell', '0017_activity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(choices=[('scraps_by_friend', 'Slam messages per friend'), ('awards_by_friend', 'Fun awards per friend'), ('photos_by_event', 'Photos per album'), ('uploads_by_day', 'Photo uploads per day'), ('posts_by_hour', 'Messages and photos per hour of day')], max_length=30)),
+                ('key', models.CharField(max_length=50)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Stat Counter',
+                'verbose_name_plural': 'Stat Counters',
+                'indexes': [models.Index(fields=['metric', '-value', 'key'], name='statcounter_metric_value_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='statcounter',
+            constraint=models.UniqueConstraint(fields=('metric', 'key'), name='statcounter_metric_key_uniq'),
+        ),
+    ]
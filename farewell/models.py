@@ -1,4 +1,11 @@
-from django.db import models
+import math
+import uuid
+
+from django.db import IntegrityError, models, router, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .uploads import ShardedUploadTo
 
 
 class Friend(models.Model):
@@ -16,7 +23,7 @@ class Friend(models.Model):
     )
     
     photo = models.ImageField(
-        upload_to='friend_photos/',
+        upload_to=ShardedUploadTo('friend_photos'),
         help_text="Profile photo of the friend"
     )
     
@@ -66,6 +73,9 @@ class Friend(models.Model):
         ordering = ['name']
         verbose_name = 'Friend'
         verbose_name_plural = 'Friends'
+        indexes = [
+            models.Index(fields=['name'], name='friend_name_idx'),
+        ]
     
     def __str__(self):
         return f"{self.name} ({self.nickname})"
@@ -80,7 +90,7 @@ class Event(models.Model):
         help_text="Event name (e.g., Pongal Celebration, College Tour)"
     )
     cover_image = models.ImageField(
-        upload_to='event_covers/',
+        upload_to=ShardedUploadTo('event_covers', scheme='date'),
         help_text="Cover image for the event album"
     )
     date = models.DateField(
@@ -96,6 +106,9 @@ class Event(models.Model):
         ordering = ['-date']
         verbose_name = 'Event'
         verbose_name_plural = 'Events'
+        indexes = [
+            models.Index(fields=['date'], name='event_date_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -112,7 +125,7 @@ class EventPhoto(models.Model):
         help_text="The event this photo belongs to"
     )
     image = models.ImageField(
-        upload_to='event_photos/',
+        upload_to=ShardedUploadTo('event_photos'),
         help_text="The photo"
     )
     caption = models.CharField(
@@ -122,15 +135,53 @@ class EventPhoto(models.Model):
         help_text="Optional caption for the photo"
     )
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    sha256 = models.CharField(
+        max_length=64,
+        blank=True,
+        editable=False,
+        db_index=True,
+        help_text="SHA-256 of the uploaded file, computed while it streamed in"
+    )
+
+    # ===== Near-duplicate detection (see farewell/phash.py) =====
+    phash = models.CharField(
+        max_length=16,
+        blank=True,
+        editable=False,
+        help_text="64-bit perceptual hash (dHash) as hex"
+    )
+    phash_band0 = models.PositiveIntegerField(null=True, blank=True, editable=False, db_index=True)
+    phash_band1 = models.PositiveIntegerField(null=True, blank=True, editable=False, db_index=True)
+    phash_band2 = models.PositiveIntegerField(null=True, blank=True, editable=False, db_index=True)
+    phash_band3 = models.PositiveIntegerField(null=True, blank=True, editable=False, db_index=True)
+    duplicate_of = models.ForeignKey(
+        'self',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='near_duplicates',
+        help_text="An earlier photo this one looks almost identical to"
+    )
 
     class Meta:
         ordering = ['-uploaded_at']
         verbose_name = 'Event Photo'
         verbose_name_plural = 'Event Photos'
+        indexes = [
+            # Album pages: WHERE event_id = ? ORDER BY uploaded_at DESC
+            models.Index(fields=['event', '-uploaded_at'], name='eventphoto_event_uploaded_idx'),
+        ]
 
     def __str__(self):
         return f"{self.event.title} - {self.caption or 'Photo'}"
 
+    def set_phash(self, value):
+        """Store a 64-bit perceptual hash and its lookup bands."""
+        from .phash import bands, to_hex
+        self.phash = to_hex(value)
+        (self.phash_band0, self.phash_band1,
+         self.phash_band2, self.phash_band3) = bands(value)
+
 
 class TimelineEvent(models.Model):
     """
@@ -147,7 +198,7 @@ class TimelineEvent(models.Model):
         help_text="What happened during this event"
     )
     image = models.ImageField(
-        upload_to='timeline/',
+        upload_to=ShardedUploadTo('timeline', scheme='date'),
         blank=True,
         null=True,
         help_text="Optional image for this milestone"
@@ -157,6 +208,9 @@ class TimelineEvent(models.Model):
         ordering = ['date']
         verbose_name = 'Timeline Event'
         verbose_name_plural = 'Timeline Events'
+        indexes = [
+            models.Index(fields=['date'], name='timelineevent_date_idx'),
+        ]
 
     def __str__(self):
         return f"{self.title} ({self.date})"
@@ -177,7 +231,7 @@ class FunAward(models.Model):
         help_text="The friend who won this award"
     )
     icon_or_image = models.ImageField(
-        upload_to='awards/',
+        upload_to=ShardedUploadTo('awards', scheme='date'),
         blank=True,
         null=True,
         help_text="Optional icon/image for the award"
@@ -214,6 +268,9 @@ class SlamMessage(models.Model):
         ordering = ['-created_at']
         verbose_name = 'Slam Message'
         verbose_name_plural = 'Slam Messages'
+        indexes = [
+            models.Index(fields=['friend', '-created_at'], name='slammessage_friend_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.sender_name} → {self.friend.name}"
@@ -244,7 +301,7 @@ class Staff(models.Model):
         help_text="Secret roll number for the Vault"
     )
     photo = models.ImageField(
-        upload_to='staff_photos/',
+        upload_to=ShardedUploadTo('staff_photos'),
         blank=True,
         null=True,
         help_text="Optional photo of the staff member"
@@ -255,6 +312,9 @@ class Staff(models.Model):
         ordering = ['name']
         verbose_name = 'Staff'
         verbose_name_plural = 'Staff'
+        indexes = [
+            models.Index(fields=['name'], name='staff_name_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} — {self.award_title}"
@@ -276,6 +336,9 @@ class StaffSecretMessage(models.Model):
         ordering = ['-created_at']
         verbose_name = 'Staff Secret Message'
         verbose_name_plural = 'Staff Secret Messages'
+        indexes = [
+            models.Index(fields=['staff', '-created_at'], name='staffsecret_staff_created_idx'),
+        ]
 
     def __str__(self):
         return f"Secret Message for {self.staff.name}"
@@ -297,6 +360,202 @@ class SecretIntel(models.Model):
         ordering = ['-created_at']
         verbose_name = 'Secret Intel'
         verbose_name_plural = 'Secret Intels'
+        indexes = [
+            models.Index(fields=['friend', '-created_at'], name='secretintel_friend_created_idx'),
+        ]
 
     def __str__(self):
         return f"Secret Intel for {self.friend.name}"
+
+
+class RequestProfile(models.Model):
+    """
+    A profiled request captured on demand by a staff user (see farewell/profiling.py).
+    """
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=500)
+    view_name = models.CharField(max_length=200, blank=True)
+    username = models.CharField(max_length=150, blank=True)
+    status_code = models.PositiveSmallIntegerField()
+    duration_ms = models.FloatField(help_text="Wall time under the profiler")
+    sql_count = models.PositiveIntegerField(default=0)
+    sql_time_ms = models.FloatField(default=0)
+    data = models.TextField(help_text="speedscope JSON document")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = 'Request Profile'
+        verbose_name_plural = 'Request Profiles'
+        indexes = [
+            models.Index(fields=['created_at'], name='requestprofile_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:.0f} ms)"
+
+    @classmethod
+    def prune(cls, keep):
+        """Delete all but the ``keep`` most recent profiles."""
+        stale = cls.objects.values_list('pk', flat=True)[keep:]
+        cls.objects.filter(pk__in=list(stale)).delete()
+
+
+class UploadSession(models.Model):
+    """
+    A resumable, chunked upload of one album photo (see farewell/resumable.py).
+    """
+    OUTCOME_CHOICES = [
+        ('', 'In progress'),
+        ('assembling', 'Assembling'),
+        ('saved', 'Saved'),
+        ('duplicate', 'Skipped as duplicate'),
+        ('rejected', 'Rejected'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    event = models.ForeignKey(
+        Event,
+        on_delete=models.CASCADE,
+        related_name='upload_sessions'
+    )
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField(help_text="Declared file size in bytes")
+    chunk_size = models.PositiveIntegerField()
+    caption = models.CharField(max_length=300, blank=True)
+    outcome = models.CharField(max_length=12, choices=OUTCOME_CHOICES, blank=True)
+    photo = models.ForeignKey(
+        EventPhoto,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = 'Upload Session'
+        verbose_name_plural = 'Upload Sessions'
+        indexes = [
+            models.Index(fields=['updated_at'], name='uploadsession_updated_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.filename} → {self.event.title}"
+
+    @property
+    def chunk_count(self):
+        return max(1, math.ceil(self.size / self.chunk_size))
+
+    def chunk_length(self, index):
+        """Expected byte length of chunk ``index``."""
+        if index < self.chunk_count - 1:
+            return self.chunk_size
+        return self.size - self.chunk_size * (self.chunk_count - 1)
+
+
+class ChangeStamp(models.Model):
+    """
+    Version counter for a piece of public content (``friend``, ``event:12``).
+    Bumped by farewell/signals.py whenever a row behind it changes, so
+    ``manage.py bake`` only re-renders pages whose stamps moved.
+    """
+    key = models.CharField(max_length=100, unique=True)
+    version = models.PositiveBigIntegerField(default=0)
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = 'Change Stamp'
+        verbose_name_plural = 'Change Stamps'
+
+    def __str__(self):
+        return f"{self.key} v{self.version}"
+
+    @classmethod
+    def bump(cls, *keys):
+        now = timezone.now()
+        for key in dict.fromkeys(keys):
+            if cls.objects.filter(key=key).update(version=F('version') + 1, changed_at=now):
+                continue
+            try:
+                with transaction.atomic(using=router.db_for_write(cls)):
+                    cls.objects.create(key=key, version=1, changed_at=now)
+            except IntegrityError:
+                # Someone else created it meanwhile
+                cls.objects.filter(key=key).update(version=F('version') + 1, changed_at=now)
+
+    @classmethod
+    def versions(cls, keys):
+        """``{key: version}`` for ``keys``; unknown keys are 0."""
+        found = dict(cls.objects.filter(key__in=list(keys)).values_list('key', 'version'))
+        return {key: found.get(key, 0) for key in keys}
+
+
+class Activity(models.Model):
+    """
+    One line of the "what's new" feed. Appended by farewell/signals.py
+    when content is added, so the feed never has to query every table.
+    """
+    KIND_CHOICES = [
+        ('slam_message', 'Slam message'),
+        ('event_photo', 'Event photo'),
+        ('fun_award', 'Fun award'),
+        ('timeline_event', 'Timeline event'),
+        ('secret_intel', 'Secret intel'),
+        ('staff', 'Staff'),
+    ]
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.PositiveBigIntegerField()
+    # Rows with the same kind and group are shown as one "3 new ..." line
+    group = models.CharField(max_length=50)
+    target = models.CharField(max_length=200, help_text="Who or what it is about")
+    detail = models.CharField(max_length=300, blank=True)
+    link = models.CharField(max_length=200, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-id']
+        verbose_name = 'Activity'
+        verbose_name_plural = 'Activity'
+        indexes = [
+            # Removing the entries of a deleted row
+            models.Index(fields=['kind', 'object_id'], name='activity_kind_object_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()}: {self.target}"
+
+
+class StatCounter(models.Model):
+    """
+    One materialized aggregate for the stats page, e.g. the number of
+    slam messages of friend 7. Kept current by farewell/signals.py and
+    recomputed by ``manage.py rebuild_stats``.
+    """
+    METRIC_CHOICES = [
+        ('scraps_by_friend', 'Slam messages per friend'),
+        ('awards_by_friend', 'Fun awards per friend'),
+        ('photos_by_event', 'Photos per album'),
+        ('uploads_by_day', 'Photo uploads per day'),
+        ('posts_by_hour', 'Messages and photos per hour of day'),
+    ]
+    metric = models.CharField(max_length=30, choices=METRIC_CHOICES)
+    # Friend or event pk, 'YYYY-MM-DD', or the hour '00'..'23'
+    key = models.CharField(max_length=50)
+    value = models.BigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Stat Counter'
+        verbose_name_plural = 'Stat Counters'
+        constraints = [
+            models.UniqueConstraint(fields=['metric', 'key'], name='statcounter_metric_key_uniq'),
+        ]
+        indexes = [
+            # Leaderboards: WHERE metric = ? ORDER BY value DESC
+            models.Index(fields=['metric', '-value', 'key'], name='statcounter_metric_value_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.metric}[{self.key}] = {self.value}"
@@ -0,0 +1,324 @@
+"""
+Streaming NDJSON export and import of everything in the farewell app.
+
+``dumpdata`` builds the whole fixture in memory and ``loaddata`` saves
+rows one by one, which falls over on big SlamMessage and EventPhoto
+tables. ``manage.py export_data`` / ``import_data`` instead
+
+* write one object per line in Django's ``jsonl`` fixture format (so
+  ``loaddata`` still reads the files), models in foreign key order,
+  each table read with a server-side ``iterator()``;
+* read the file line by line and insert ``bulk_create`` batches, each
+  batch in its own transaction;
+* optionally pack the media files the rows point at into a tar, written
+  and extracted as a stream.
+
+Memory use is one batch of rows, whatever the size of the data.
+
+Rows are exported in primary key order. A self reference to a later row
+(``EventPhoto.duplicate_of``) is inserted as NULL and filled in once the
+whole table is in, from a small spill file.
+"""
+import contextlib
+import gzip
+import json
+import os
+import sys
+import tarfile
+import tempfile
+import time
+
+from django.apps import apps
+from django.core import serializers
+from django.core.management.color import no_style
+from django.db import connections, models, router, transaction
+
+APP_LABEL = 'farewell'
+# Bookkeeping that only means something on the install that wrote it
+DEFAULT_EXCLUDE = ['farewell.ChangeStamp', 'farewell.UploadSession']
+DEFAULT_BATCH_SIZE = 1000
+
+
+def export_models(exclude=()):
+    """Models of the app, every model after the ones it has foreign keys to."""
+    excluded = {label.lower() for label in exclude}
+    pending = [
+        model for model in apps.get_app_config(APP_LABEL).get_models()
+        if model._meta.label_lower not in excluded
+    ]
+    ordered = []
+    while pending:
+        for model in pending:
+            dependencies = {
+                field.related_model for field in model._meta.concrete_fields
+                if field.is_relation and field.related_model is not model
+            }
+            if not dependencies & set(pending):
+                ordered.append(model)
+                pending.remove(model)
+                break
+        else:
+            raise ValueError('Circular foreign keys between ' + ', '.join(m._meta.label for m in pending))
+    return ordered
+
+
+def open_stream(path, mode):
+    """Open ``path`` as text, gzipped if it ends in .gz; ``-`` is stdin/stdout."""
+    if path == '-':
+        return contextlib.nullcontext(sys.stdout if 'w' in mode else sys.stdin)
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def file_fields(model):
+    return [field for field in model._meta.concrete_fields if isinstance(field, models.FileField)]
+
+
+class Throughput:
+    """Row counts and rows/sec, per model and overall."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.rows = {}
+        self.seconds = {}
+
+    @contextlib.contextmanager
+    def model(self, model):
+        label = model._meta.label
+        self.rows.setdefault(label, 0)
+        started = time.monotonic()
+        try:
+            yield label
+        finally:
+            self.seconds[label] = self.seconds.get(label, 0.0) + time.monotonic() - started
+
+    def add(self, label, count=1):
+        self.rows[label] += count
+
+    @property
+    def total(self):
+        return sum(self.rows.values())
+
+    @staticmethod
+    def rate(rows, seconds):
+        return rows / seconds if seconds > 0 else float(rows)
+
+    def lines(self):
+        for label, rows in self.rows.items():
+            seconds = self.seconds.get(label, 0.0)
+            yield f'{label}: {rows} rows in {seconds:.2f}s ({self.rate(rows, seconds):,.0f} rows/sec)'
+        elapsed = time.monotonic() - self.started
+        yield f'Total: {self.total} rows in {elapsed:.2f}s ({self.rate(self.total, elapsed):,.0f} rows/sec)'
+
+
+# ----- export -----
+
+class MediaArchive:
+    """Adds files from storage to a tar written as a stream."""
+
+    def __init__(self, path):
+        mode = 'w|gz' if path.endswith(('.gz', '.tgz')) else 'w|'
+        self.tar = tarfile.open(path, mode)
+        self.files = 0
+        self.missing = 0
+
+    def add(self, field_file):
+        storage, name = field_file.storage, field_file.name
+        try:
+            size = storage.size(name)
+            fh = storage.open(name, 'rb')
+        except (FileNotFoundError, OSError):
+            self.missing += 1
+            return
+        info = tarfile.TarInfo(name)
+        info.size = size
+        with fh:
+            self.tar.addfile(info, fh)
+        # TarFile remembers every member it wrote; nothing reads them back
+        # while writing, so keep memory flat on big albums
+        self.tar.members.clear()
+        self.files += 1
+
+    def close(self):
+        self.tar.close()
+
+
+def _counted(model, rows, label, stats, media):
+    fields = file_fields(model) if media else []
+    for obj in rows:
+        for field in fields:
+            field_file = getattr(obj, field.attname)
+            if field_file:
+                media.add(field_file)
+        stats.add(label)
+        yield obj
+
+
+def export(path, exclude=DEFAULT_EXCLUDE, media_path=None, batch_size=DEFAULT_BATCH_SIZE,
+           using='default', log=None):
+    """Write every row to ``path``; returns the Throughput (and the MediaArchive, or None)."""
+    stats = Throughput()
+    media = MediaArchive(media_path) if media_path else None
+    serializer = serializers.get_serializer('jsonl')()
+    try:
+        with open_stream(path, 'w') as stream:
+            for model in export_models(exclude):
+                rows = model._base_manager.using(using).order_by('pk').iterator(chunk_size=batch_size)
+                with stats.model(model) as label:
+                    serializer.serialize(_counted(model, rows, label, stats, media), stream=stream)
+                if log:
+                    log(f'{label}: {stats.rows[label]} rows')
+    finally:
+        if media:
+            media.close()
+    return stats, media
+
+
+# ----- import -----
+
+@contextlib.contextmanager
+def _raw_timestamps(model):
+    """Keep the exported values of auto_now / auto_now_add fields."""
+    fields = [
+        field for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class _ModelLoader:
+    """Buffers the rows of one model and inserts them batch by batch."""
+
+    def __init__(self, model, using, batch_size, ignore_conflicts, stats):
+        self.model = model
+        self.using = using
+        self.batch_size = batch_size
+        self.ignore_conflicts = ignore_conflicts
+        self.stats = stats
+        self.label = model._meta.label
+        self.batch = []
+        self.self_refs = [
+            field for field in model._meta.concrete_fields
+            if field.is_relation and field.related_model is model and field.null
+        ]
+        self.fixups = None
+        self.fixup_count = 0
+        self.stats.rows.setdefault(self.label, 0)
+
+    def add(self, obj):
+        for field in self.self_refs:
+            target = getattr(obj, field.attname)
+            if target is not None and obj.pk is not None and target > obj.pk:
+                # Points at a row that isn't inserted yet
+                if self.fixups is None:
+                    self.fixups = tempfile.TemporaryFile('w+', encoding='utf-8')
+                self.fixups.write(json.dumps([field.attname, obj.pk, target]) + '\n')
+                self.fixup_count += 1
+                setattr(obj, field.attname, None)
+        self.batch.append(obj)
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.batch:
+            return
+        started = time.monotonic()
+        with transaction.atomic(using=self.using), _raw_timestamps(self.model):
+            self.model._base_manager.using(self.using).bulk_create(
+                self.batch, batch_size=self.batch_size, ignore_conflicts=self.ignore_conflicts,
+            )
+        self.stats.seconds[self.label] = self.stats.seconds.get(self.label, 0.0) + time.monotonic() - started
+        self.stats.add(self.label, len(self.batch))
+        self.batch = []
+
+    def finish(self):
+        self.flush()
+        if self.fixups is None:
+            return
+        self.fixups.seek(0)
+        manager = self.model._base_manager.using(self.using)
+        while True:
+            lines = [line for line in (self.fixups.readline() for _ in range(self.batch_size)) if line]
+            if not lines:
+                break
+            with transaction.atomic(using=self.using):
+                for attname, pk, target in map(json.loads, lines):
+                    manager.filter(pk=pk).update(**{attname: target})
+        self.fixups.close()
+
+
+def import_(path, media_path=None, batch_size=DEFAULT_BATCH_SIZE, ignore_conflicts=False,
+            using='default', log=None):
+    """
+    Load a file written by ``export``. Returns the Throughput. Rows that
+    already exist raise IntegrityError unless ``ignore_conflicts``.
+    """
+    from .models import ChangeStamp
+    from .stats import rebuild as rebuild_stats
+
+    stats = Throughput()
+    loader = None
+    touched = []
+    with open_stream(path, 'r') as stream:
+        for deserialized in serializers.deserialize('jsonl', stream, using=using, ignorenonexistent=True):
+            obj = deserialized.object
+            if not router.allow_migrate_model(using, type(obj)):
+                continue
+            if loader is None or loader.model is not type(obj):
+                if loader is not None:
+                    loader.finish()
+                    if log:
+                        log(f'{loader.label}: {stats.rows[loader.label]} rows')
+                loader = _ModelLoader(type(obj), using, batch_size, ignore_conflicts, stats)
+                touched.append(type(obj))
+            loader.add(obj)
+        if loader is not None:
+            loader.finish()
+            if log:
+                log(f'{loader.label}: {stats.rows[loader.label]} rows')
+
+    connection = connections[using]
+    sequence_sql = connection.ops.sequence_reset_sql(no_style(), touched)
+    if sequence_sql:
+        with connection.cursor() as cursor:
+            for sql in sequence_sql:
+                cursor.execute(sql)
+    # bulk_create sends no signals; let the bake notice the new rows and
+    # recount the stats page
+    ChangeStamp.bump(*(model._meta.model_name for model in touched))
+    if touched:
+        rebuild_stats()
+
+    if media_path:
+        extract_media(media_path)
+    return stats
+
+
+def extract_media(path, storage=None):
+    """Unpack a media tar into MEDIA_ROOT (or ``storage``), one member at a time."""
+    from django.core.files.storage import default_storage
+
+    storage = storage or default_storage
+    extracted = 0
+    with tarfile.open(path, 'r|*') as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+            name = os.path.normpath(member.name)
+            if name.startswith(('..', '/')) or os.path.isabs(name):
+                continue
+            fh = tar.extractfile(member)
+            if storage.exists(name):
+                storage.delete(name)
+            storage.save(name, fh)
+            tar.members.clear()
+            extracted += 1
+    return extracted
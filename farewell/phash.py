@@ -0,0 +1,154 @@
+"""
+Perceptual hashing for near-duplicate album photos.
+
+Each EventPhoto gets a 64-bit difference hash (dHash): the image is shrunk
+to 9x8 grayscale and each bit says whether a pixel is brighter than its
+right-hand neighbour. Burst shots and re-uploads of the same moment land
+within a few bits of each other.
+
+Lookups use multi-index hashing: the hash is split into four 16-bit bands,
+each stored in its own indexed column. Two hashes within Hamming distance
+``r <= 7`` must agree on at least one band up to a single bit (pigeonhole),
+so one indexed query probing every band value and its 16 one-bit
+neighbours finds every candidate, however big the album is. Larger
+thresholds would silently miss matches, so the setting is capped at 7.
+
+For offline clustering across all albums there is a BK-tree.
+"""
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Q
+from PIL import Image
+
+from . import metrics
+
+BANDS = 4
+BAND_BITS = 16
+BAND_MASK = (1 << BAND_BITS) - 1
+DEFAULT_THRESHOLD = 6
+# Furthest distance the band lookup is guaranteed to find (see module docstring)
+MAX_THRESHOLD = 2 * BANDS - 1
+
+
+def dhash(fileobj):
+    """64-bit difference hash of an image file object."""
+    with Image.open(fileobj) as img:
+        # JPEGs can be decoded at 1/8 scale, which is all we need
+        img.draft('L', (64, 64))
+        small = img.convert('L').resize((9, 8), Image.LANCZOS)
+        pixels = list(small.getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+def to_hex(value):
+    return f'{value:016x}'
+
+
+def from_hex(text):
+    return int(text, 16)
+
+
+def bands(value):
+    """Split a 64-bit hash into its four 16-bit bands, most significant first."""
+    return [(value >> (BAND_BITS * (BANDS - 1 - i))) & BAND_MASK for i in range(BANDS)]
+
+
+def _band_probes(band):
+    return [band] + [band ^ (1 << bit) for bit in range(BAND_BITS)]
+
+
+def candidate_filter(value):
+    """Q matching every row that could be within ``MAX_THRESHOLD`` of ``value``."""
+    query = Q()
+    for index, band in enumerate(bands(value)):
+        query |= Q(**{f'phash_band{index}__in': _band_probes(band)})
+    return query
+
+
+def threshold_setting():
+    threshold = getattr(settings, 'FAREWELL_PHASH_THRESHOLD', DEFAULT_THRESHOLD)
+    if not 0 <= threshold <= MAX_THRESHOLD:
+        raise ImproperlyConfigured(
+            f'FAREWELL_PHASH_THRESHOLD must be between 0 and {MAX_THRESHOLD}, got {threshold!r}.'
+        )
+    return threshold
+
+
+def check_upload(photo, fileobj):
+    """
+    Hash an unsaved EventPhoto's upload and point ``duplicate_of`` at the
+    closest near-duplicate already in the same album. Returns the match as
+    ``(pk, distance)``, or None. Unreadable images are left unhashed.
+    """
+    try:
+        with metrics.timer('farewell_image_processing_seconds', step='phash'):
+            value = dhash(fileobj)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+    finally:
+        fileobj.seek(0)
+    photo.set_phash(value)
+    match = find_near_duplicate(photo.event.photos.all(), value, threshold_setting())
+    if match:
+        photo.duplicate_of_id = match[0]
+    return match
+
+
+def find_near_duplicate(queryset, value, threshold=DEFAULT_THRESHOLD):
+    """
+    The closest row in ``queryset`` within ``threshold`` bits of ``value``,
+    as ``(pk, distance)``, or None.
+    """
+    if threshold > MAX_THRESHOLD:
+        raise ValueError(f'threshold {threshold} is beyond what the band lookup can find ({MAX_THRESHOLD})')
+    best = None
+    for pk, other in queryset.filter(candidate_filter(value)).values_list('pk', 'phash'):
+        distance = hamming(value, from_hex(other))
+        if distance <= threshold and (best is None or distance < best[1]):
+            best = (pk, distance)
+    return best
+
+
+class BKTree:
+    """Burkhard-Keller tree over Hamming distance."""
+
+    def __init__(self):
+        self.root = None
+
+    def add(self, value, item):
+        node = [value, item, {}]
+        if self.root is None:
+            self.root = node
+            return
+        current = self.root
+        while True:
+            distance = hamming(value, current[0])
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+
+    def search(self, value, threshold):
+        """Yield ``(item, distance)`` for every entry within ``threshold``."""
+        if self.root is None:
+            return
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= threshold:
+                yield node[1], distance
+            for child_distance, child in node[2].items():
+                if distance - threshold <= child_distance <= distance + threshold:
+                    stack.append(child)
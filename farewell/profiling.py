@@ -0,0 +1,226 @@
+"""
+On-demand request profiling for staff users.
+
+A staff user adds ``?_profile=1`` to any URL (or sends the
+``X-Farewell-Profile: 1`` header) and the request runs under a
+deterministic tracer (``sys.setprofile``). The result is stored as a
+RequestProfile row holding a speedscope file (https://www.speedscope.app)
+with three timelines:
+
+* Python  - every Python and C function call, as a flame chart
+* SQL     - each query with its wall time
+* Templates - each template render, including extends/include
+
+Nothing is installed until the first profiled request, and untriggered
+requests only pay for a query-string lookup in the middleware; the
+session is only loaded (for the staff check) once the trigger is set.
+"""
+import contextvars
+import json
+import os
+import sys
+import time
+
+from django.conf import settings
+from django.db import connections
+
+QUERY_PARAM = '_profile'
+HEADER = 'HTTP_X_FAREWELL_PROFILE'
+FALSY = {'', '0', 'false', 'no', 'off'}
+
+# Stops a pathological request from eating all memory while tracing
+MAX_EVENTS = 500_000
+
+_active = contextvars.ContextVar('farewell_profile', default=None)
+_template_hook_installed = False
+
+
+def is_requested(request):
+    """Cheap trigger check that doesn't touch the session."""
+    value = request.GET.get(QUERY_PARAM) or request.META.get(HEADER, '')
+    return value.strip().lower() not in FALSY
+
+
+class _Timeline:
+    """Collects open/close events for one speedscope 'evented' profile."""
+
+    def __init__(self, name, frames, frame_index):
+        self.name = name
+        self.frames = frames
+        self.frame_index = frame_index
+        self.events = []
+        self.stack = []
+
+    def frame(self, key, name, file=None, line=None):
+        index = self.frame_index.get(key)
+        if index is None:
+            index = self.frame_index[key] = len(self.frames)
+            entry = {'name': name}
+            if file:
+                entry['file'] = file
+                entry['line'] = line
+            self.frames.append(entry)
+        return index
+
+    def open(self, index, at):
+        self.stack.append(index)
+        self.events.append({'type': 'O', 'frame': index, 'at': at})
+
+    def close(self, at):
+        if self.stack:
+            self.events.append({'type': 'C', 'frame': self.stack.pop(), 'at': at})
+
+    def finish(self, at):
+        while self.stack:
+            self.close(at)
+        return {
+            'type': 'evented',
+            'name': self.name,
+            'unit': 'milliseconds',
+            'startValue': 0,
+            'endValue': at,
+            'events': self.events,
+        }
+
+
+class Profiler:
+    def __init__(self, label):
+        self.label = label
+        self.frames = []
+        self._frame_index = {}
+        self.python = _Timeline('Python', self.frames, self._frame_index)
+        self.sql = _Timeline('SQL', self.frames, self._frame_index)
+        self.templates = _Timeline('Templates', self.frames, self._frame_index)
+        self.queries = []
+        self._start = None
+        self._base = str(settings.BASE_DIR)
+
+    def now(self):
+        return (time.perf_counter() - self._start) * 1000
+
+    # ----- python tracer -----
+
+    def _trace(self, frame, event, arg):
+        timeline = self.python
+        if len(timeline.events) >= MAX_EVENTS:
+            return
+        if event == 'call':
+            code = frame.f_code
+            key = (code.co_filename, code.co_firstlineno, code.co_name)
+            index = self._frame_index.get(key)
+            if index is None:
+                filename = code.co_filename
+                short = os.path.relpath(filename, self._base) if filename.startswith(self._base) else filename
+                index = timeline.frame(key, code.co_name, short, code.co_firstlineno)
+            timeline.open(index, self.now())
+        elif event == 'c_call':
+            key = ('<c>', getattr(arg, '__qualname__', None) or repr(arg))
+            index = self._frame_index.get(key) or timeline.frame(key, key[1])
+            timeline.open(index, self.now())
+        elif event in ('return', 'c_return', 'c_exception'):
+            timeline.close(self.now())
+
+    # ----- sql and template spans -----
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        start = self.now()
+        index = self.sql.frame(('<sql>', sql), ' '.join(sql.split())[:200])
+        self.sql.open(index, start)
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            end = self.now()
+            self.sql.close(end)
+            self.queries.append({'sql': sql, 'ms': round(end - start, 3)})
+
+    def template_span(self, name):
+        index = self.templates.frame(('<template>', name), name)
+        self.templates.open(index, self.now())
+
+    # ----- running -----
+
+    def run(self, get_response, request):
+        _install_template_hook()
+        token = _active.set(self)
+        wrappers = [conn.execute_wrapper(self.execute_wrapper) for conn in connections.all()]
+        for wrapper in wrappers:
+            wrapper.__enter__()
+        self._start = time.perf_counter()
+        sys.setprofile(self._trace)
+        try:
+            response = get_response(request)
+            # Lazy template responses are rendered inside the profile too
+            if hasattr(response, 'render') and callable(response.render):
+                response.render()
+        finally:
+            sys.setprofile(None)
+            self.duration_ms = self.now()
+            for wrapper in reversed(wrappers):
+                wrapper.__exit__(None, None, None)
+            _active.reset(token)
+        return response
+
+    def speedscope(self):
+        end = self.duration_ms
+        return {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'name': self.label,
+            'exporter': 'farewell.profiling',
+            'shared': {'frames': self.frames},
+            'profiles': [
+                self.python.finish(end),
+                self.sql.finish(end),
+                self.templates.finish(end),
+            ],
+            'activeProfileIndex': 0,
+        }
+
+
+def _install_template_hook():
+    """Wrap Template._render once so renders are timed while a profile is active."""
+    global _template_hook_installed
+    if _template_hook_installed:
+        return
+    from django.template.base import Template
+
+    original = Template._render
+
+    def _render(self, context):
+        profiler = _active.get()
+        if profiler is None:
+            return original(self, context)
+        profiler.template_span(self.origin.template_name or self.name or '<string>')
+        try:
+            return original(self, context)
+        finally:
+            profiler.templates.close(profiler.now())
+
+    Template._render = _render
+    _template_hook_installed = True
+
+
+def profile_request(get_response, request):
+    """
+    Run the request under the profiler and store the result.
+    Returns the response with an ``X-Farewell-Profile-Id`` header.
+    """
+    from .models import RequestProfile
+
+    profiler = Profiler(f'{request.method} {request.get_full_path()}')
+    response = profiler.run(get_response, request)
+
+    match = getattr(request, 'resolver_match', None)
+    profile = RequestProfile.objects.create(
+        method=request.method,
+        path=request.get_full_path()[:500],
+        view_name=match.view_name if match else '',
+        username=request.user.get_username(),
+        status_code=response.status_code,
+        duration_ms=round(profiler.duration_ms, 2),
+        sql_count=len(profiler.queries),
+        sql_time_ms=round(sum(q['ms'] for q in profiler.queries), 2),
+        data=json.dumps(profiler.speedscope(), separators=(',', ':')),
+    )
+    RequestProfile.prune(getattr(settings, 'FAREWELL_PROFILE_KEEP', 50))
+    response['X-Farewell-Profile-Id'] = str(profile.pk)
+    return response
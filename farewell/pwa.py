@@ -0,0 +1,147 @@
+"""
+Offline-first support: web manifest and service worker.
+
+Visitors at the venue share one overloaded mobile network and keep
+reloading the same pages. The service worker (``/sw.js``)
+
+* precaches the app shell: an offline page rendered through base.html,
+  the stylesheet, the fonts and the htmx/confetti scripts,
+* serves the gallery, timeline and awards pages and the roster
+  thumbnails stale-while-revalidate, so a repeat visit paints from the
+  cache and only refreshes it in the background,
+* falls back to the offline page for any other navigation without signal.
+
+All caches are named after ``cache_version()``, a digest of the resolved
+static URLs (hashed by ManifestStaticFilesStorage in production) and the
+asset version. A deploy that changes any precached file changes the
+worker script, the browser installs the new worker and it drops the old
+caches.
+
+Each batch (see farewell.batches) gets a worker of its own: scoped to
+the batch's URL prefix, with its own cache names and version, and
+leaving other batches' pages and media alone.
+
+Overrides go in ``settings.FAREWELL_PWA`` and are merged over
+``DEFAULT_PWA``.
+"""
+import functools
+import hashlib
+import json
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.templatetags.static import static
+from django.urls import get_script_prefix, reverse
+
+from . import batches
+from .hints import asset_version
+
+DEFAULT_PWA = {
+    'name': 'Farewell Batch 2026 - The Unbreakable Squad',
+    'short_name': 'Farewell 2026',
+    'theme_color': '#2c1810',
+    'background_color': '#faf3e0',
+    'icon': 'images/pink_bottle.png',
+    # Static files (versioned like base.html links them)
+    'precache_static': ['css/main.css', 'images/pink_bottle.png'],
+    # Third-party shell assets, exactly as base.html loads them
+    'precache_urls': [
+        'https://fonts.googleapis.com/css2?family=Dancing+Script:wght@400;700&family=Caveat:wght@400;500;600;700'
+        '&family=Patrick+Hand&family=Special+Elite&family=Indie+Flower&family=Reenie+Beanie&display=swap',
+        'https://unpkg.com/htmx.org@1.9.10',
+        'https://cdn.jsdelivr.net/npm/canvas-confetti@1.9.3/dist/confetti.browser.min.js',
+    ],
+    # Immutable cross-origin files fetched by the shell (font files)
+    'runtime_origins': ['https://fonts.gstatic.com'],
+    'stale_while_revalidate': ['farewell:gallery', 'farewell:timeline', 'farewell:awards'],
+    # Media subdirectories served stale-while-revalidate (roster thumbnails)
+    'media_prefixes': ['friend_photos/', 'sprites/'],
+}
+
+
+def get_config():
+    config = dict(DEFAULT_PWA)
+    config.update(getattr(settings, 'FAREWELL_PWA', {}))
+    return config
+
+
+def precache_urls(config=None):
+    """Every URL the worker caches at install time."""
+    config = config or get_config()
+    urls = [reverse('farewell:offline')]
+    for name in config['precache_static']:
+        url = static(name)
+        # base.html links main.css with ?v=, the cache must match that URL
+        urls.append(f'{url}?v={asset_version()}' if name.endswith('.css') else url)
+    urls.extend(config['precache_urls'])
+    return urls
+
+
+def cache_version():
+    """Short digest that changes whenever one of the current batch's precached assets does."""
+    return _cache_version(batches.current().slug, get_script_prefix())
+
+
+@functools.lru_cache(maxsize=None)
+def _cache_version(slug, script_prefix):
+    config = get_config()
+    payload = json.dumps([slug, script_prefix, asset_version(), precache_urls(config), config],
+                         sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()[:12]
+
+
+def scope():
+    """The URL space the current batch's worker controls."""
+    return get_script_prefix()
+
+
+def worker_config():
+    """The settings object embedded in sw.js."""
+    config = get_config()
+    batch = batches.current()
+    media_url = settings.MEDIA_URL + (f'{batch.media_prefix}/' if batch.media_prefix else '')
+    return {
+        'version': cache_version(),
+        # Caches are per origin, so each batch's worker names its own
+        'cachePrefix': f'farewell-{batch.slug}:' if batch.slug else 'farewell-',
+        'offline': reverse('farewell:offline'),
+        'precache': precache_urls(config),
+        'runtimeOrigins': config['runtime_origins'],
+        'staleWhileRevalidate': [reverse(name) for name in config['stale_while_revalidate']],
+        'mediaPrefixes': [media_url + prefix for prefix in config['media_prefixes']],
+        # The main batch's scope contains the prefixed batches' ones
+        'otherBatches': [
+            f'{scope()}{other.prefix}/' for other in batches.registry().values()
+            if other.prefix and other is not batch
+        ],
+    }
+
+
+@functools.lru_cache(maxsize=None)
+def _icon_size(name):
+    path = finders.find(name)
+    if not path or not os.path.exists(path):
+        return 'any'
+    from PIL import Image
+    with Image.open(path) as img:
+        return f'{img.width}x{img.height}'
+
+
+def web_manifest():
+    config = get_config()
+    return {
+        'name': config['name'],
+        'short_name': config['short_name'],
+        'start_url': reverse('farewell:index'),
+        'scope': scope(),
+        'display': 'standalone',
+        'theme_color': config['theme_color'],
+        'background_color': config['background_color'],
+        'icons': [{
+            'src': static(config['icon']),
+            'sizes': _icon_size(config['icon']),
+            'type': 'image/png',
+            'purpose': 'any maskable',
+        }],
+    }
@@ -0,0 +1,171 @@
+"""
+Query-plan audit.
+
+Renders every public page against a throwaway, seeded SQLite database,
+records each SELECT it runs and asks SQLite for its ``EXPLAIN QUERY PLAN``.
+A plan is reported when it
+
+* scans a table without an index while filtering or ordering it, or
+* needs a temporary B-tree to sort, group or de-duplicate rows.
+
+Unfiltered, unordered reads of a whole table (e.g. the awards list) are
+scans by design and are not reported, and neither are unfiltered reads of
+the first N rows in index order (the newest activity entries).
+
+Used by ``manage.py check_query_plans``, which exits non-zero on any
+problem so it can run in CI.
+"""
+import datetime
+import re
+
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .warmup import named_routes
+
+# Pages that only make sense as form posts or are not part of the site
+SKIP_ROUTES = {'farewell:delete_friend', 'farewell:delete_event', 'farewell:delete_photo',
+               'farewell:delete_award', 'farewell:delete_milestone', 'farewell:delete_staff',
+               'farewell:delete_scrap'}
+
+_SCAN = re.compile(r'^SCAN (\w+)(?: AS \w+)?$')
+_FILTERED = re.compile(r'\b(WHERE|ORDER BY|GROUP BY)\b')
+_NARROWED = re.compile(r'\b(WHERE|GROUP BY)\b')
+_LIMITED = re.compile(r'\bLIMIT\b')
+
+AUDIT_SETTINGS = {
+    'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                           'LOCATION': 'farewell-query-plans'}},
+    'FAREWELL_WRITE_BEHIND': {'ENABLED': False},
+    'FAREWELL_THROTTLE_ENABLED': False,
+    'FAREWELL_SPRITE_BACKGROUND': False,
+}
+
+
+def seed(scale=1):
+    """
+    Fill the (empty) database with a realistic batch. Uses bulk_create so
+    no signals fire and no media files are touched.
+    """
+    from .models import (
+        Event, EventPhoto, Friend, FunAward, SecretIntel, SlamMessage, Staff,
+        StaffSecretMessage, TimelineEvent,
+    )
+
+    now = timezone.now()
+    today = datetime.date(2025, 3, 1)
+    friends = Friend.objects.bulk_create(
+        Friend(name=f'Friend {i:04d}', nickname=f'nick{i}', photo=f'friend_photos/{i}.jpg',
+               memory_text='Memory ' * 40, roll_number=f'R{i:05d}')
+        for i in range(120 * scale)
+    )
+    staff = Staff.objects.bulk_create(
+        Staff(name=f'Staff {i:03d}', award_title='Legend', famous_quote='Study!',
+              roll_number=f'S{i:05d}')
+        for i in range(15 * scale)
+    )
+    events = Event.objects.bulk_create(
+        Event(title=f'Event {i}', cover_image=f'event_covers/{i}.jpg',
+              date=today - datetime.timedelta(days=i * 9))
+        for i in range(25 * scale)
+    )
+    EventPhoto.objects.bulk_create(
+        EventPhoto(event=event, image=f'event_photos/{event.pk}-{j}.jpg',
+                   uploaded_at=now - datetime.timedelta(minutes=j))
+        for event in events for j in range(40)
+    )
+    TimelineEvent.objects.bulk_create(
+        TimelineEvent(title=f'Milestone {i}', date=today - datetime.timedelta(days=i * 30),
+                      description='Something happened')
+        for i in range(40 * scale)
+    )
+    FunAward.objects.bulk_create(
+        FunAward(title=f'Award {i}', winner=friends[i % len(friends)]) for i in range(30 * scale)
+    )
+    SlamMessage.objects.bulk_create(
+        SlamMessage(friend=friend, sender_name='Someone', message='Miss you!')
+        for friend in friends for _ in range(20)
+    )
+    SecretIntel.objects.bulk_create(
+        SecretIntel(friend=friend, text='Classified') for friend in friends for _ in range(5)
+    )
+    StaffSecretMessage.objects.bulk_create(
+        StaffSecretMessage(staff=member, text='Classified') for member in staff for _ in range(10)
+    )
+    from .stats import rebuild
+    rebuild()
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if not many and sql.lstrip().upper().startswith('SELECT'):
+            self.queries.append((sql, params))
+        return execute(sql, params, many, context)
+
+
+def explain(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def problems_in(sql, plan):
+    """Human-readable problems with one query plan."""
+    found = []
+    # ORDER BY <indexed> LIMIT n with no WHERE walks n rows in index order
+    bounded = (_LIMITED.search(sql) and not _NARROWED.search(sql)
+               and not any('USE TEMP B-TREE' in detail for detail in plan))
+    for detail in plan:
+        if 'USE TEMP B-TREE' in detail:
+            found.append(detail)
+            continue
+        match = _SCAN.match(detail)
+        if match and not match.group(1).startswith('subquery') and _FILTERED.search(sql) and not bounded:
+            found.append(f'full scan of {match.group(1)}')
+    return found
+
+
+def audit_routes(client=None):
+    """
+    Request every public named route and return
+    ``{view_name: [(sql, plan, problems), ...]}`` for each page visited.
+    """
+    client = client or Client()
+    results = {}
+    for view_name, kwargs in named_routes():
+        if view_name.startswith('admin:') or view_name in SKIP_ROUTES:
+            continue
+        path = reverse(view_name, kwargs=kwargs)
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            response = client.get(path)
+            if response.streaming:
+                # Streamed pages run their queries while the body is read
+                b''.join(response.streaming_content)
+        results[view_name] = [
+            (sql, plan, problems_in(sql, plan))
+            for sql, params in recorder.queries
+            for plan in [explain(sql, params)]
+        ]
+    return results
+
+
+def run_audit(scale=1):
+    """Seed a throwaway test database, audit it and tear it down again."""
+    creation = connection.creation
+    old_name = connection.settings_dict['NAME']
+    with override_settings(**AUDIT_SETTINGS):
+        creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            seed(scale)
+            return audit_routes()
+        finally:
+            creation.destroy_test_db(old_name, verbosity=0)
@@ -0,0 +1,272 @@
+"""
+Resumable, chunked album uploads.
+
+A few hundred phone photos in one multipart POST restart from zero on
+any network hiccup and run into the proxy's body limit. Instead the
+upload page creates one UploadSession per file and PUTs its chunks
+(several in parallel) to::
+
+    POST   /gallery/<pk>/uploads/               {filename, size, caption} -> session
+    GET    /uploads/<id>/                       -> {received: [...], chunks: n, ...}
+    PUT    /uploads/<id>/chunks/<index>/        raw bytes of one chunk
+    POST   /uploads/<id>/complete/              assemble -> EventPhoto
+    DELETE /uploads/<id>/                       abandon
+
+Each chunk is written to its own file in a per-session staging
+directory, so parallel PUTs never touch the same file and the set of
+received chunks is just a directory listing. A client that lost its
+connection asks for the session and only sends what is missing.
+
+Completing a session streams the chunks, in order, into the final
+sharded media name while hashing and sniffing them, and then goes
+through the same duplicate checks as a regular upload.
+
+Abandoned sessions are removed by ``manage.py cleanup_uploads``.
+
+Settings::
+
+    FAREWELL_UPLOAD_CHUNK_BYTES = 1024 * 1024       # fits nginx's default body limit
+    FAREWELL_UPLOAD_STAGING_DIR = BASE_DIR / 'upload_staging'
+    FAREWELL_UPLOAD_SESSION_TTL = 24 * 3600         # seconds without activity
+    FAREWELL_UPLOAD_ASSEMBLY_TIMEOUT = 120          # before a stuck assembly is retried
+
+Other batches (see farewell.batches) stage under ``<staging dir>/<slug>/``.
+"""
+import datetime
+import hashlib
+import os
+import re
+import shutil
+import uuid
+
+from django.conf import settings
+from django.core.files import File
+from django.db.models import Q
+from django.utils import timezone
+
+from . import batches, metrics
+from .upload_handlers import HEADER_BYTES, StoredUpload, get_limits, sniff_image
+
+DEFAULT_CHUNK_BYTES = 1024 * 1024
+# Comfortably past gunicorn's 30 s worker timeout
+DEFAULT_ASSEMBLY_TIMEOUT = 120
+_CHUNK_NAME = re.compile(r'^(\d+)\.part$')
+
+
+class UploadError(Exception):
+    """A request the resumable protocol can't accept. ``status`` is the HTTP code."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def chunk_bytes():
+    return getattr(settings, 'FAREWELL_UPLOAD_CHUNK_BYTES', DEFAULT_CHUNK_BYTES)
+
+
+def staging_root():
+    """The current batch's staging directory; its sessions live in that batch's database."""
+    root = getattr(settings, 'FAREWELL_UPLOAD_STAGING_DIR', os.path.join(settings.BASE_DIR, 'upload_staging'))
+    return batches.current().directory(root)
+
+
+def staging_dir(session):
+    return os.path.join(staging_root(), str(session.pk))
+
+
+def create_session(event, filename, size, caption=''):
+    from .models import UploadSession
+
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        raise UploadError('size must be a number of bytes')
+    if size <= 0:
+        raise UploadError('Empty files cannot be uploaded')
+    if size > get_limits()['MAX_FILE_BYTES']:
+        raise UploadError('That photo is too big', status=413)
+    filename = os.path.basename(str(filename or '').replace('\\', '/'))[:255] or 'photo'
+    session = UploadSession.objects.create(
+        event=event,
+        filename=filename,
+        size=size,
+        chunk_size=chunk_bytes(),
+        caption=str(caption or '').strip()[:300],
+    )
+    os.makedirs(staging_dir(session), exist_ok=True)
+    return session
+
+
+def received_chunks(session):
+    """Sorted indexes of the chunks already stored for a session."""
+    try:
+        names = os.listdir(staging_dir(session))
+    except FileNotFoundError:
+        return []
+    return sorted(int(m.group(1)) for m in map(_CHUNK_NAME.match, names) if m)
+
+
+def status(session):
+    return {
+        'id': str(session.pk),
+        'filename': session.filename,
+        'size': session.size,
+        'chunk_size': session.chunk_size,
+        'chunks': session.chunk_count,
+        'received': received_chunks(session) if not session.outcome else [],
+        'outcome': session.outcome,
+        'photo': session.photo_id,
+    }
+
+
+def write_chunk(session, index, stream):
+    """
+    Store chunk ``index`` from a file-like ``stream`` (the request body).
+    Re-sending a chunk simply replaces it.
+    """
+    if session.outcome:
+        raise UploadError('This upload is already finished', status=409)
+    if not 0 <= index < session.chunk_count:
+        raise UploadError('No such chunk', status=404)
+    expected = session.chunk_length(index)
+    directory = staging_dir(session)
+    os.makedirs(directory, exist_ok=True)
+    temp_path = os.path.join(directory, f'{index}.{uuid.uuid4().hex}.tmp')
+    written = 0
+    try:
+        with open(temp_path, 'wb') as fh:
+            while True:
+                data = stream.read(min(64 * 1024, expected + 1 - written))
+                if not data:
+                    break
+                written += len(data)
+                if written > expected:
+                    raise UploadError('Chunk is larger than expected', status=413)
+                fh.write(data)
+        if written != expected:
+            raise UploadError(f'Chunk {index} should be {expected} bytes, got {written}')
+        os.replace(temp_path, os.path.join(directory, f'{index}.part'))
+        metrics.inc('farewell_upload_bytes_total', written, path='resumable')
+    finally:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+    # Keeps the session away from the garbage collector while it's active
+    type(session).objects.filter(pk=session.pk).update(updated_at=timezone.now())
+
+
+class _ChunkReader:
+    """Reads a session's chunk files as one stream, hashing as it goes."""
+
+    def __init__(self, paths):
+        self.paths = list(paths)
+        self.current = None
+        self.digest = hashlib.sha256()
+        self.header = bytearray()
+
+    def read(self, size=-1):
+        while self.paths or self.current:
+            if self.current is None:
+                self.current = open(self.paths.pop(0), 'rb')
+            data = self.current.read(size if size and size > 0 else -1)
+            if data:
+                self.digest.update(data)
+                if len(self.header) < HEADER_BYTES:
+                    self.header += data[:HEADER_BYTES - len(self.header)]
+                return data
+            self.current.close()
+            self.current = None
+        return b''
+
+    def close(self):
+        if self.current is not None:
+            self.current.close()
+            self.current = None
+
+
+def claim_for_assembly(session):
+    """
+    Atomically mark a session as being assembled. False if someone else got
+    it, unless their claim is older than the assembly timeout: the worker
+    was killed mid-way, so the claim is taken over.
+    """
+    now = timezone.now()
+    timeout = getattr(settings, 'FAREWELL_UPLOAD_ASSEMBLY_TIMEOUT', DEFAULT_ASSEMBLY_TIMEOUT)
+    abandoned = Q(outcome='assembling', updated_at__lt=now - datetime.timedelta(seconds=timeout))
+    claimable = type(session).objects.filter(Q(outcome='') | abandoned, pk=session.pk)
+    return claimable.update(outcome='assembling', updated_at=now) == 1
+
+
+def assemble(session, field):
+    """
+    Join the chunks into the final file in ``field``'s storage. Returns a
+    StoredUpload, or None if the content isn't an accepted image.
+    """
+    missing = set(range(session.chunk_count)) - set(received_chunks(session))
+    if missing:
+        raise UploadError(f'{len(missing)} chunks are still missing', status=409)
+
+    directory = staging_dir(session)
+    reader = _ChunkReader(os.path.join(directory, f'{i}.part') for i in range(session.chunk_count))
+    try:
+        name = field.storage.save(
+            field.generate_filename(None, session.filename),
+            File(reader, name=session.filename),
+            max_length=field.max_length,
+        )
+    finally:
+        reader.close()
+
+    sniffed = sniff_image(bytes(reader.header))
+    if not sniffed or sniffed[0] not in get_limits()['FORMATS']:
+        field.storage.delete(name)
+        metrics.inc('farewell_upload_files_total', outcome='rejected')
+        return None
+    image_format, dimensions = sniffed
+    return StoredUpload(
+        field.storage, name, session.filename, None, session.size, None, None,
+        reader.digest.hexdigest(), image_format, dimensions,
+    )
+
+
+def discard(session):
+    shutil.rmtree(staging_dir(session), ignore_errors=True)
+
+
+def cleanup_stale(ttl=None, now=None):
+    """
+    Delete the current batch's sessions idle for longer than ``ttl``
+    seconds and every staging directory of the batch without a live
+    session. Returns ``(sessions, directories)``.
+    """
+    from .models import UploadSession
+
+    ttl = ttl if ttl is not None else getattr(settings, 'FAREWELL_UPLOAD_SESSION_TTL', 24 * 3600)
+    cutoff = (now or timezone.now()) - datetime.timedelta(seconds=ttl)
+    stale = list(UploadSession.objects.filter(updated_at__lt=cutoff).values_list('pk', flat=True))
+    UploadSession.objects.filter(pk__in=stale).delete()
+
+    removed = 0
+    root = staging_root()
+    if os.path.isdir(root):
+        # The main batch's directory holds the other batches' ones
+        nested = {batch.slug for batch in batches.registry().values() if batch.slug}
+        names = [name for name in os.listdir(root) if name not in nested]
+        live = {
+            str(pk) for pk in UploadSession.objects.filter(
+                outcome__in=['', 'assembling'], pk__in=[n for n in names if _is_uuid(n)],
+            ).values_list('pk', flat=True)
+        }
+        for name in names:
+            if name not in live:
+                shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+                removed += 1
+    return len(stale), removed
+
+
+def _is_uuid(value):
+    try:
+        uuid.UUID(value)
+        return True
+    except ValueError:
+        return False
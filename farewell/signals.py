@@ -0,0 +1,139 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import (
+    ChangeStamp, Event, EventPhoto, Friend, FunAward, SecretIntel, SlamMessage, Staff, StaffSecretMessage,
+    TimelineEvent,
+)
+from .writebehind import bulk_saved
+
+
+@receiver(post_save, sender=Friend)
+@receiver(post_delete, sender=Friend)
+def refresh_friend_sprite(sender, instance, **kwargs):
+    """Rebuild the roster sprite atlas once the change is committed."""
+    from .sprites import schedule_rebuild
+    transaction.on_commit(schedule_rebuild, using=kwargs.get('using'))
+
+
+@receiver(post_save, sender=Friend)
+@receiver(post_delete, sender=Friend)
+@receiver(post_save, sender=SlamMessage)
+@receiver(post_delete, sender=SlamMessage)
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+@receiver(post_save, sender=EventPhoto)
+@receiver(post_delete, sender=EventPhoto)
+@receiver(post_save, sender=TimelineEvent)
+@receiver(post_delete, sender=TimelineEvent)
+@receiver(post_save, sender=FunAward)
+@receiver(post_delete, sender=FunAward)
+@receiver(post_save, sender=Staff)
+@receiver(post_delete, sender=Staff)
+@receiver(post_save, sender=SecretIntel)
+@receiver(post_delete, sender=SecretIntel)
+@receiver(post_save, sender=StaffSecretMessage)
+@receiver(post_delete, sender=StaffSecretMessage)
+def bump_change_stamps(sender, instance, raw=False, **kwargs):
+    """Mark the public pages showing this row as stale for the static bake."""
+    if raw:
+        return
+    from .bake import stamp_keys
+    ChangeStamp.bump(*stamp_keys(instance))
+
+
+# Write-behind flushes use bulk_create, which sends no post_save: one
+# bulk_saved receiver for every model views hand to writebehind.save()
+@receiver(bulk_saved, sender=SlamMessage)
+@receiver(bulk_saved, sender=SecretIntel)
+@receiver(bulk_saved, sender=StaffSecretMessage)
+def bump_change_stamps_bulk(sender, instances, **kwargs):
+    from .bake import stamp_keys
+    ChangeStamp.bump(*(key for instance in instances for key in stamp_keys(instance)))
+
+
+@receiver(post_save, sender=SlamMessage)
+@receiver(post_save, sender=EventPhoto)
+@receiver(post_save, sender=FunAward)
+@receiver(post_save, sender=TimelineEvent)
+@receiver(post_save, sender=SecretIntel)
+@receiver(post_save, sender=Staff)
+def announce_activity(sender, instance, created, raw=False, **kwargs):
+    """Add new content to the "what's new" feed."""
+    if created and not raw:
+        from .activity import record
+        record([instance])
+
+
+@receiver(bulk_saved, sender=SlamMessage)
+@receiver(bulk_saved, sender=SecretIntel)
+def announce_activity_bulk(sender, instances, **kwargs):
+    from .activity import record
+    record(instances)
+
+
+@receiver(post_delete, sender=SlamMessage)
+@receiver(post_delete, sender=EventPhoto)
+@receiver(post_delete, sender=FunAward)
+@receiver(post_delete, sender=TimelineEvent)
+@receiver(post_delete, sender=SecretIntel)
+@receiver(post_delete, sender=Staff)
+def retract_activity(sender, instance, **kwargs):
+    from .activity import retract
+    retract(instance)
+
+
+@receiver(pre_save, sender=SlamMessage)
+@receiver(pre_save, sender=FunAward)
+@receiver(pre_save, sender=EventPhoto)
+def remember_stat_contributions(sender, instance, raw=False, **kwargs):
+    """An edit can move a row to another friend or album; note where it counted."""
+    if raw or instance._state.adding:
+        return
+    from .stats import contributions
+    old = sender._base_manager.filter(pk=instance.pk).first()
+    instance._stat_contributions = contributions(old) if old else None
+
+
+@receiver(post_save, sender=SlamMessage)
+@receiver(post_save, sender=FunAward)
+@receiver(post_save, sender=EventPhoto)
+def update_stats(sender, instance, created, raw=False, **kwargs):
+    """Keep the stats page counters current."""
+    if raw:
+        return
+    from . import stats
+    if created:
+        stats.added([instance])
+        return
+    before = getattr(instance, '_stat_contributions', None)
+    after = stats.contributions(instance)
+    if before is not None and before != after:
+        stats.apply(before, sign=-1)
+        stats.apply(after)
+
+
+@receiver(bulk_saved, sender=SlamMessage)
+def update_stats_bulk(sender, instances, **kwargs):
+    from .stats import added
+    added(instances)
+
+
+@receiver(post_delete, sender=SlamMessage)
+@receiver(post_delete, sender=FunAward)
+@receiver(post_delete, sender=EventPhoto)
+def update_stats_on_delete(sender, instance, **kwargs):
+    from .stats import removed
+    removed(instance)
+
+
+@receiver(post_delete, sender=Friend)
+@receiver(post_delete, sender=Event)
+def forget_stats(sender, instance, **kwargs):
+    from .stats import forget
+    if sender is Friend:
+        forget('scraps_by_friend', instance.pk)
+        forget('awards_by_friend', instance.pk)
+    else:
+        forget('photos_by_event', instance.pk)
@@ -0,0 +1,291 @@
+"""
+Sampled slow-query log.
+
+SlowQueryMiddleware times every query a request runs. A query is written
+to the log when it takes longer than ``THRESHOLD_MS``, or, for a random
+``SAMPLE_RATE`` share of the rest, as a sample. Each entry is one JSON
+line::
+
+    {"ts": 1760850000.1, "view": "farewell:event_detail", "ms": 212.4,
+     "fingerprint": "5d1c0e6b2a94", "sql": "SELECT ... WHERE id IN (...)",
+     "params": 3, "origin": "farewell/views.py:231 in event_detail",
+     "sampled": false, "weight": 1}
+
+``fingerprint`` identifies the normalized statement: literals and
+placeholders become ``?`` and IN lists collapse, so the same query with
+different values groups together. ``origin`` is the innermost line of
+project code that ran it. Sampled entries carry ``weight = 1 /
+SAMPLE_RATE``, so ``manage.py slow_query_report`` can estimate the total
+time of fast-but-frequent queries next to the slow ones.
+
+Queries a streamed response runs while its body is sent come after the
+middleware has returned and are not seen.
+
+The log rotates at ``MAX_BYTES`` keeping ``BACKUP_COUNT`` old files.
+Writes and rotation take a file lock, so every gunicorn worker can share
+one log.
+
+Settings (all optional) live in ``settings.FAREWELL_SLOW_QUERIES``::
+
+    FAREWELL_SLOW_QUERIES = {
+        'ENABLED': True,
+        'THRESHOLD_MS': 100,
+        'SAMPLE_RATE': 0.001,          # share of the other queries logged
+        'LOG_FILE': BASE_DIR / 'logs' / 'slow_queries.jsonl',
+        'MAX_BYTES': 10 * 1024 * 1024,
+        'BACKUP_COUNT': 5,
+    }
+"""
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import sys
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows runs a single process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+    'THRESHOLD_MS': 100,
+    'SAMPLE_RATE': 0.001,
+    'LOG_FILE': None,
+    'MAX_BYTES': 10 * 1024 * 1024,
+    'BACKUP_COUNT': 5,
+}
+
+MAX_SQL_CHARS = 2000
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'(?<![\w"])-?\d+(?:\.\d+)?\b')
+_PLACEHOLDER = re.compile(r'%s|\?')
+_IN_LIST = re.compile(r'\bIN \(\s*\?(?:\s*,\s*\?)*\s*\)', re.IGNORECASE)
+_VALUES_LIST = re.compile(r'(\(\?(?:, \?)*\))(?:, \(\?(?:, \?)*\))+')
+_SPACE = re.compile(r'\s+')
+
+# Code that runs queries on someone else's behalf, and the execute wrappers
+# around them; the origin is the caller
+_SKIP_FRAMES = (
+    os.sep + 'django' + os.sep, os.sep + 'site-packages' + os.sep,
+    __file__, os.path.join(os.path.dirname(__file__), 'middleware.py'),
+)
+
+
+def get_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'FAREWELL_SLOW_QUERIES', {}))
+    if not config['LOG_FILE']:
+        config['LOG_FILE'] = os.path.join(settings.BASE_DIR, 'logs', 'slow_queries.jsonl')
+    config['LOG_FILE'] = str(config['LOG_FILE'])
+    return config
+
+
+def normalize(sql):
+    """The statement with its values replaced by ``?``."""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _PLACEHOLDER.sub('?', sql)
+    sql = _SPACE.sub(' ', sql).strip()
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _VALUES_LIST.sub(r'\1, ...', sql)
+
+
+def fingerprint(normalized):
+    return hashlib.sha1(normalized.encode()).hexdigest()[:12]
+
+
+def origin():
+    """``path:line in function`` of the innermost project frame on the stack."""
+    base = str(settings.BASE_DIR)
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(base) and not any(part in filename for part in _SKIP_FRAMES):
+            return f'{os.path.relpath(filename, base)}:{frame.f_lineno} in {frame.f_code.co_name}'
+        frame = frame.f_back
+    return ''
+
+
+# ----- the log file -----
+
+@contextmanager
+def _locked(path):
+    if fcntl is None:
+        yield
+        return
+    with open(path + '.lock', 'a') as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def _rotate(path, backup_count):
+    for index in range(backup_count - 1, 0, -1):
+        older = f'{path}.{index}'
+        if os.path.exists(older):
+            os.replace(older, f'{path}.{index + 1}')
+    if backup_count:
+        os.replace(path, f'{path}.1')
+    else:
+        os.unlink(path)
+
+
+def write(entry, config):
+    path = config['LOG_FILE']
+    line = json.dumps(entry, separators=(',', ':')) + '\n'
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with _locked(path):
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = 0
+        if config['MAX_BYTES'] and size and size + len(line) > config['MAX_BYTES']:
+            _rotate(path, config['BACKUP_COUNT'])
+        with open(path, 'a', encoding='utf-8') as fh:
+            fh.write(line)
+
+
+def log_files(path):
+    """The log and its rotated copies, oldest first."""
+    directory, name = os.path.split(path)
+    if not os.path.isdir(directory):
+        return []
+    rotated = sorted(
+        (int(suffix), os.path.join(directory, filename))
+        for filename in os.listdir(directory)
+        if filename.startswith(name + '.')
+        for suffix in [filename[len(name) + 1:]] if suffix.isdigit()
+    )
+    files = [path for _index, path in reversed(rotated)]
+    if os.path.exists(path):
+        files.append(path)
+    return files
+
+
+def read(path):
+    """Every entry of the log and its rotated copies."""
+    for filename in log_files(path):
+        with open(filename, encoding='utf-8') as fh:
+            for line in fh:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # A line cut short by a crash
+                    continue
+
+
+# ----- capturing -----
+
+class QueryLogger:
+    """execute_wrapper that logs the slow and sampled queries of one request."""
+
+    def __init__(self, request, config):
+        self.request = request
+        self.config = config
+
+    def view_name(self):
+        match = getattr(self.request, 'resolver_match', None)
+        return match.view_name if match else f'unresolved:{self.request.path}'
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            ms = (time.perf_counter() - start) * 1000
+            slow = ms >= self.config['THRESHOLD_MS']
+            rate = self.config['SAMPLE_RATE']
+            if slow or (rate and random.random() < rate):
+                try:
+                    self.log(sql, params, many, ms, slow)
+                except OSError:
+                    # Never fail a request because the log can't be written
+                    logger.warning('Could not write the slow-query log', exc_info=True)
+
+    def log(self, sql, params, many, ms, slow):
+        normalized = normalize(sql)
+        if many:
+            params = list(params or [])
+            count = len(params[0]) * len(params) if params else 0
+        else:
+            count = len(params or ())
+        write({
+            'ts': round(time.time(), 3),
+            'view': self.view_name(),
+            'ms': round(ms, 3),
+            'fingerprint': fingerprint(normalized),
+            'sql': normalized[:MAX_SQL_CHARS],
+            'params': count,
+            'origin': origin(),
+            'sampled': not slow,
+            'weight': 1 if slow else round(1 / self.config['SAMPLE_RATE'], 3),
+        }, self.config)
+
+
+# ----- reporting -----
+
+class Fingerprint:
+    """Everything logged for one normalized statement."""
+
+    def __init__(self, key, sql):
+        self.key = key
+        self.sql = sql
+        self.entries = 0
+        self.calls = 0.0
+        self.slow = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.views = {}
+        self.origins = {}
+
+    def add(self, entry):
+        weight = entry.get('weight', 1)
+        self.entries += 1
+        self.calls += weight
+        self.slow += not entry.get('sampled')
+        self.total_ms += entry['ms'] * weight
+        self.max_ms = max(self.max_ms, entry['ms'])
+        self.views[entry['view']] = self.views.get(entry['view'], 0) + 1
+        if entry.get('origin'):
+            self.origins[entry['origin']] = self.origins.get(entry['origin'], 0) + 1
+
+    @property
+    def mean_ms(self):
+        return self.total_ms / self.calls if self.calls else 0.0
+
+    def top_view(self):
+        return max(self.views, key=self.views.get) if self.views else ''
+
+    def top_origin(self):
+        return max(self.origins, key=self.origins.get) if self.origins else ''
+
+
+def aggregate(entries, since=None, view=None):
+    """``{fingerprint: Fingerprint}`` of the entries, optionally filtered."""
+    found = {}
+    for entry in entries:
+        if since is not None and entry.get('ts', 0) < since:
+            continue
+        if view and entry.get('view') != view:
+            continue
+        item = found.get(entry['fingerprint'])
+        if item is None:
+            item = found[entry['fingerprint']] = Fingerprint(entry['fingerprint'], entry['sql'])
+        item.add(entry)
+    return found
+
+
+def top(found, limit=20):
+    return sorted(found.values(), key=lambda item: item.total_ms, reverse=True)[:limit]
@@ -0,0 +1,226 @@
+"""
+Friend photo sprite atlas.
+
+Roster pages (home page, squad cards) show one face per friend. Instead of
+one image request per friend, every photo is shrunk into a square tile and
+packed into a single atlas image, together with a CSS file and a JSON map
+holding each friend's offset in the atlas.
+
+The atlas is rebuilt in the background whenever a Friend is saved or
+deleted. Tiles are cached per friend and only regenerated when the photo
+itself changes, so a rebuild after one edit costs one thumbnail plus the
+final paste.
+"""
+import hashlib
+import io
+import json
+import logging
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from . import batches, metrics
+from .models import Friend
+
+logger = logging.getLogger(__name__)
+
+SPRITE_DIR = 'sprites'
+MANIFEST_NAME = f'{SPRITE_DIR}/friends.json'
+MANIFEST_CACHE_KEY = 'farewell:sprites:friends'
+TILE_BACKGROUND = (253, 246, 227)  # Same aged-paper colour the cards use
+
+
+def _tile_size():
+    return getattr(settings, 'FAREWELL_SPRITE_TILE_SIZE', 200)
+
+
+def _tile_name(key):
+    return f'{SPRITE_DIR}/tiles/{key}.jpg'
+
+
+def load_manifest():
+    """
+    Return the current atlas manifest, or None if no atlas was built yet.
+    """
+    manifest = cache.get(MANIFEST_CACHE_KEY)
+    if manifest is not None:
+        return manifest or None
+    manifest = {}
+    if default_storage.exists(MANIFEST_NAME):
+        with default_storage.open(MANIFEST_NAME) as fh:
+            manifest = json.load(fh)
+    # An empty dict is cached too so missing atlases aren't re-checked on disk
+    cache.set(MANIFEST_CACHE_KEY, manifest, None)
+    return manifest or None
+
+
+def _make_tile(friend, size):
+    with default_storage.open(friend.photo.name) as fh:
+        img = Image.open(fh)
+        img.draft('RGB', (size, size))
+        img = ImageOps.exif_transpose(img).convert('RGB')
+        tile = ImageOps.pad(img, (size, size), color=TILE_BACKGROUND)
+    out = io.BytesIO()
+    tile.save(out, 'JPEG', quality=85, optimize=True)
+    name = _tile_name(friend.pk)
+    if default_storage.exists(name):
+        default_storage.delete(name)
+    default_storage.save(name, ContentFile(out.getvalue()))
+    return name
+
+
+def build_friend_sprite(force=False):
+    """
+    Build (or incrementally refresh) the friend atlas.
+
+    Returns the new manifest, or None when there are no friend photos.
+    """
+    size = _tile_size()
+    previous = load_manifest() or {}
+    old_entries = previous.get('entries', {}) if previous.get('tile') == size else {}
+
+    friends = [
+        f for f in Friend.objects.only('pk', 'photo').order_by('pk') if f.photo
+    ]
+    if not friends:
+        _replace_manifest(previous, {})
+        return None
+
+    entries = {}
+    for friend in friends:
+        key = str(friend.pk)
+        old = old_entries.get(key)
+        stale = force or not old or old['photo'] != friend.photo.name
+        if stale or not default_storage.exists(_tile_name(key)):
+            try:
+                with metrics.timer('farewell_image_processing_seconds', step='sprite_tile'):
+                    _make_tile(friend, size)
+            except (OSError, ValueError):
+                logger.warning('Skipping unreadable photo for friend %s', friend.pk)
+                continue
+        entries[key] = {'photo': friend.photo.name}
+
+    cols = max(1, math.ceil(math.sqrt(len(entries))))
+    rows = max(1, math.ceil(len(entries) / cols))
+    started = time.perf_counter()
+    atlas = Image.new('RGB', (cols * size, rows * size), TILE_BACKGROUND)
+    for index, (key, entry) in enumerate(list(entries.items())):
+        col, row = index % cols, index // cols
+        try:
+            with default_storage.open(_tile_name(key)) as fh:
+                atlas.paste(Image.open(fh), (col * size, row * size))
+        except (OSError, ValueError):
+            # Deleted or damaged since it was checked: the face falls back to its <img>
+            logger.warning('Leaving out the unreadable sprite tile of friend %s', key)
+            del entries[key]
+            continue
+        entry.update({
+            'x': col * size,
+            'y': row * size,
+            'px': round(col / (cols - 1) * 100, 4) if cols > 1 else 0,
+            'py': round(row / (rows - 1) * 100, 4) if rows > 1 else 0,
+        })
+
+    out = io.BytesIO()
+    atlas.save(out, 'JPEG', quality=82, optimize=True, progressive=True)
+    data = out.getvalue()
+    metrics.observe('farewell_image_processing_seconds', time.perf_counter() - started, step='sprite_atlas')
+    digest = hashlib.sha1(data).hexdigest()[:12]
+    if previous.get('digest') == digest and previous.get('entries') == entries:
+        return previous
+
+    # Content-hashed names let the atlas be cached forever by browsers
+    image_name = default_storage.save(f'{SPRITE_DIR}/friends-{digest}.jpg', ContentFile(data))
+    css = _render_css(default_storage.url(image_name), cols, rows, entries)
+    css_name = default_storage.save(f'{SPRITE_DIR}/friends-{digest}.css', ContentFile(css.encode()))
+
+    manifest = {
+        'digest': digest,
+        'tile': size,
+        'cols': cols,
+        'rows': rows,
+        'image': image_name,
+        'image_url': default_storage.url(image_name),
+        'css': css_name,
+        'css_url': default_storage.url(css_name),
+        'entries': entries,
+    }
+    _replace_manifest(previous, manifest)
+    return manifest
+
+
+def _render_css(image_url, cols, rows, entries):
+    lines = [
+        '.friend-sprite{'
+        f'background-image:url("{image_url}");'
+        f'background-size:{cols * 100}% {rows * 100}%;'
+        'background-repeat:no-repeat}'
+    ]
+    for key, entry in entries.items():
+        lines.append(f'.friend-sprite-{key}{{background-position:{entry["px"]}% {entry["py"]}%}}')
+    return '\n'.join(lines) + '\n'
+
+
+def _replace_manifest(previous, manifest):
+    if default_storage.exists(MANIFEST_NAME):
+        default_storage.delete(MANIFEST_NAME)
+    default_storage.save(MANIFEST_NAME, ContentFile(json.dumps(manifest).encode()))
+    cache.set(MANIFEST_CACHE_KEY, manifest, None)
+
+    # Old atlas files are removed only after the new manifest is live
+    for key in ('image', 'css'):
+        old = previous.get(key)
+        if old and old != manifest.get(key) and default_storage.exists(old):
+            default_storage.delete(old)
+
+    stale = set(previous.get('entries', {})) - set(manifest.get('entries', {}))
+    for key in stale:
+        name = _tile_name(key)
+        if default_storage.exists(name):
+            default_storage.delete(name)
+
+
+# ===================== BACKGROUND REBUILDS =====================
+
+_lock = threading.Lock()
+# One rebuild at a time per batch: {slug: {'running': ..., 'dirty': ...}}
+_states = {}
+
+
+def _rebuild_loop(batch):
+    state = _states[batch.slug]
+    while True:
+        try:
+            with batches.activate(batch):
+                build_friend_sprite()
+        except Exception:
+            logger.exception('Friend sprite rebuild failed')
+        with _lock:
+            if not state['dirty']:
+                state['running'] = False
+                return
+            state['dirty'] = False
+
+
+def schedule_rebuild():
+    """
+    Rebuild the atlas in a background thread. Requests arriving while a
+    rebuild is running are coalesced into one follow-up rebuild.
+    """
+    if not getattr(settings, 'FAREWELL_SPRITE_BACKGROUND', True):
+        build_friend_sprite()
+        return
+    batch = batches.current()
+    with _lock:
+        state = _states.setdefault(batch.slug, {'running': False, 'dirty': False})
+        if state['running']:
+            state['dirty'] = True
+            return
+        state['running'] = True
+    threading.Thread(target=_rebuild_loop, args=(batch,), name='friend-sprite', daemon=True).start()
@@ -0,0 +1,152 @@
+"""
+Materialized aggregates behind the stats page.
+
+Leaderboards like "most scrapped friends" would otherwise be a GROUP BY
+over the whole SlamMessage table on every view. Instead StatCounter
+keeps one row per (metric, key) and signals adjust it by one as
+SlamMessage, FunAward and EventPhoto rows come and go, write-behind
+batches included. The stats page then only reads the top rows of an
+index.
+
+Days and hours are counted in the site's TIME_ZONE. ``manage.py
+rebuild_stats`` recomputes everything from the tables, for data loaded
+without signals or after the time zone changes.
+"""
+from collections import Counter
+
+from django.db import IntegrityError, router, transaction
+from django.db.models import Count, F
+from django.db.models.functions import ExtractHour, TruncDate
+from django.utils import timezone
+
+LEADERBOARD_SIZE = 10
+DAYS_SHOWN = 14
+
+
+def _local(value):
+    return timezone.localtime(value) if timezone.is_aware(value) else value
+
+
+def contributions(instance):
+    """``Counter`` of ``(metric, key)`` that one row adds to."""
+    name = instance._meta.model_name
+    counts = Counter()
+    if name == 'slammessage':
+        counts['scraps_by_friend', str(instance.friend_id)] += 1
+        if instance.created_at:
+            counts['posts_by_hour', f'{_local(instance.created_at).hour:02d}'] += 1
+    elif name == 'funaward':
+        counts['awards_by_friend', str(instance.winner_id)] += 1
+    elif name == 'eventphoto':
+        counts['photos_by_event', str(instance.event_id)] += 1
+        if instance.uploaded_at:
+            uploaded = _local(instance.uploaded_at)
+            counts['uploads_by_day', uploaded.date().isoformat()] += 1
+            counts['posts_by_hour', f'{uploaded.hour:02d}'] += 1
+    return counts
+
+
+def apply(counts, sign=1):
+    """Add (or with ``sign=-1`` remove) ``counts`` to the counters."""
+    from .models import StatCounter
+
+    for (metric, key), amount in counts.items():
+        delta = sign * amount
+        if StatCounter.objects.filter(metric=metric, key=key).update(value=F('value') + delta):
+            continue
+        if delta < 0:
+            # Nothing was counted for it (e.g. before a rebuild)
+            continue
+        try:
+            with transaction.atomic(using=router.db_for_write(StatCounter)):
+                StatCounter.objects.create(metric=metric, key=key, value=delta)
+        except IntegrityError:
+            StatCounter.objects.filter(metric=metric, key=key).update(value=F('value') + delta)
+
+
+def added(instances):
+    counts = Counter()
+    for instance in instances:
+        counts.update(contributions(instance))
+    apply(counts)
+
+
+def removed(instance):
+    apply(contributions(instance), sign=-1)
+
+
+def forget(metric, key):
+    """Drop a counter whose subject is gone (a deleted friend or album)."""
+    from .models import StatCounter
+    StatCounter.objects.filter(metric=metric, key=str(key)).delete()
+
+
+def rebuild():
+    """Recompute every counter from the tables. Returns the number of counters."""
+    from .models import EventPhoto, FunAward, SlamMessage, StatCounter
+
+    tz = timezone.get_current_timezone()
+    rows = []
+
+    def collect(metric, queryset, field, fmt=str):
+        for row in queryset.annotate(n=Count('pk')).order_by():
+            if row[field] is not None:
+                rows.append(StatCounter(metric=metric, key=fmt(row[field]), value=row['n']))
+
+    collect('scraps_by_friend', SlamMessage.objects.values('friend_id'), 'friend_id')
+    collect('awards_by_friend', FunAward.objects.values('winner_id'), 'winner_id')
+    collect('photos_by_event', EventPhoto.objects.values('event_id'), 'event_id')
+    collect('uploads_by_day', EventPhoto.objects.annotate(day=TruncDate('uploaded_at', tzinfo=tz)).values('day'),
+            'day', lambda day: day.isoformat())
+
+    hours = Counter()
+    for model, field in ((SlamMessage, 'created_at'), (EventPhoto, 'uploaded_at')):
+        queryset = model.objects.annotate(hour=ExtractHour(field, tzinfo=tz)).values('hour')
+        for row in queryset.annotate(n=Count('pk')).order_by():
+            if row['hour'] is not None:
+                hours[row['hour']] += row['n']
+    rows.extend(StatCounter(metric='posts_by_hour', key=f'{hour:02d}', value=n) for hour, n in hours.items())
+
+    with transaction.atomic(using=router.db_for_write(StatCounter)):
+        StatCounter.objects.all().delete()
+        StatCounter.objects.bulk_create(rows, batch_size=500)
+    return len(rows)
+
+
+def _top(metric, limit=LEADERBOARD_SIZE):
+    from .models import StatCounter
+    return list(
+        StatCounter.objects.filter(metric=metric, value__gt=0)
+        .order_by('-value', 'key').values_list('key', 'value')[:limit]
+    )
+
+
+def _with_objects(queryset, counters):
+    """``[(object, value)]`` for counters keyed by pks of ``queryset``, skipping deleted ones."""
+    objects = queryset.in_bulk([int(key) for key, _value in counters])
+    return [(objects[int(key)], value) for key, value in counters if int(key) in objects]
+
+
+def _bars(items):
+    """Adds each item's share of the largest value, for CSS bar widths."""
+    top = max((value for _label, value in items), default=0) or 1
+    return [{'label': label, 'value': value, 'percent': round(value * 100 / top)} for label, value in items]
+
+
+def dashboard():
+    """Everything the stats page shows, from a handful of indexed reads."""
+    from .models import Event, Friend, StatCounter
+
+    days = [
+        (day, value) for day, value in StatCounter.objects.filter(metric='uploads_by_day')
+        .order_by('-key').values_list('key', 'value')[:DAYS_SHOWN]
+        if value > 0
+    ]
+    hours = dict(StatCounter.objects.filter(metric='posts_by_hour').values_list('key', 'value'))
+    return {
+        'scraps': _bars(_with_objects(Friend.objects.only('name'), _top('scraps_by_friend'))),
+        'awards': _bars(_with_objects(Friend.objects.only('name'), _top('awards_by_friend'))),
+        'albums': _bars(_with_objects(Event.objects.only('title'), _top('photos_by_event'))),
+        'days': _bars(list(reversed(days))),
+        'hours': _bars([(f'{hour:02d}:00', max(hours.get(f'{hour:02d}', 0), 0)) for hour in range(24)]),
+    }
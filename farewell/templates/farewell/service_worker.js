@@ -0,0 +1,79 @@
+// Farewell 2026 service worker. Generated by farewell.pwa, do not edit by hand.
+const CONFIG = {{ config|safe }};
+const SHELL_CACHE = CONFIG.cachePrefix + 'shell-' + CONFIG.version;
+const PAGES_CACHE = CONFIG.cachePrefix + 'pages-' + CONFIG.version;
+
+function ownCache(key) {
+    // Other batches' workers share this origin's caches; leave theirs alone
+    const rest = key.startsWith(CONFIG.cachePrefix) ? key.slice(CONFIG.cachePrefix.length) : '';
+    return rest.startsWith('shell-') || rest.startsWith('pages-');
+}
+
+self.addEventListener('install', (event) => {
+    event.waitUntil(
+        caches.open(SHELL_CACHE).then((cache) => Promise.all(CONFIG.precache.map((url) => {
+            const crossOrigin = new URL(url, self.location.origin).origin !== self.location.origin;
+            // Cross-origin assets come back opaque, which cache.add() refuses
+            const request = new Request(url, crossOrigin ? { mode: 'no-cors' } : {});
+            return fetch(request).then((response) => cache.put(request, response));
+        }))).then(() => self.skipWaiting())
+    );
+});
+
+self.addEventListener('activate', (event) => {
+    event.waitUntil(
+        caches.keys().then((keys) => Promise.all(
+            keys.filter((key) => ownCache(key) && key !== SHELL_CACHE && key !== PAGES_CACHE)
+                .map((key) => caches.delete(key))
+        )).then(() => self.clients.claim())
+    );
+});
+
+function staleWhileRevalidate(event) {
+    return caches.open(PAGES_CACHE).then((cache) => cache.match(event.request).then((cached) => {
+        const network = fetch(event.request).then((response) => {
+            if (response.ok) cache.put(event.request, response.clone());
+            return response;
+        });
+        if (cached) {
+            event.waitUntil(network.catch(() => null));
+            return cached;
+        }
+        return network;
+    }));
+}
+
+function cacheFirst(request) {
+    return caches.open(SHELL_CACHE).then((cache) => cache.match(request).then((cached) =>
+        cached || fetch(request).then((response) => {
+            if (response.ok || response.type === 'opaque') cache.put(request, response.clone());
+            return response;
+        })
+    ));
+}
+
+self.addEventListener('fetch', (event) => {
+    const request = event.request;
+    if (request.method !== 'GET') return;
+    const url = new URL(request.url);
+
+    if (url.origin !== self.location.origin) {
+        if (CONFIG.precache.includes(request.url) || CONFIG.runtimeOrigins.includes(url.origin)) {
+            event.respondWith(cacheFirst(request));
+        }
+        return;
+    }
+    if (url.searchParams.has('_profile')) return;
+    if (CONFIG.otherBatches.some((prefix) => url.pathname.startsWith(prefix))) return;
+
+    if (CONFIG.precache.includes(url.pathname + url.search)) {
+        event.respondWith(cacheFirst(request));
+    } else if (CONFIG.staleWhileRevalidate.includes(url.pathname)
+               || CONFIG.mediaPrefixes.some((prefix) => url.pathname.startsWith(prefix))) {
+        event.respondWith(staleWhileRevalidate(event));
+    } else if (request.mode === 'navigate') {
+        event.respondWith(
+            fetch(request).catch(() => caches.match(CONFIG.offline, { cacheName: SHELL_CACHE }))
+        );
+    }
+});
@@ -0,0 +1,43 @@
+from django import template
+from django.utils.html import format_html
+
+from ..sprites import load_manifest
+
+register = template.Library()
+
+_UNSET = object()
+
+
+def _manifest(context):
+    """The ``sprite_manifest`` the view loaded once for the page, else a fresh read."""
+    manifest = context.get('sprite_manifest', _UNSET)
+    return load_manifest() if manifest is _UNSET else manifest
+
+
+@register.simple_tag(takes_context=True)
+def friend_sprite_css(context):
+    """
+    <link> to the generated sprite CSS, or nothing if no atlas exists yet.
+    """
+    manifest = _manifest(context)
+    if not manifest:
+        return ''
+    return format_html('<link rel="stylesheet" href="{}">', manifest['css_url'])
+
+
+@register.simple_tag(takes_context=True)
+def friend_face(context, friend, placeholder='https://via.placeholder.com/350x400'):
+    """
+    Render a friend's face from the sprite atlas, falling back to a
+    regular lazy <img> for friends that are not in the atlas yet. Views
+    rendering many faces pass ``sprite_manifest`` so it is read only once.
+    """
+    manifest = _manifest(context)
+    entry = manifest['entries'].get(str(friend.pk)) if manifest else None
+    if entry and friend.photo and entry['photo'] == friend.photo.name:
+        return format_html(
+            '<span class="friend-sprite friend-sprite-{}" role="img" aria-label="{}"></span>',
+            friend.pk, friend.name,
+        )
+    src = friend.photo.url if friend.photo else placeholder
+    return format_html('<img src="{}" alt="{}" loading="lazy">', src, friend.name)
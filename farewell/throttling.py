@@ -0,0 +1,186 @@
+"""
+Write-path throttling and flood protection.
+
+Views that accept writes are wrapped with ``@throttle('<scope>')``. Each
+scope has one or more rate rules, keyed either by client IP or by
+the target object (the ``pk`` in the URL), configured in
+``settings.FAREWELL_THROTTLE_RULES``::
+
+    FAREWELL_THROTTLE_RULES = {
+        'vault_login': [('ip', '5/m', 5)],       # (key, rate, burst)
+        'scrap': [('ip', '6/m', 3), ('target', '60/m', 20)],
+    }
+
+Rejected requests get a plain ``429`` with ``Retry-After`` before the view
+runs, so no ORM work is done for them. Counters live in the shared cache
+and are bumped atomically, so the limits hold across every worker however
+many requests arrive at once.
+
+The limiter itself is pluggable through ``settings.FAREWELL_RATE_LIMITER``
+(a dotted path to a RateLimiter subclass).
+"""
+import hashlib
+import math
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.module_loading import import_string
+
+DEFAULT_RULES = {
+    'vault_login': [('ip', '5/m', 5)],
+    'vault_write': [('ip', '12/m', 6), ('target', '60/m', 20)],
+    'scrap': [('ip', '6/m', 3), ('target', '60/m', 20)],
+    'upload': [('ip', '10/m', 5), ('target', '60/m', 30)],
+    # One resumable session per photo: allow a few hundred photos in a go
+    'upload_session': [('ip', '600/h', 300)],
+}
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """'10/m' -> tokens per second."""
+    count, _, period = rate.partition('/')
+    return int(count) / PERIODS[period[0].lower()]
+
+
+class RateLimiter:
+    """Interface for pluggable limiters."""
+
+    def allow(self, key, rate, burst):
+        """
+        Take one token from the bucket ``key``.
+        Returns ``(allowed, retry_after_seconds)``.
+        """
+        raise NotImplementedError
+
+
+class CacheWindowCounter(RateLimiter):
+    """
+    Sliding-window counter in the Django cache, the default limiter.
+
+    A window lasts as long as a bucket takes to refill (``burst / rate``)
+    and admits ``burst`` requests, the previous window's count weighted by
+    how much of it still overlaps. Counts go through ``cache.add()`` and
+    ``cache.incr()``, so concurrent requests each see their own number and
+    none slip past the limit.
+    """
+
+    def __init__(self):
+        self.cache = caches[getattr(settings, 'FAREWELL_THROTTLE_CACHE', 'default')]
+
+    def allow(self, key, rate, burst):
+        window = burst / rate
+        now = time.time()
+        index, offset = divmod(now, window)
+        index = int(index)
+        ttl = math.ceil(2 * window) + 1
+        counter = f'{key}:{index}'
+        while True:
+            self.cache.add(counter, 0, ttl)
+            try:
+                count = self.cache.incr(counter)
+            except ValueError:
+                # Expired between add() and incr()
+                continue
+            break
+        previous = self.cache.get(f'{key}:{index - 1}', 0)
+        if previous * (1 - offset / window) + count <= burst:
+            return True, 0
+        return False, math.ceil(window - offset)
+
+
+class CacheTokenBucket(RateLimiter):
+    """
+    Token bucket stored in the Django cache as ``(tokens, updated_at)``.
+
+    Read-modify-write without a lock: under a burst of truly concurrent
+    requests a few extra may slip through. Only fit for flood control, not
+    for guarding logins; CacheWindowCounter is the default.
+    """
+
+    def __init__(self):
+        self.cache = caches[getattr(settings, 'FAREWELL_THROTTLE_CACHE', 'default')]
+
+    def allow(self, key, rate, burst):
+        now = time.time()
+        tokens, updated = self.cache.get(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        ttl = math.ceil(burst / rate) + 1
+        if tokens < 1:
+            self.cache.set(key, (tokens, now), ttl)
+            return False, math.ceil((1 - tokens) / rate)
+        self.cache.set(key, (tokens - 1, now), ttl)
+        return True, 0
+
+
+_limiter = None
+
+
+def get_limiter():
+    global _limiter
+    if _limiter is None:
+        path = getattr(settings, 'FAREWELL_RATE_LIMITER', 'farewell.throttling.CacheWindowCounter')
+        _limiter = import_string(path)()
+    return _limiter
+
+
+def client_ip(request):
+    """
+    The client address. X-Forwarded-For is only trusted when
+    FAREWELL_TRUSTED_PROXY is set (i.e. the app sits behind nginx).
+    """
+    if getattr(settings, 'FAREWELL_TRUSTED_PROXY', False):
+        forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
+        if forwarded:
+            return forwarded.split(',')[0].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def too_many_requests(retry_after):
+    response = HttpResponse(
+        'Slow down! Too many submissions, please try again in a moment.',
+        status=429, content_type='text/plain; charset=utf-8',
+    )
+    response['Retry-After'] = str(max(1, retry_after))
+    return response
+
+
+def throttle(scope, methods=('POST',)):
+    """
+    Rate-limit a view. Only requests using ``methods`` consume tokens.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in methods or not getattr(settings, 'FAREWELL_THROTTLE_ENABLED', True):
+                return view(request, *args, **kwargs)
+            rules = getattr(settings, 'FAREWELL_THROTTLE_RULES', DEFAULT_RULES).get(scope, ())
+            limiter = get_limiter()
+            for key_type, rate, burst in rules:
+                if key_type == 'ip':
+                    ident = client_ip(request)
+                else:
+                    ident = ':'.join(str(v) for v in (list(args) + sorted(kwargs.values()))) or '-'
+                allowed, retry_after = limiter.allow(
+                    f'farewell:throttle:{scope}:{key_type}:{ident}', parse_rate(rate), burst
+                )
+                if not allowed:
+                    return too_many_requests(retry_after)
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def is_duplicate_submission(scope, *parts, timeout=600):
+    """
+    True if the same submission (same ``parts``) was already seen within
+    ``timeout`` seconds. The first call records it.
+    """
+    normalized = '\x1f'.join(' '.join(str(p).split()).lower() for p in parts)
+    key = f'farewell:dedup:{scope}:' + hashlib.sha1(normalized.encode()).hexdigest()
+    cache = caches[getattr(settings, 'FAREWELL_THROTTLE_CACHE', 'default')]
+    return not cache.add(key, 1, timeout)
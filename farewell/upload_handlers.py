@@ -0,0 +1,257 @@
+"""
+Streaming upload handler for album photos.
+
+Django's default handlers keep small uploads in memory and spill big
+ones to a temp file; add_photos then read every file again to hash it
+and copied it once more into MEDIA_ROOT. StreamingImageUploadHandler
+writes each part of a multipart POST straight to its final storage name
+as it arrives, and on the way
+
+* computes the SHA-256 of the content,
+* sniffs the image format and dimensions from the first bytes,
+* enforces per-file and per-request byte limits.
+
+Memory use is one chunk plus a small header buffer, however many files
+are posted. Views must install the handler as the only one, before
+anything reads request.POST (so behind ``csrf_exempt`` + ``csrf_protect``, as the Django
+docs describe) and call ``discard_unclaimed()`` when done, which removes
+stored files that never made it into a model row.
+
+Limits come from ``settings.FAREWELL_UPLOAD_LIMITS``, merged over
+``DEFAULT_LIMITS``.
+"""
+import hashlib
+import io
+import logging
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile, StopUpload
+from PIL import Image
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LIMITS = {
+    'MAX_FILE_BYTES': 25 * 1024 * 1024,
+    'MAX_REQUEST_BYTES': 250 * 1024 * 1024,
+    'FORMATS': ['JPEG', 'MPO', 'PNG', 'GIF', 'WEBP'],
+}
+
+# Enough for any JPEG's EXIF block and the frame header after it
+HEADER_BYTES = 128 * 1024
+CHUNK_SIZE = 64 * 1024
+
+
+def get_limits():
+    limits = dict(DEFAULT_LIMITS)
+    limits.update(getattr(settings, 'FAREWELL_UPLOAD_LIMITS', {}))
+    return limits
+
+
+def sniff_image(header):
+    """``(format, (width, height))`` from the first bytes of a file, or None."""
+    try:
+        with Image.open(io.BytesIO(header)) as img:
+            return img.format, img.size
+    except Exception:
+        # Unknown format, or not enough bytes yet
+        return None
+
+
+class StoredUpload(UploadedFile):
+    """
+    An upload already written to storage as ``stored_name``. Assign
+    ``stored_name`` to a FileField and call ``claim()``; the file is
+    opened lazily if someone wants to read it.
+    """
+
+    def __init__(self, storage, stored_name, original_name, content_type, size,
+                 charset, content_type_extra, sha256, image_format, dimensions):
+        self._file = None
+        super().__init__(None, original_name, content_type, size, charset, content_type_extra)
+        self.storage = storage
+        self.stored_name = stored_name
+        self.sha256 = sha256
+        self.image_format = image_format
+        self.width, self.height = dimensions or (None, None)
+        self.claimed = False
+
+    def _get_file(self):
+        if self._file is None:
+            self._file = self.storage.open(self.stored_name, 'rb')
+        return self._file
+
+    def _set_file(self, file):
+        self._file = file
+
+    file = property(_get_file, _set_file)
+
+    def open(self, mode=None):
+        if self._file is None or self._file.closed:
+            self._file = self.storage.open(self.stored_name, 'rb')
+        else:
+            self._file.seek(0)
+        return self
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+    def claim(self):
+        """Keep the stored file; call once a model row points at it."""
+        self.claimed = True
+        return self.stored_name
+
+    def discard(self):
+        self.close()
+        self.storage.delete(self.stored_name)
+
+
+class StreamingImageUploadHandler(FileUploadHandler):
+    chunk_size = CHUNK_SIZE
+
+    def __init__(self, request, field, field_names=('images',)):
+        super().__init__(request)
+        self.field = field
+        self.storage = field.storage
+        self.field_names = set(field_names)
+        self.limits = get_limits()
+        self.stored = []
+        self.rejected = []
+        self.error = None
+        self.request_bytes = 0
+        self._reset()
+
+    def _reset(self):
+        self.destination = None
+        self.stored_name = None
+        self.temp_path = None
+        self.header = bytearray()
+        self.sniffed = None
+        self.digest = None
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        if content_length and content_length > self.limits['MAX_REQUEST_BYTES']:
+            self.error = 'too_large'
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None,
+                 content_type_extra=None):
+        if field_name not in self.field_names:
+            # Installed on its own, so stray file fields are simply dropped
+            raise SkipFile()
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        if self.error:
+            # Known to be too big up front: keep reading the form fields
+            # (the CSRF token among them) but store none of the files
+            raise SkipFile()
+        if content_length and content_length > self.limits['MAX_FILE_BYTES']:
+            self.rejected.append(file_name)
+            raise SkipFile()
+
+        self.digest = hashlib.sha256()
+        name = self.field.generate_filename(None, file_name)
+        if isinstance(self.storage, FileSystemStorage):
+            # Reserve the final name and write straight into it
+            while True:
+                name = self.storage.get_available_name(name, max_length=self.field.max_length)
+                path = self.storage.path(name)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                try:
+                    self.destination = open(path, 'xb')
+                    break
+                except FileExistsError:
+                    continue
+            self.stored_name = name
+        else:
+            # Remote storage: spool to disk, never memory, then hand it over
+            self.destination = tempfile.NamedTemporaryFile(suffix='.upload', delete=False)
+            self.temp_path = self.destination.name
+            self.stored_name = name
+        # Also lets MultiPartParser close it if parsing is aborted
+        self.file = self.destination
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.destination is None:
+            return None
+        self.request_bytes += len(raw_data)
+        if self.request_bytes > self.limits['MAX_REQUEST_BYTES']:
+            self.error = 'too_large'
+            self._abort_current()
+            raise StopUpload(connection_reset=True)
+        if start + len(raw_data) > self.limits['MAX_FILE_BYTES']:
+            self.rejected.append(self.file_name)
+            self._abort_current()
+            raise SkipFile()
+
+        self.digest.update(raw_data)
+        self.destination.write(raw_data)
+        if self.sniffed is None and len(self.header) < HEADER_BYTES:
+            self.header += raw_data[:HEADER_BYTES - len(self.header)]
+            if len(self.header) >= HEADER_BYTES:
+                self.sniffed = sniff_image(bytes(self.header)) or False
+        return None
+
+    def file_complete(self, file_size):
+        if self.destination is None:
+            return None
+        metrics.inc('farewell_upload_bytes_total', file_size, path='form')
+        if self.sniffed is None:
+            self.sniffed = sniff_image(bytes(self.header)) or False
+        if not self.sniffed or self.sniffed[0] not in self.limits['FORMATS']:
+            metrics.inc('farewell_upload_files_total', outcome='rejected')
+            self.rejected.append(self.file_name)
+            self._abort_current()
+            return None
+
+        self.destination.close()
+        if self.temp_path:
+            with open(self.temp_path, 'rb') as fh:
+                self.stored_name = self.storage.save(self.stored_name, File(fh), max_length=self.field.max_length)
+            os.unlink(self.temp_path)
+        elif self.storage.file_permissions_mode is not None:
+            os.chmod(self.storage.path(self.stored_name), self.storage.file_permissions_mode)
+
+        image_format, dimensions = self.sniffed
+        upload = StoredUpload(
+            self.storage, self.stored_name, self.file_name, self.content_type, file_size,
+            self.charset, self.content_type_extra, self.digest.hexdigest(), image_format, dimensions,
+        )
+        self.stored.append(upload)
+        self._reset()
+        return upload
+
+    def upload_interrupted(self):
+        self._abort_current()
+
+    def upload_complete(self):
+        if self.error:
+            # The request is rejected as a whole
+            for upload in self.stored:
+                upload.discard()
+            self.stored = []
+        return None
+
+    def _abort_current(self):
+        if self.destination is None:
+            return
+        self.destination.close()
+        try:
+            if self.temp_path:
+                os.unlink(self.temp_path)
+            else:
+                self.storage.delete(self.stored_name)
+        except OSError:
+            logger.warning('Could not remove partial upload %s', self.stored_name)
+        self._reset()
+
+    def discard_unclaimed(self):
+        """Delete stored files no model row ended up using."""
+        for upload in self.stored:
+            if not upload.claimed:
+                upload.discard()
@@ -0,0 +1,54 @@
+"""
+Sharded ``upload_to`` callables.
+
+Plain ``upload_to='event_photos/'`` puts every album photo into one
+directory. With tens of thousands of files that makes directory lookups,
+backups and Django's ``get_available_name`` collision loop slow. These
+callables fan files out into subdirectories instead:
+
+* ``hash`` - two random hex levels, e.g. ``event_photos/3f/a9/IMG_0001.jpg``
+  (256 * 256 buckets, evenly filled)
+* ``date`` - the upload date, e.g. ``timeline/2026/03/12/pongal.jpg``
+
+``manage.py shard_media`` moves files uploaded before sharding into place.
+"""
+import os
+import re
+import uuid
+
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+
+SHARD_PATTERNS = {
+    'hash': r'[0-9a-f]{2}/[0-9a-f]{2}',
+    'date': r'\d{4}/\d{2}/\d{2}',
+}
+
+
+@deconstructible
+class ShardedUploadTo:
+    def __init__(self, prefix, scheme='hash'):
+        if scheme not in SHARD_PATTERNS:
+            raise ValueError(f"Unknown shard scheme {scheme!r}, expected 'hash' or 'date'")
+        self.prefix = prefix.strip('/')
+        self.scheme = scheme
+
+    def __call__(self, instance, filename):
+        return f'{self.prefix}/{self.shard()}/{os.path.basename(filename)}'
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, ShardedUploadTo)
+            and (self.prefix, self.scheme) == (other.prefix, other.scheme)
+        )
+
+    def shard(self):
+        if self.scheme == 'date':
+            return timezone.now().strftime('%Y/%m/%d')
+        token = uuid.uuid4().hex
+        return f'{token[:2]}/{token[2:4]}'
+
+    def is_sharded(self, name):
+        """True if a stored file name already follows this layout."""
+        pattern = rf'^{re.escape(self.prefix)}/{SHARD_PATTERNS[self.scheme]}/[^/]+$'
+        return re.match(pattern, name) is not None
@@ -3,6 +3,14 @@ from . import views
 
 app_name = 'farewell'
 
+# Read-only pages anyone can see, and the files the offline shell needs.
+# These are what ``manage.py bake`` renders into a static site.
+PUBLIC_URL_NAMES = [
+    'index', 'squad_cards', 'gallery', 'event_detail', 'timeline', 'awards',
+    'staff_list', 'newspaper', 'friend_detail', 'spin_bottle',
+    'activity', 'stats', 'offline', 'service_worker', 'web_manifest',
+]
+
 urlpatterns = [
     path('', views.farewell_index, name='index'),
     path('squad-cards/', views.squad_cards, name='squad_cards'),
@@ -16,6 +24,10 @@ urlpatterns = [
     path('gallery/<int:pk>/edit/', views.edit_event, name='edit_event'),
     path('gallery/<int:pk>/delete/', views.delete_event, name='delete_event'),
     path('gallery/<int:pk>/upload/', views.add_photos, name='add_photos'),
+    path('gallery/<int:pk>/uploads/', views.upload_session_create, name='upload_session_create'),
+    path('uploads/<uuid:session_id>/', views.upload_session_detail, name='upload_session'),
+    path('uploads/<uuid:session_id>/chunks/<int:index>/', views.upload_chunk, name='upload_chunk'),
+    path('uploads/<uuid:session_id>/complete/', views.upload_session_complete, name='upload_session_complete'),
     path('photo/<int:pk>/delete/', views.delete_photo, name='delete_photo'),
     path('timeline/add/', views.add_milestone, name='add_milestone'),
     path('timeline/edit/<int:pk>/', views.edit_milestone, name='edit_milestone'),
@@ -36,4 +48,12 @@ urlpatterns = [
     path('vault/', views.vault_login, name='vault_login'),
     path('vault/student/<int:pk>/', views.student_vault, name='student_vault'),
     path('vault/staff/<int:pk>/', views.staff_vault, name='staff_vault'),
+    path('activity/', views.activity_view, name='activity'),
+    path('activity/feed/', views.activity_feed, name='activity_feed'),
+    path('stats/', views.stats_view, name='stats'),
+    path('sw.js', views.service_worker, name='service_worker'),
+    path('manifest.webmanifest', views.web_manifest, name='web_manifest'),
+    path('offline/', views.offline, name='offline'),
+    path('csrf/', views.csrf_token, name='csrf_token'),
+    path('metrics', views.metrics_view, name='metrics'),
 ]
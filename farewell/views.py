@@ -1,20 +1,99 @@
+import json
+
+from django.conf import settings
+from django.core.cache import cache
 from django.shortcuts import render, redirect, get_object_or_404
-from django.db.models import Count
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, Substr
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.middleware.csrf import get_token
+from django.template.loader import get_template, render_to_string
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.cache import never_cache
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from django.views.decorators.http import etag, require_http_methods, require_POST
 from django.urls import reverse
 from django.core.paginator import Paginator
-from .models import Friend, Event, EventPhoto, TimelineEvent, FunAward, SlamMessage, Staff, SecretIntel, StaffSecretMessage
+from .models import Friend, Event, EventPhoto, TimelineEvent, FunAward, SlamMessage, Staff, SecretIntel, StaffSecretMessage, UploadSession
 from .forms import FriendForm, EventForm, PhotoUploadForm, SlamBookForm, MilestoneForm, FunAwardForm, StaffForm
+from .context_processors import csrf_token_for
+from .hints import preload
+from .sprites import load_manifest
+from .throttling import throttle, is_duplicate_submission
+from .upload_handlers import StreamingImageUploadHandler
+from . import activity, metrics, phash, pwa, resumable, stats, writebehind
+
+# Cards only show the start of a memory; don't load the whole text
+MEMORY_EXCERPT_CHARS = 280
+# Placeholder the roster rows are streamed into (see _stream_roster)
+ROSTER_MARKER = '@@farewell-roster@@'
+
+
+def roster_queryset(query=''):
+    """
+    Friends for the home page roster: just the columns a card shows,
+    optionally filtered by name or nickname.
+    """
+    friends = Friend.objects.only('id', 'name', 'nickname', 'photo').annotate(
+        memory_excerpt=Substr('memory_text', 1, MEMORY_EXCERPT_CHARS + 1),
+    )
+    if query:
+        friends = friends.filter(Q(name__icontains=query) | Q(nickname__icontains=query))
+    return friends
+
+
+def _stream_roster(request, template_name, context, friends):
+    """
+    Render the page around the roster first, then stream the friend cards
+    in chunks straight off a database cursor, so the first cards paint
+    before the last ones are fetched.
+    """
+    page = render_to_string(template_name, {**context, 'roster_marker': ROSTER_MARKER}, request)
+    head, tail = page.split(ROSTER_MARKER, 1)
+    card = get_template('farewell/partials/friend_card.html')
+    card_context = {
+        'csrf_token': csrf_token_for(request), 'memory_chars': MEMORY_EXCERPT_CHARS,
+        'sprite_manifest': context['sprite_manifest'],
+    }
+    chunk_size = getattr(settings, 'FAREWELL_ROSTER_CHUNK', 25)
+
+    def rows():
+        yield head
+        chunk = []
+        for index, friend in enumerate(friends.iterator(chunk_size=chunk_size)):
+            chunk.append(card.render({**card_context, 'friend': friend, 'index': index}))
+            if len(chunk) == chunk_size:
+                yield ''.join(chunk)
+                chunk = []
+        yield ''.join(chunk) + tail
+
+    return StreamingHttpResponse(rows(), content_type='text/html; charset=utf-8')
+
 
 def farewell_index(request):
     """
     Home page — original scrapbook list of friends.
+
+    The search box asks for just the roster (htmx sends HX-Target:
+    friendsGrid); everything else gets the full page. Big rosters are
+    streamed.
     """
-    friends = Friend.objects.all()
+    query = request.GET.get('q', '').strip()[:100]
+    friends = roster_queryset(query)
+    fragment = request.headers.get('HX-Target') == 'friendsGrid'
+    template_name = 'farewell/partials/friend_roster.html' if fragment else 'farewell/index.html'
     context = {
-        'friends': friends,
+        'query': query,
+        'memory_chars': MEMORY_EXCERPT_CHARS,
         'page_title': 'Farewell Batch 2026 - The Unbreakable Squad',
+        'sprite_manifest': load_manifest(),
     }
-    return render(request, 'farewell/index.html', context)
+    if friends.count() > getattr(settings, 'FAREWELL_ROSTER_STREAM_THRESHOLD', 60):
+        response = _stream_roster(request, template_name, context, friends)
+    else:
+        response = render(request, template_name, {**context, 'friends': friends})
+    patch_vary_headers(response, ('HX-Target',))
+    return response
 
 
 def squad_cards(request):
@@ -25,6 +104,7 @@ def squad_cards(request):
     context = {
         'friends': friends,
         'page_title': '🃏 Squad Cards',
+        'sprite_manifest': load_manifest(),
     }
     return render(request, 'farewell/character_cards.html', context)
 
@@ -62,26 +142,35 @@ def delete_friend(request, pk):
     return redirect(reverse('farewell:index') + '?msg=Friend removed')
 
 
+@throttle('scrap')
 def friend_detail(request, pk):
     """
     View to display details of a single friend,
     including Slam Book messages and form.
     """
     friend = get_object_or_404(Friend, pk=pk)
-    slam_messages = friend.slam_messages.all()
 
     if request.method == 'POST':
         slam_form = SlamBookForm(request.POST)
         if slam_form.is_valid():
-            SlamMessage.objects.create(
+            sender_name = slam_form.cleaned_data['sender_name']
+            message = slam_form.cleaned_data['message']
+            # Double-clicks and re-submits of the same scrap are pinned only once
+            if is_duplicate_submission('scrap', pk, sender_name, message):
+                return redirect(reverse('farewell:friend_detail', args=[pk]) + '?msg=Scrap already pinned! 📌')
+            writebehind.save(SlamMessage(
                 friend=friend,
-                sender_name=slam_form.cleaned_data['sender_name'],
-                message=slam_form.cleaned_data['message'],
-            )
+                sender_name=sender_name,
+                message=message,
+            ))
             return redirect(reverse('farewell:friend_detail', args=[pk]) + '?msg=Scrap pinned! 📌')
     else:
         slam_form = SlamBookForm()
 
+    if friend.photo:
+        preload(request, friend.photo.url)
+    # Scraps still waiting in the write-behind queue are shown first
+    slam_messages = writebehind.pending(SlamMessage, friend.pk) + list(friend.slam_messages.all())
     return render(request, 'farewell/friend_detail.html', {
         'friend': friend,
         'page_title': friend.name,
@@ -118,9 +207,18 @@ def gallery_view(request):
     """
     View to list all events as album cards with photo counts.
     """
-    events_qs = Event.objects.annotate(photo_count=Count('photos')).order_by('-date')
+    # A correlated count keeps the date index usable for the ORDER BY
+    # (a JOIN + GROUP BY would need a temp B-tree to sort)
+    photo_counts = (
+        EventPhoto.objects.filter(event=OuterRef('pk')).order_by()
+        .values('event').annotate(n=Count('pk')).values('n')
+    )
+    events_qs = Event.objects.annotate(
+        photo_count=Coalesce(Subquery(photo_counts), 0)
+    ).order_by('-date')
     paginator = Paginator(events_qs, 12)
     page_obj = paginator.get_page(request.GET.get('page'))
+    preload(request, *(e.cover_image.url for e in page_obj[:2] if e.cover_image))
     return render(request, 'farewell/gallery.html', {
         'events': page_obj,
         'page_obj': page_obj,
@@ -136,6 +234,7 @@ def event_detail_view(request, pk):
     photos_qs = event.photos.select_related('event').all()
     paginator = Paginator(photos_qs, 15)
     page_obj = paginator.get_page(request.GET.get('page'))
+    preload(request, *(p.image.url for p in page_obj[:3] if p.image))
     return render(request, 'farewell/event_detail.html', {
         'event': event,
         'photos': page_obj,
@@ -204,34 +303,157 @@ def delete_event(request, pk):
     return redirect(reverse('farewell:gallery') + '?msg=Event deleted')
 
 
+def _save_album_photo(event, upload, caption=''):
+    """
+    Turn a StoredUpload into an EventPhoto, unless it duplicates one already
+    in the album. Returns the photo, or None if it was skipped.
+    """
+    if event.photos.filter(sha256=upload.sha256).exists():
+        # Byte-for-byte the same file is already in this album
+        metrics.inc('farewell_upload_files_total', outcome='duplicate')
+        return None
+    photo = EventPhoto(
+        event=event,
+        image=upload.stored_name,
+        caption=caption if caption else None,
+        sha256=upload.sha256,
+    )
+    # Burst shots uploaded again are flagged (or skipped) as near-duplicates
+    skip_duplicates = getattr(settings, 'FAREWELL_DUPLICATE_PHOTOS', 'flag') == 'skip'
+    if phash.check_upload(photo, upload) and skip_duplicates:
+        metrics.inc('farewell_upload_files_total', outcome='near_duplicate')
+        return None
+    photo.save()
+    upload.claim()
+    metrics.inc('farewell_upload_files_total', outcome='saved')
+    return photo
+
+
+@csrf_exempt
+@throttle('upload')
 def add_photos(request, pk):
     """
     View to upload multiple photos to a specific Event.
+
+    Photos are streamed straight into storage by StreamingImageUploadHandler,
+    which has to be installed before the CSRF check reads request.POST.
     """
     event = get_object_or_404(Event, pk=pk)
+    handler = None
+    if request.method == 'POST':
+        handler = StreamingImageUploadHandler(request, EventPhoto._meta.get_field('image'))
+        request.upload_handlers = [handler]
+    try:
+        return _add_photos(request, event, handler)
+    finally:
+        if handler is not None:
+            handler.discard_unclaimed()
+
+
+@csrf_protect
+def _add_photos(request, event, handler):
+    error = None
     if request.method == 'POST':
         form = PhotoUploadForm(request.POST)
         files = request.FILES.getlist('images')
-        if files:
+        if handler.error:
+            error = 'That upload is too big. Please send fewer photos at a time.'
+        elif files:
             caption = request.POST.get('caption', '').strip()
-            for f in files:
-                EventPhoto.objects.create(
-                    event=event,
-                    image=f,
-                    caption=caption if caption else None,
-                )
-            return redirect(reverse('farewell:event_detail', args=[pk]) + '?msg=Photos uploaded! 📸')
+            skipped = sum(_save_album_photo(event, f, caption) is None for f in files)
+            msg = 'Photos uploaded! 📸'
+            if skipped:
+                msg += f' ({skipped} duplicate{"s" if skipped > 1 else ""} skipped)'
+            if handler.rejected:
+                msg += f' ({len(handler.rejected)} file{"s" if len(handler.rejected) > 1 else ""} not accepted)'
+            return redirect(reverse('farewell:event_detail', args=[event.pk]) + '?msg=' + msg)
+        elif handler.rejected:
+            error = 'None of those files could be used. Please upload JPEG, PNG, GIF or WebP photos.'
     else:
         form = PhotoUploadForm()
 
     return render(request, 'farewell/upload_photos.html', {
         'form': form,
         'event': event,
+        'error': error,
         'page_title': f'📷 Upload to {event.title}',
         'button_text': 'Upload Photos',
     })
 
 
+# ----- Resumable chunked uploads (see farewell/resumable.py) -----
+
+def _upload_error(exc):
+    return JsonResponse({'error': str(exc)}, status=exc.status)
+
+
+@require_POST
+@throttle('upload_session')
+def upload_session_create(request, pk):
+    """Start a resumable upload of one photo into an album."""
+    event = get_object_or_404(Event, pk=pk)
+    try:
+        data = json.loads(request.body or b'{}')
+        session = resumable.create_session(event, data.get('filename'), data.get('size'), data.get('caption', ''))
+    except ValueError:
+        return JsonResponse({'error': 'Expected a JSON body'}, status=400)
+    except resumable.UploadError as exc:
+        return _upload_error(exc)
+    return JsonResponse(resumable.status(session), status=201)
+
+
+@require_http_methods(['GET', 'HEAD', 'DELETE'])
+def upload_session_detail(request, session_id):
+    session = get_object_or_404(UploadSession, pk=session_id)
+    if request.method == 'DELETE':
+        resumable.discard(session)
+        session.delete()
+        return HttpResponse(status=204)
+    return JsonResponse(resumable.status(session))
+
+
+@require_http_methods(['PUT'])
+def upload_chunk(request, session_id, index):
+    session = get_object_or_404(UploadSession, pk=session_id)
+    try:
+        resumable.write_chunk(session, index, request)
+    except resumable.UploadError as exc:
+        return _upload_error(exc)
+    return HttpResponse(status=204)
+
+
+@require_POST
+def upload_session_complete(request, session_id):
+    """Assemble the chunks and add the photo to the album."""
+    session = get_object_or_404(UploadSession.objects.select_related('event'), pk=session_id)
+    if session.outcome in ('saved', 'duplicate', 'rejected'):
+        return JsonResponse(resumable.status(session))
+    if not resumable.claim_for_assembly(session):
+        return JsonResponse({'error': 'This upload is already being assembled'}, status=409)
+
+    outcome, photo = 'rejected', None
+    try:
+        upload = resumable.assemble(session, EventPhoto._meta.get_field('image'))
+        if upload is not None:
+            try:
+                photo = _save_album_photo(session.event, upload, session.caption)
+            finally:
+                if not upload.claimed:
+                    upload.discard()
+            outcome = 'saved' if photo else 'duplicate'
+    except resumable.UploadError as exc:
+        UploadSession.objects.filter(pk=session.pk).update(outcome='')
+        return _upload_error(exc)
+    except Exception:
+        UploadSession.objects.filter(pk=session.pk).update(outcome='')
+        raise
+
+    session.outcome, session.photo = outcome, photo
+    session.save(update_fields=['outcome', 'photo', 'updated_at'])
+    resumable.discard(session)
+    return JsonResponse(resumable.status(session))
+
+
 def delete_photo(request, pk):
     """
     View to delete a single photo from an event.
@@ -392,6 +614,136 @@ def spin_bottle(request):
     })
 
 
+# ===================== ACTIVITY FEED =====================
+
+ACTIVITY_POLL_SECONDS = 30
+
+
+def _cursor(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _feed_context(before=None, since=None):
+    entries, has_more = activity.fetch(before=before, since=since)
+    newest = entries[0].id if entries else since
+    return {
+        'groups': activity.group_entries(entries),
+        'has_more': has_more,
+        'oldest': entries[-1].id if entries else before,
+        'newest': newest or 0,
+        'since': since,
+        # More new entries than one fragment holds: poll again right away
+        'catching_up': since is not None and has_more,
+        'poll_seconds': ACTIVITY_POLL_SECONDS,
+    }
+
+
+def activity_view(request):
+    """
+    What's new across the site. Without JavaScript ``?before=`` pages
+    through it; with htmx the page loads older entries and polls for new
+    ones through activity_feed.
+    """
+    before = _cursor(request.GET.get('before'))
+    context = _feed_context(before=before)
+    context.update({
+        'live': before is None,
+        'page_title': "🔔 What's New",
+    })
+    return render(request, 'farewell/activity.html', context)
+
+
+def activity_feed(request):
+    """
+    htmx fragment: the entries ``?before=`` or ``?since=`` an id, cached
+    until the feed changes. No news for a poll is a bodiless 204.
+    """
+    before = _cursor(request.GET.get('before'))
+    since = _cursor(request.GET.get('since'))
+    if since is not None:
+        before = None
+    timeout = activity.cache_timeout()
+    key = f'farewell:activity:fragment:{activity.generation()}:{before}:{since}'
+    html = cache.get(key) if timeout else None
+    if html is None:
+        context = _feed_context(before=before, since=since)
+        html = render_to_string('farewell/partials/activity_feed.html', context) if context['groups'] else ''
+        if timeout:
+            cache.set(key, html, timeout)
+    if not html:
+        return HttpResponse(status=204)
+    return HttpResponse(html)
+
+
+# ===================== STATS =====================
+
+def stats_view(request):
+    """Leaderboards and upload trends, read from the StatCounter table."""
+    context = stats.dashboard()
+    context['page_title'] = '📊 Squad Stats'
+    return render(request, 'farewell/stats.html', context)
+
+
+# ===================== OFFLINE / PWA VIEWS =====================
+
+@etag(lambda request: pwa.cache_version())
+def service_worker(request):
+    """
+    The service worker script. Browsers re-check it on every navigation,
+    so it must not be cached, but the ETag makes that check a 304.
+    """
+    response = HttpResponse(
+        get_template('farewell/service_worker.js').render({
+            'config': json.dumps(pwa.worker_config()),
+        }),
+        content_type='text/javascript; charset=utf-8',
+    )
+    response['Service-Worker-Allowed'] = pwa.scope()
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+@etag(lambda request: pwa.cache_version())
+def web_manifest(request):
+    response = JsonResponse(pwa.web_manifest(), content_type='application/manifest+json')
+    patch_cache_control(response, public=True, max_age=86400)
+    return response
+
+
+@never_cache
+def csrf_token(request):
+    """
+    A CSRF token for pages that were rendered without one (the public
+    pages and the static bake). base.html fetches it right before such a
+    form is submitted.
+    """
+    return JsonResponse({'token': get_token(request)})
+
+
+def offline(request):
+    """Shell page the service worker shows for navigations without a network."""
+    return render(request, 'farewell/offline.html', {
+        'page_title': '📶 Offline',
+    })
+
+
+@never_cache
+def metrics_view(request):
+    """Prometheus scrape target, see farewell.metrics."""
+    config = metrics.get_config()
+    if not config['ENABLED']:
+        raise Http404
+    if not metrics.may_read(request, config):
+        return HttpResponse(status=403)
+    return HttpResponse(
+        metrics.render(metrics.collect(config)),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
+
+
 # ===================== STAFF CRUD VIEWS =====================
 
 def staff_list(request):
@@ -501,6 +853,7 @@ def custom_page_not_found(request, exception):
 
 # ===================== SECRET VAULT VIEWS =====================
 
+@throttle('vault_login')
 def vault_login(request):
     if request.method == 'POST':
         roll_number = request.POST.get('roll_number', '').strip()
@@ -518,30 +871,32 @@ def vault_login(request):
         'page_title': '🔐 Secret Vault Portal',
     })
 
+@throttle('vault_write')
 def student_vault(request, pk):
     friend = get_object_or_404(Friend, pk=pk)
     if request.method == 'POST':
         intel_text = request.POST.get('intel', '').strip()
         if intel_text:
-            SecretIntel.objects.create(friend=friend, text=intel_text)
+            writebehind.save(SecretIntel(friend=friend, text=intel_text))
         return redirect('farewell:student_vault', pk=pk)
             
-    secret_intels = friend.secret_intels.all()
+    secret_intels = writebehind.pending(SecretIntel, friend.pk) + list(friend.secret_intels.all())
     return render(request, 'farewell/student_vault.html', {
         'page_title': f"{friend.nickname or friend.name}'s Secret Vault",
         'friend': friend,
         'secret_intels': secret_intels,
     })
 
+@throttle('vault_write')
 def staff_vault(request, pk):
     staff_member = get_object_or_404(Staff, pk=pk)
     if request.method == 'POST':
         message_text = request.POST.get('message', '').strip()
         if message_text:
-            StaffSecretMessage.objects.create(staff=staff_member, text=message_text)
+            writebehind.save(StaffSecretMessage(staff=staff_member, text=message_text))
         return redirect('farewell:staff_vault', pk=pk)
             
-    secret_messages = staff_member.secret_messages.all()
+    secret_messages = writebehind.pending(StaffSecretMessage, staff_member.pk) + list(staff_member.secret_messages.all())
     return render(request, 'farewell/staff_vault.html', {
         'page_title': f"Top Secret: {staff_member.name}",
         'staff_member': staff_member,
@@ -0,0 +1,113 @@
+"""
+Worker warm-up.
+
+A fresh worker pays on its first requests for importing the admin,
+populating the URL resolver and compiling base.html plus each page
+template. warm_up() does all of that up front: it compiles every template
+the cached loader can find and then renders each named route once
+against an empty anonymous GET request, so the first real visitor is
+served as fast as the thousandth.
+
+Used by ``manage.py warmup`` and by the gunicorn ``post_fork`` hook.
+"""
+import logging
+import os
+import time
+
+from django.contrib.auth.models import AnonymousUser
+from django.http import Http404
+from django.template import engines
+from django.template.loaders.cached import Loader as CachedLoader
+from django.test import RequestFactory
+from django.urls import URLPattern, URLResolver, get_resolver, reverse
+
+logger = logging.getLogger(__name__)
+
+# Sample value for each path converter when reversing a route
+SAMPLE_ARGS = {'int': 1, 'str': 'warmup', 'slug': 'warmup', 'path': 'warmup', 'uuid': '00000000-0000-0000-0000-000000000000'}
+
+# Only the public face of the admin is warmed; the rest needs a login
+ADMIN_ROUTES = {'admin:login', 'admin:index'}
+
+
+def precompile_templates():
+    """Load every template the cached loaders can see. Returns the count."""
+    count = 0
+    for engine in engines.all():
+        loaders = getattr(getattr(engine, 'engine', None), 'template_loaders', [])
+        for loader in loaders:
+            if not isinstance(loader, CachedLoader):
+                continue
+            for sub_loader in loader.loaders:
+                for directory in sub_loader.get_dirs():
+                    for root, _dirs, files in os.walk(directory):
+                        for filename in files:
+                            if not filename.endswith(('.html', '.txt', '.js')):
+                                continue
+                            name = os.path.relpath(os.path.join(root, filename), directory)
+                            try:
+                                loader.get_template(name.replace(os.sep, '/'))
+                                count += 1
+                            except Exception:
+                                # Not every file in a template dir is a valid template
+                                logger.debug('Could not precompile %s', name)
+    return count
+
+
+def named_routes(resolver=None, namespace=''):
+    """Yield (view_name, kwargs) for every named URL pattern."""
+    resolver = resolver or get_resolver()
+    for pattern in resolver.url_patterns:
+        if isinstance(pattern, URLResolver):
+            ns = pattern.namespace
+            yield from named_routes(pattern, f'{namespace}{ns}:' if ns else namespace)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            converters = getattr(pattern.pattern, 'converters', {})
+            kwargs = {}
+            for key, converter in converters.items():
+                kind = type(converter).__name__.replace('Converter', '').lower()
+                kwargs[key] = SAMPLE_ARGS.get(kind, 1)
+            yield f'{namespace}{pattern.name}', kwargs
+
+
+def render_routes():
+    """Render each named GET route once. Returns {view_name: (status, ms)}."""
+    factory = RequestFactory()
+    results = {}
+    for view_name, kwargs in named_routes():
+        if view_name.startswith('admin:') and view_name not in ADMIN_ROUTES:
+            continue
+        try:
+            path = reverse(view_name, kwargs=kwargs)
+        except Exception:
+            continue
+        request = factory.get(path)
+        request.user = AnonymousUser()
+        match = get_resolver().resolve(path)
+        request.resolver_match = match
+        start = time.perf_counter()
+        try:
+            response = match.func(request, *match.args, **match.kwargs)
+            if hasattr(response, 'render') and callable(response.render):
+                response.render()
+            status = response.status_code
+        except Http404 as exc:
+            # The sample pk doesn't exist; warm the 404 page instead
+            get_resolver().resolve_error_handler(404)(request, exc)
+            status = 404
+        except Exception:
+            logger.exception('Warm-up of %s failed', view_name)
+            status = 500
+        results[view_name] = (status, (time.perf_counter() - start) * 1000)
+    return results
+
+
+def warm_up():
+    """Precompile templates, populate the URL resolver and render every route."""
+    start = time.perf_counter()
+    get_resolver().reverse_dict  # noqa: B018 - populates the resolver
+    templates = precompile_templates()
+    routes = render_routes()
+    elapsed = (time.perf_counter() - start) * 1000
+    logger.info('Warm-up done: %d templates, %d routes in %.0f ms', templates, len(routes), elapsed)
+    return templates, routes, elapsed
@@ -0,0 +1,223 @@
+"""
+Optional write-behind for high-volume inserts.
+
+At peak, slam messages and vault entries arrive hundreds per minute, each
+in its own SQLite write transaction. With write-behind enabled, views hand
+new rows to ``save()``, which queues them in memory; a single writer
+thread per process flushes the queue with ``bulk_create`` every
+``FLUSH_INTERVAL_MS`` or as soon as ``MAX_BATCH`` rows are waiting::
+
+    FAREWELL_WRITE_BEHIND = {
+        'ENABLED': True,
+        'FLUSH_INTERVAL_MS': 250,
+        'MAX_BATCH': 200,
+    }
+
+Until a row is flushed it is mirrored in the shared cache under its
+target (the friend or staff member it belongs to), and ``pending()``
+returns those unsaved rows so the poster's next page view already shows
+them, whichever worker serves it. Each mirrored row has a key of its own,
+numbered by an atomic ``cache.incr()`` counter per target, so workers
+posting to the same friend at once never overwrite each other's rows.
+
+Pending rows are flushed at interpreter exit and from gunicorn's
+``worker_exit`` hook via ``shutdown()``. Because bulk_create doesn't send
+post_save, each flushed batch is announced with the ``bulk_saved``
+signal instead.
+"""
+import atexit
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.dispatch import Signal
+from django.utils import timezone
+
+from . import batches
+
+logger = logging.getLogger(__name__)
+
+# Sent with sender=<model class> and instances=<saved objects, with pks>
+bulk_saved = Signal()
+
+MIRROR_TIMEOUT = 300
+# How many of a target's most recent row numbers pending() looks at
+MIRROR_WINDOW = 500
+
+
+def get_config():
+    config = {'ENABLED': False, 'FLUSH_INTERVAL_MS': 250, 'MAX_BATCH': 200}
+    config.update(getattr(settings, 'FAREWELL_WRITE_BEHIND', {}))
+    return config
+
+
+def _target_field(model):
+    """The foreign key a row is shown under (friend / staff)."""
+    for field in model._meta.concrete_fields:
+        if field.many_to_one:
+            return field
+    raise ValueError(f'{model.__name__} has no foreign key to mirror pending rows under')
+
+
+def _mirror_key(model, target_id):
+    return f'farewell:writebehind:{model._meta.label_lower}:{target_id}'
+
+
+def _next_slot(base):
+    """Cache key for one more mirrored row under ``base``."""
+    counter = f'{base}:last'
+    while True:
+        cache.add(counter, 0, MIRROR_TIMEOUT)
+        try:
+            number = cache.incr(counter)
+        except ValueError:
+            # Expired between add() and incr()
+            continue
+        cache.touch(counter, MIRROR_TIMEOUT)
+        return f'{base}:{number}'
+
+
+class WriteBehindQueue:
+    def __init__(self, interval_ms, max_batch):
+        self.interval = interval_ms / 1000
+        self.max_batch = max_batch
+        self._pending = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name='farewell-writebehind', daemon=True)
+        self._thread.start()
+
+    def enqueue(self, instance):
+        model = type(instance)
+        field = _target_field(model)
+        target_id = getattr(instance, field.attname)
+
+        key = _next_slot(_mirror_key(model, target_id))
+        fields = {
+            f.attname: getattr(instance, f.attname)
+            for f in model._meta.concrete_fields if not f.primary_key
+        }
+        fields['created_at'] = timezone.now()
+        cache.set(key, fields, MIRROR_TIMEOUT)
+
+        with self._lock:
+            self._pending.append((batches.current(), instance, key))
+            full = len(self._pending) >= self.max_batch
+        if full:
+            self._wakeup.set()
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Write-behind flush failed')
+
+    def flush(self):
+        # One writer at a time, even when shutdown() races the thread
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+            by_site = {}
+            for site, instance, key in pending:
+                by_site.setdefault(site, []).append((instance, key))
+            for site, rows in by_site.items():
+                # Rows go to the database and cache keys of the batch they were posted to
+                with batches.activate(site):
+                    self._write(rows)
+            return len(pending)
+
+    def _write(self, batch):
+        by_model = {}
+        for instance, _key in batch:
+            by_model.setdefault(type(instance), []).append(instance)
+        try:
+            with transaction.atomic(using=batches.current().database):
+                saved = {
+                    model: model.objects.bulk_create(objs, batch_size=self.max_batch)
+                    for model, objs in by_model.items()
+                }
+        except Exception:
+            # One bad row (e.g. its friend was deleted meanwhile) must not
+            # sink the whole batch: fall back to row-by-row inserts, which
+            # send the regular post_save signal themselves.
+            logger.exception('Write-behind bulk insert failed, retrying row by row')
+            for objs in by_model.values():
+                self._save_each(objs)
+            saved = {}
+
+        for model, objs in saved.items():
+            bulk_saved.send(sender=model, instances=objs)
+
+        cache.delete_many([key for _instance, key in batch])
+
+    def _save_each(self, objs):
+        for obj in objs:
+            try:
+                obj.save()
+            except Exception:
+                logger.exception('Dropping queued %s row', type(obj).__name__)
+
+    def shutdown(self):
+        self._stopped = True
+        self._wakeup.set()
+        self.flush()
+
+
+_queue = None
+_queue_pid = None
+_queue_lock = threading.Lock()
+
+
+def get_queue():
+    """The per-process queue, (re)created lazily after a fork."""
+    global _queue, _queue_pid
+    with _queue_lock:
+        if _queue is None or _queue_pid != os.getpid():
+            config = get_config()
+            _queue = WriteBehindQueue(config['FLUSH_INTERVAL_MS'], config['MAX_BATCH'])
+            _queue_pid = os.getpid()
+        return _queue
+
+
+def save(instance):
+    """
+    Save a new row, either now or via the write-behind queue when enabled.
+    """
+    if not get_config()['ENABLED']:
+        instance.save()
+        return instance
+    get_queue().enqueue(instance)
+    return instance
+
+
+def pending(model, target_id):
+    """
+    Unsaved rows still waiting in any worker's queue for ``target_id``,
+    newest first. They have no pk yet.
+    """
+    if not get_config()['ENABLED']:
+        return []
+    base = _mirror_key(model, target_id)
+    last = cache.get(f'{base}:last')
+    if not last:
+        return []
+    keys = [f'{base}:{number}' for number in range(last, max(last - MIRROR_WINDOW, 0), -1)]
+    mirrored = cache.get_many(keys)
+    return [model(**mirrored[key]) for key in keys if key in mirrored]
+
+
+def shutdown():
+    """Flush everything still queued in this process."""
+    if _queue is not None and _queue_pid == os.getpid():
+        _queue.shutdown()
+
+
+atexit.register(shutdown)
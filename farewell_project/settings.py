@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 
+from farewell.batches import batch_databases
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -41,13 +43,21 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'farewell.batches.BatchMiddleware',
+    'farewell.middleware.MetricsMiddleware',
+    'farewell.middleware.SlowQueryMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'farewell.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'farewell.middleware.PublicPageMiddleware',
+    'farewell.middleware.LoadSheddingMiddleware',
+    'farewell.middleware.RequestProfilerMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'farewell.middleware.PreloadHintsMiddleware',
 ]
 
 ROOT_URLCONF = 'farewell_project.urls'
@@ -62,6 +72,8 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'farewell.context_processors.assets',
+                'farewell.context_processors.deferred_csrf',
             ],
         },
     },
@@ -80,6 +92,39 @@ DATABASES = {
     }
 }
 
+# Other batches served by this deployment, each with its own database,
+# media directory and cache keys (farewell/batches.py). The main batch
+# lives in 'default'.
+FAREWELL_BATCHES = {}
+DATABASES.update(batch_databases(FAREWELL_BATCHES, DATABASES['default'], BASE_DIR))
+DATABASE_ROUTERS = ['farewell.batches.BatchRouter']
+
+
+# Cache
+# Shared by every worker process on this host; see farewell/cache_backends.py
+
+CACHES = {
+    'default': {
+        'BACKEND': 'farewell.cache_backends.SQLiteCache',
+        'LOCATION': BASE_DIR / 'cache.sqlite3',
+        'TIMEOUT': 300,
+        'KEY_FUNCTION': 'farewell.batches.make_cache_key',
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+            'MAX_BYTES': 64 * 1024 * 1024,
+            'CULL_FREQUENCY': 4,
+        },
+    }
+}
+
+# Queue slam messages and vault entries and insert them in batches through
+# one writer thread per worker (farewell/writebehind.py)
+FAREWELL_WRITE_BEHIND = {
+    'ENABLED': False,
+    'FLUSH_INTERVAL_MS': 250,
+    'MAX_BATCH': 200,
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -118,10 +163,19 @@ USE_TZ = True
 STATIC_URL = 'static/'
 STATICFILES_DIRS = [BASE_DIR / 'farewell' / 'static']
 
+# Bump when main.css changes; used for ?v= cache busting and preload hints
+FAREWELL_ASSET_VERSION = '13.0'
+
 # Media files (for photo uploads)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+STORAGES = {
+    # MEDIA_ROOT/<batch> for batches other than the main one
+    'default': {'BACKEND': 'farewell.batches.BatchFileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -0,0 +1,48 @@
+"""
+Production settings for farewell_project.
+
+Use with:
+    DJANGO_SETTINGS_MODULE=farewell_project.settings_production
+
+Everything not overridden here comes from settings.py.
+"""
+import os
+
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, TEMPLATES
+
+DEBUG = False
+
+SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY', SECRET_KEY)  # noqa: F405
+
+ALLOWED_HOSTS = [h for h in os.environ.get('DJANGO_ALLOWED_HOSTS', 'localhost').split(',') if h]
+
+# Templates are compiled once per worker and kept in memory. APP_DIRS has
+# to be off when loaders are listed explicitly; the app_directories loader
+# below does the same job.
+TEMPLATES = [
+    {
+        **TEMPLATES[0],
+        'APP_DIRS': False,
+        'OPTIONS': {
+            **TEMPLATES[0]['OPTIONS'],
+            'debug': False,
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
+        },
+    },
+]
+
+# Hashed file names from collectstatic, so static files can be cached forever
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+STORAGES = {
+    'default': {'BACKEND': 'farewell.batches.BatchFileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.ManifestStaticFilesStorage'},
+}
+
+# Pre-render every named route when a worker starts (see gunicorn.conf.py)
+FAREWELL_WARMUP_ON_FORK = True
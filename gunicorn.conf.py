@@ -0,0 +1,45 @@
+"""
+gunicorn configuration for farewell_project.
+
+    gunicorn -c gunicorn.conf.py
+
+Each worker warms itself up right after it is forked, so freshly started
+or recycled workers don't make real visitors pay for template compilation
+and URL resolver setup.
+"""
+import multiprocessing
+import os
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'farewell_project.settings_production')
+
+wsgi_app = 'farewell_project.wsgi:application'
+bind = os.environ.get('GUNICORN_BIND', '127.0.0.1:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+max_requests = 2000
+max_requests_jitter = 200
+
+
+def post_fork(server, worker):
+    import django
+    django.setup()
+
+    from django.conf import settings
+    if not getattr(settings, 'FAREWELL_WARMUP_ON_FORK', False):
+        return
+
+    from django.db import connections
+    from farewell.warmup import warm_up
+
+    templates, routes, elapsed = warm_up()
+    # Don't hand a connection opened during warm-up to the first request
+    connections.close_all()
+    server.log.info('Worker %s warmed up: %d templates, %d routes in %.0f ms',
+                    worker.pid, templates, len(routes), elapsed)
+
+
+def worker_exit(server, worker):
+    # Don't lose rows still queued for write-behind when a worker stops
+    from farewell import metrics, writebehind
+    writebehind.shutdown()
+    # Keep the counts made since the last periodic write
+    metrics.flush(force=True)